@@ -0,0 +1,228 @@
+"""
+asyncio FIX transport, alternative to the select based rofexclientcustom.Connection.
+
+CLASSES:
+AsyncConnection --------------------------- FIX session over an asyncio stream (TLS by default).
+
+    FIELDS:
+    connected ----------------------------- True while the stream is open.
+    FIX_engine ---------------------------- FIXEngine building and dispatching the messages of this session.
+    host ---------------------------------- Destination host.
+    log ----------------------------------- Logger of handler failures.
+    port ---------------------------------- Destination port.
+    ssl ----------------------------------- SSLContext, True for a default context, False/None for plain TCP.
+
+    METHODS:
+    close() ------------------------------- Log out (optional, waiting up to timeout) and close the stream.
+    connect() ----------------------------- Open the stream and start the reader and writer tasks.
+    expect() ------------------------------ Return future of the next inbound message matching MsgType/predicate.
+    logon() ------------------------------- Send Logon and await the server Logon.
+    place_order() ------------------------- Send NewOrderSingle and await its first ExecutionReport.
+    request() ----------------------------- Send a message and await the matching response.
+    send() -------------------------------- Queue a message for the writer task (ConnectionError if not connected).
+"""
+
+import asyncio
+import logging
+import ssl as ssl_module
+
+import simplefix
+
+from fixengine import FIXEngine
+from fixtemplates import EncodedMessage
+
+
+class AsyncConnection(object):
+    """
+    FIX session driven by an asyncio event loop.
+
+    A reader task feeds every chunk received into a simplefix.FixParser and
+    dispatches complete messages through FIX_engine; a writer task drains the send
+    queue, joining whatever is queued into one write. Nothing polls: one event loop
+    can drive several AsyncConnection objects (one FIXEngine/FIXSession each).
+
+    A handler raising is logged and does not stop the reader task; when the stream
+    ends, every pending expect() future fails with ConnectionError.
+    """
+
+    def __init__(self, host="fix.remarkets.primary.com.ar", port=9876, engine=None, ssl=True, log=None):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.FIX_engine = engine if engine is not None else FIXEngine()
+        self.log = log if log is not None else logging.getLogger('asyncfix')
+        self.FIX_engine.resync_send = self.send
+        self.connected = False
+
+        self._reader = None
+        self._writer = None
+        self._parser = simplefix.FixParser()
+        self._queue = None
+        self._tasks = []
+        self._waiters = []
+
+    async def connect(self):
+        """
+        Open the stream and start the reader and writer tasks.
+        """
+        context = self.ssl
+        if context is True:
+            context = ssl_module.create_default_context()
+
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=context or None)
+        self._queue = asyncio.Queue()
+        self._parser.reset()
+        self.connected = True
+
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._read_loop()), loop.create_task(self._write_loop())]
+
+    async def close(self, logout=True, timeout=5):
+        """
+        Send Logout (if logout) and close the stream. Queued frames are given up to timeout
+        seconds to be written; a writer task that died does not block the close.
+        """
+        if self.connected and logout:
+            self.send(self.FIX_engine.log_out())
+            writer_task = self._tasks[1]
+            drained = asyncio.ensure_future(self._queue.join())
+            await asyncio.wait([drained, writer_task], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            drained.cancel()
+
+        self.connected = False
+        for task in self._tasks:
+            task.cancel()
+
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+        self._fail_waiters(ConnectionError('FIX connection closed'))
+
+    def send(self, msg):
+        """
+        Queue msg (simplefix message or EncodedMessage) for the writer task. Raise
+        ConnectionError if connect() was not called.
+        """
+        if self._queue is None:
+            raise ConnectionError('FIX connection not open: call connect() first')
+
+        frame = msg.encode()
+        self.FIX_engine.record_outbound(frame)
+        self._queue.put_nowait(frame)
+
+    def expect(self, msg_type, predicate=None):
+        """
+        Return future resolved with the next inbound message of msg_type (bytes, e.g. b'8')
+        for which predicate(msg) is true.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((msg_type, predicate, future))
+        return future
+
+    async def request(self, msg, msg_type, predicate=None, timeout=10):
+        """
+        Send msg and return the first inbound message of msg_type matching predicate.
+        """
+        future = self.expect(msg_type, predicate)
+        self.send(msg)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._drop_waiter(future)
+
+    async def logon(self, timeout=10):
+        """
+        Send Logon and return the server Logon (35=A) message.
+        """
+        return await self.request(self.FIX_engine.logon(), b'A', timeout=timeout)
+
+    async def place_order(self, prod, price, qty, side, account, timeout=10):
+        """
+        Send NewOrderSingle and return its first ExecutionReport as an ExecutionReport record.
+        """
+        engine = self.FIX_engine
+        ClOrdID_temp = engine.session.next_cl_ord_id()
+        ClOrdID_bytes = str(ClOrdID_temp).encode('ASCII')
+
+        msg = engine.place_order_msg(prod, price, qty, side, ClOrdID_temp, account)
+        report = await self.request(msg, b'8', lambda m: m.get(11) == ClOrdID_bytes, timeout)
+        return engine.decode_execution_report(report)
+
+    def _drop_waiter(self, future):
+        self._waiters = [waiter for waiter in self._waiters if waiter[2] is not future]
+
+    def _fail_waiters(self, ex):
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.set_exception(ex)
+        self._waiters = []
+
+    def _on_message(self, msg):
+        msg_type = msg.get(35)
+        try:
+            for reply in self.FIX_engine.session_level(msg):
+                if isinstance(reply, EncodedMessage):
+                    # ResendRequest answer: stored frames / gap fills, already sequenced.
+                    self._queue.put_nowait(reply.encode())
+                else:
+                    self.send(reply)
+            self.FIX_engine.dispatch(msg)
+        except Exception as e:
+            self.log.error('AsyncConnection ERROR: Handler failed on %s: %s', msg, e, exc_info=e)
+
+        for waiter in self._waiters:
+            expected, predicate, future = waiter
+            if expected != msg_type or future.done():
+                continue
+            try:
+                matched = predicate is None or predicate(msg)
+            except Exception as e:
+                future.set_exception(e)
+                self._waiters.remove(waiter)
+                break
+            if matched:
+                future.set_result(msg)
+                self._waiters.remove(waiter)
+                break
+
+    async def _read_loop(self):
+        parser = self._parser
+        error = ConnectionError('FIX connection closed by peer')
+        try:
+            while True:
+                data = await self._reader.read(65536)
+                if not data:
+                    break
+
+                parser.append_buffer(data)
+                msg = parser.get_message()
+                while msg is not None:
+                    self._on_message(msg)
+                    msg = parser.get_message()
+        except (ConnectionError, OSError) as e:
+            error = ConnectionError('FIX connection lost: %s' % e)
+        except Exception as e:
+            self.log.error('AsyncConnection ERROR: Reader failed: %s', e, exc_info=e)
+            error = ConnectionError('FIX reader failed: %s' % e)
+        finally:
+            self.connected = False
+            self._fail_waiters(error)
+
+    async def _write_loop(self):
+        queue = self._queue
+        writer = self._writer
+
+        while True:
+            frames = [await queue.get()]
+            while not queue.empty():
+                frames.append(queue.get_nowait())
+
+            writer.write(b''.join(frames))
+            await writer.drain()
+
+            for _ in frames:
+                queue.task_done()
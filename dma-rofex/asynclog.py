@@ -0,0 +1,81 @@
+"""
+Asynchronous logging: callers only enqueue records, a listener thread formats and writes them.
+
+FUNCTIONS:
+default_log_dir() ------------------------- Return log directory ($ROFEX_LOG_DIR or ~/logs).
+setup_logging() --------------------------- Return (logger, QueueListener) writing to a file in log_dir.
+verbosity_level() ------------------------- Return logging level for a verbosity value (0-3).
+
+VERBOSITY_LEVELS -------------------------- Verbosity -> logging level.
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+VERBOSITY_LEVELS = {
+    0: logging.ERROR,
+    1: logging.WARNING,
+    2: logging.INFO,
+    3: logging.DEBUG,
+}
+
+LOG_FORMAT = '%(asctime)s-%(threadName)s-%(levelname)s-%(message)s'
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves the record unformatted: message %-formatting and
+    exception formatting happen on the listener thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def default_log_dir():
+    """
+    Return $ROFEX_LOG_DIR, or a logs directory in the user home (any OS).
+    """
+    return os.environ.get('ROFEX_LOG_DIR') or os.path.join(os.path.expanduser('~'), 'logs')
+
+
+def verbosity_level(verbose):
+    """
+    Return logging level for verbose (int or numeric str, clamped to 0-3).
+    """
+    verbose = min(max(int(verbose), 0), 3)
+    return VERBOSITY_LEVELS[verbose]
+
+
+def setup_logging(name, log_dir=None, verbose=1, file_prefix=None):
+    """
+    Return (logger, listener) for logger name.
+
+    The logger only has a queue handler, so a logging call on a hot thread costs a
+    record creation and a queue put; the QueueListener thread formats the message
+    (lazy %-style arguments, so pass immutable values) and writes the file. Records
+    below the verbosity level are dropped before that. Stop the listener
+    (listener.stop()) to flush on exit.
+    """
+    log_dir = log_dir or default_log_dir()
+    os.makedirs(log_dir, exist_ok=True)
+    filename = os.path.join(log_dir, '%s%s.log' % (file_prefix or name, time.strftime('%Y-%m-%d_%H%M%S')))
+
+    file_handler = logging.FileHandler(filename)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, file_handler)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(verbosity_level(verbose))
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(_DeferredQueueHandler(records))
+
+    listener.start()
+    return logger, listener
@@ -0,0 +1,364 @@
+"""
+Benchmarks of the FIXEngine encode/decode hot paths over the frames in benchmarks/corpus.
+
+Run: python benchmarks/bench_fixengine.py [--calls 20000] [--output results.json]
+                                          [--baseline results.json --tolerance 0.25] [--only name ...]
+
+Every benchmark reports calls, msgs_per_sec and p50_ns/p99_ns per call (timer overhead
+subtracted), written as JSON with sorted keys so runs can be diffed and compared.
+The exit status is 1 when a benchmark is slower than its limit in thresholds.json
+(p50_ns / p99_ns) or, with --baseline, when its p50_ns regressed more than tolerance.
+
+Entries named *_baseline run the implementation each optimized path replaced (copied
+here as it was), on the same inputs; speedup_vs_baseline in the report is their p50_ns
+divided by the p50_ns of the optimized entry (see BASELINES). The corpus is synthetic:
+see make_corpus.py.
+
+FUNCTIONS:
+benchmarks() ------------------------------ Return name -> (function, inputs) of every benchmark.
+check() ----------------------------------- Return list of threshold/baseline violations.
+load_corpus() ----------------------------- Return corpus name -> list of raw frames.
+main() ------------------------------------ Run, print/write JSON, exit 1 on regressions.
+measure() --------------------------------- Time function over inputs, return result dict.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import simplefix
+
+from fixengine import FIXEngine
+from fixreader import FrameAssembler
+from fixsession import FIXSession
+from fixtokenizer import FIXFrame
+
+CORPUS_DIR = os.path.join(BENCH_DIR, 'corpus')
+THRESHOLDS = os.path.join(BENCH_DIR, 'thresholds.json')
+
+# Optimized benchmark -> benchmark of the implementation it replaced.
+BASELINES = {
+    'header_msg': 'header_msg_baseline',
+    'place_order_msg': 'place_order_msg_baseline',
+    'place_order_msg_templates': 'place_order_msg_baseline',
+    'change_order_msg': 'change_order_msg_baseline',
+    'change_order_msg_templates': 'change_order_msg_baseline',
+    'tokenize': 'tokenize_baseline',
+    'extract_msg_type': 'extract_msg_type_baseline',
+    'extract_market_changes': 'extract_market_changes_baseline',
+    'decode_execution_report': 'decode_execution_report_baseline',
+}
+
+
+def load_corpus():
+    """
+    Return dict corpus name -> list of raw frames (bytes).
+    """
+    corpus = {}
+    for file_name in sorted(os.listdir(CORPUS_DIR)):
+        if file_name.endswith('.fix'):
+            with open(os.path.join(CORPUS_DIR, file_name), 'rb') as f:
+                corpus[file_name[:-4]] = FrameAssembler().feed(f.read())
+    return corpus
+
+
+def _parse(frames):
+    parser = simplefix.FixParser()
+    msgs = []
+    for frame in frames:
+        parser.append_buffer(frame)
+        msgs.append(parser.get_message())
+    return msgs
+
+
+def _baseline_header_msg(tag, seq_num=[0]):
+    # header_msg before FIXSession / the SendingTime clock: strftime on every message.
+    msg = simplefix.FixMessage()
+    seq_num[0] += 1
+    sendingTime = datetime.now().strftime('%Y%m%d-%H:%M:%S.%f')[:-3]
+
+    msg.append_pair(8, 'FIXT.1.1')
+    msg.append_pair(35, tag)
+    msg.append_pair(34, seq_num[0])
+    msg.append_pair(49, 'fedejbrun5018')
+    msg.append_pair(52, sendingTime)
+    msg.append_pair(56, 'ROFX')
+    msg.append_pair(115, 'fedejbrun5018')
+    msg.append_pair(128, 'ROFX')
+    return msg
+
+
+def _baseline_place_order(order):
+    msg = _baseline_header_msg('D')
+    msg.append_pair(1, 'REM5018')
+    msg.append_pair(11, 1000)
+    msg.append_pair(38, order[2])
+    msg.append_pair(40, 2)
+    msg.append_pair(44, order[1])
+    msg.append_pair(54, order[3])
+    msg.append_pair(55, order[0])
+    msg.append_pair(60, msg.get(52))
+    return msg.encode()
+
+
+def _baseline_change_order(order):
+    msg = _baseline_header_msg('G')
+    msg.append_pair(1, 'REM5018')
+    msg.append_pair(11, 1000)
+    msg.append_pair(38, order[2])
+    msg.append_pair(40, 2)
+    msg.append_pair(41, 999)
+    msg.append_pair(44, order[1])
+    msg.append_pair(54, order[3])
+    msg.append_pair(55, order[0])
+    msg.append_pair(60, msg.get(52))
+    msg.append_pair(453, 1)
+    msg.append_pair(448, 'fedejbrun5018')
+    msg.append_pair(447, 'D')
+    msg.append_pair(452, 11)
+    return msg.encode()
+
+
+def _baseline_tokenize():
+    # Every inbound frame went through a simplefix.FixParser.
+    parser = simplefix.FixParser()
+
+    def parse(frame):
+        parser.append_buffer(frame)
+        return parser.get_message()
+
+    return parse
+
+
+def _baseline_msg_type(msg):
+    # extract_msg_type before the MSG_TYPES table: one msg.get(35) per comparison.
+    if msg.get(35) == b'AD':
+        return 'TradeCaptureReportRequest'
+    elif msg.get(35) == b'y':
+        return 'SecurtityList'
+    elif msg.get(35) == b'9':
+        return 'ERROR_order'
+    elif msg.get(35) == b'3':
+        return 'ERROR_msj'
+    elif msg.get(35) == b'0':
+        return 'Heartbeat'
+    elif msg.get(35) == b'W':
+        return 'MarketDataSnapshotFullRefresh'
+    text = msg.get(58)
+    return 'ExecutionReport' if text is not None and b'Operada' in text else ''
+
+
+def _baseline_execution_report(msg):
+    # The extract_* calls a handler made per ExecutionReport, one msg.get() each.
+    cl_ord_id = msg.get(11).decode('cp1252')
+    return (msg.get(37).decode('cp1252'), int(cl_ord_id) if cl_ord_id.isdigit() else cl_ord_id,
+            msg.get(150).decode('cp1252'), msg.get(39).decode('cp1252'), msg.get(55).decode('cp1252'),
+            int(float(msg.get(38))), float(msg.get(44)), int(float(msg.get(32))), float(msg.get(31)),
+            int(float(msg.get(14))), int(float(msg.get(151))), float(msg.get(6)))
+
+
+def _baseline_market_changes(msg):
+    # extract_market_changes before the FIXFrame tokenizer, kept as the reference to beat.
+    mqt_data_list = msg.encode().decode("cp1252").split('\x01269=')
+    bid_book = []
+    ask_book = []
+
+    for msg_parse in mqt_data_list[1:]:
+        if msg_parse[0] in '01':
+            data = re.match(r'.*\x01270=(.+?)\x01271=(.+?)\x01.*', msg_parse)
+            if data:
+                (bid_book if msg_parse[0] == '0' else ask_book).append(data.group(1, 2))
+
+    bid_book.sort(key=lambda tup: float(tup[0]), reverse=True)
+    ask_book.sort(key=lambda tup: float(tup[0]))
+    return bid_book[:5], ask_book[:5]
+
+
+def _session():
+    return FIXSession(user='fedejbrun5018', party_id='fedejbrun5018', account='REM5018', xchange_name='ROFX',
+                      sender_comp_id='fedejbrun5018')
+
+
+def benchmarks(corpus):
+    """
+    Return dict name -> (function of one argument, list of inputs).
+    """
+    engine = FIXEngine(session=_session())
+    template_engine = FIXEngine(True, _session())
+
+    books = _parse(corpus['book_small'] + corpus['book_deep'])
+    # What the reader thread hands out: frames already tokenized once.
+    book_frames = [FIXFrame(frame) for frame in corpus['book_small'] + corpus['book_deep']]
+    fills = _parse(corpus['exec_fill'])
+    reports = _parse(corpus['exec_new'] + corpus['exec_fill'] + corpus['exec_reject'])
+    every_msg = _parse([frame for name in sorted(corpus) for frame in corpus[name]])
+    raw_frames = [frame for name in sorted(corpus) for frame in corpus[name]]
+    orders = [('DODic20', 81.5 + 0.5 * (n % 10), 1 + n % 50, 1 + n % 2) for n in range(100)]
+
+    def place_order(engine):
+        return lambda order: engine.place_order_msg(order[0], order[1], order[2], order[3], 1000, 'REM5018').encode()
+
+    def change_order(engine):
+        return lambda order: engine.change_order_msg(order[0], order[1], order[2], order[3], 999, 1000,
+                                                     'REM5018').encode()
+
+    return {
+        'header_msg': (lambda tag: engine.header_msg(tag), ['D', 'F', 'G', 'V', 'H']),
+        'header_msg_baseline': (_baseline_header_msg, ['D', 'F', 'G', 'V', 'H']),
+        'place_order_msg_baseline': (_baseline_place_order, orders),
+        'change_order_msg_baseline': (_baseline_change_order, orders),
+        'tokenize_baseline': (_baseline_tokenize(), raw_frames),
+        'extract_msg_type_baseline': (_baseline_msg_type, every_msg),
+        'decode_execution_report_baseline': (_baseline_execution_report, reports),
+        'place_order_msg': (place_order(engine), orders),
+        'place_order_msg_templates': (place_order(template_engine), orders),
+        'change_order_msg': (change_order(engine), orders),
+        'change_order_msg_templates': (change_order(template_engine), orders),
+        'tokenize': (FIXFrame, raw_frames),
+        'extract_msg_type': (engine.extract_msg_type, every_msg),
+        'extract_market_changes': (engine.extract_market_changes, books),
+        'extract_market_changes_frame': (engine.extract_market_changes, book_frames),
+        'extract_market_changes_baseline': (_baseline_market_changes, books),
+        'extract_OrderID': (engine.extract_OrderID, reports),
+        'extract_ClOrdID': (engine.extract_ClOrdID, reports),
+        'extract_CumQty': (engine.extract_CumQty, reports),
+        'extract_avgPx': (engine.extract_avgPx, reports),
+        'extract_leavesQty': (engine.extract_leavesQty, reports),
+        'extract_qty_fill': (engine.extract_qty_fill, fills),
+        'extract_price_fill': (engine.extract_price_fill, fills),
+        'decode_execution_report': (engine.decode_execution_report, reports),
+    }
+
+
+def _timer_overhead(samples=20000):
+    clock = time.perf_counter_ns
+    deltas = []
+    for _ in range(samples):
+        start = clock()
+        deltas.append(clock() - start)
+    deltas.sort()
+    return deltas[len(deltas) // 2]
+
+
+def measure(function, inputs, calls=20000, warmup=1000, overhead=0):
+    """
+    Call function(input) calls times, cycling through inputs. Return dict with calls,
+    msgs_per_sec, p50_ns and p99_ns.
+    """
+    clock = time.perf_counter_ns
+    n_inputs = len(inputs)
+
+    for i in range(warmup):
+        function(inputs[i % n_inputs])
+
+    samples = [0] * calls
+    gc.disable()
+    try:
+        started = clock()
+        for i in range(calls):
+            arg = inputs[i % n_inputs]
+            start = clock()
+            function(arg)
+            samples[i] = clock() - start
+        elapsed = clock() - started
+    finally:
+        gc.enable()
+
+    samples.sort()
+    return {
+        'calls': calls,
+        'msgs_per_sec': round(calls / (elapsed / 1e9)),
+        'p50_ns': max(0, samples[calls // 2] - overhead),
+        'p99_ns': max(0, samples[min(calls - 1, calls * 99 // 100)] - overhead),
+    }
+
+
+def check(results, thresholds=None, baseline=None, tolerance=0.25):
+    """
+    Return list of messages for benchmarks over their threshold, or whose p50_ns regressed
+    more than tolerance against baseline results.
+    """
+    violations = []
+
+    for name, limits in sorted((thresholds or {}).items()):
+        result = results.get(name)
+        if result is None:
+            continue
+        for key, limit in sorted(limits.items()):
+            if result[key] > limit:
+                violations.append('%s: %s %d > threshold %d' % (name, key, result[key], limit))
+
+    for name, previous in sorted((baseline or {}).items()):
+        result = results.get(name)
+        if result is None or not previous.get('p50_ns'):
+            continue
+        if result['p50_ns'] > previous['p50_ns'] * (1 + tolerance):
+            violations.append('%s: p50_ns %d > baseline %d + %d%%' % (name, result['p50_ns'], previous['p50_ns'],
+                                                                     tolerance * 100))
+
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FIXEngine hot path benchmarks.')
+    parser.add_argument('--calls', type=int, default=20000, help='Timed calls per benchmark')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare p50_ns against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p50_ns regression vs baseline')
+    parser.add_argument('--thresholds', default=THRESHOLDS, help='JSON of per benchmark p50_ns/p99_ns limits')
+    parser.add_argument('--only', nargs='*', help='Run only these benchmarks')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    overhead = _timer_overhead()
+    results = {}
+
+    for name, (function, inputs) in benchmarks(corpus).items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = measure(function, inputs, args.calls, overhead=overhead)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timer_overhead_ns': overhead,
+        'corpus': {name: len(frames) for name, frames in corpus.items()},
+        'results': results,
+        'speedup_vs_baseline': {name: round(results[baseline]['p50_ns'] / results[name]['p50_ns'], 2)
+                                for name, baseline in BASELINES.items()
+                                if name in results and baseline in results and results[name]['p50_ns']},
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+    thresholds = None
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    violations = check(results, thresholds, baseline, args.tolerance)
+    for violation in violations:
+        print('REGRESSION ' + violation, file=sys.stderr)
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
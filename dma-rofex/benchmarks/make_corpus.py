@@ -0,0 +1,95 @@
+"""
+Regenerate the frame corpus used by bench_fixengine.py.
+
+The corpus is synthetic: every frame is built with simulator.encode_frame, following
+what the ROFEX DMA gateway sends (field order, tags and value formats), with fixed
+SendingTime/prices so it is byte for byte reproducible. No frame was captured from the
+gateway, so timings on real traffic (other symbols, depths, field mixes) may differ.
+
+Run: python benchmarks/make_corpus.py
+
+FUNCTIONS:
+corpus() ---------------------------------- Return name -> list of frames.
+main() ------------------------------------ Write every corpus file to benchmarks/corpus.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulator import encode_frame, load_instruments
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+SENDER = b'ROFX'
+TARGET = b'fedejbrun5018'
+SENDING_TIME = b'20201016-15:04:05.123'
+SYMBOL = 'DODic20'
+
+
+def _frame(msg_type, seq_num, fields):
+    return encode_frame(msg_type, seq_num, SENDER, TARGET, SENDING_TIME, fields)
+
+
+def _book(seq_num, depth):
+    fields = [(262, 7), (55, SYMBOL), (83, 1000 + seq_num), (268, 2 * depth)]
+    for level in range(depth):
+        fields += [(269, 0), (270, '%.1f' % (81.5 - 0.5 * level)), (271, 100 + 10 * level), (290, level + 1)]
+    for level in range(depth):
+        fields += [(269, 1), (270, '%.1f' % (82.0 + 0.5 * level)), (271, 150 + 5 * level), (290, level + 1)]
+    return _frame(b'W', seq_num, fields)
+
+
+def _incremental(seq_num):
+    return _frame(b'X', seq_num, [(262, 7), (55, SYMBOL), (83, 1000 + seq_num), (268, 2),
+                                  (279, 1), (269, 0), (270, '81.5'), (271, 120 + seq_num % 7),
+                                  (279, 0), (269, 1), (270, '82.5'), (271, 30)])
+
+
+def _execution(seq_num, exec_type, ord_status, last_qty=0, cum_qty=0, leaves_qty=10, text=None):
+    fields = [(37, 3000 + seq_num), (11, 200 + seq_num), (17, 'ROFX-%d' % seq_num), (150, exec_type),
+              (39, ord_status), (1, 'REM5018'), (55, SYMBOL), (54, 1), (38, 10), (44, '82.0'),
+              (32, last_qty), (31, '82.0' if last_qty else '0'), (14, cum_qty), (151, leaves_qty),
+              (6, '82.0' if cum_qty else '0'), (60, SENDING_TIME), (453, 1), (448, 'fedejbrun5018'),
+              (447, 'D'), (452, 11)]
+    if text is not None:
+        fields.append((58, text))
+    return _frame(b'8', seq_num, fields)
+
+
+def _security_list(seq_num, instruments):
+    fields = [(320, '01'), (322, seq_num), (560, 0), (393, len(instruments)), (893, 'Y'), (146, len(instruments))]
+    for symbol, cfi_code, tick_size in instruments:
+        fields += [(55, symbol), (461, cfi_code), (969, tick_size), (562, 1), (1300, 'DDF')]
+    return _frame(b'y', seq_num, fields)
+
+
+def corpus():
+    """
+    Return dict corpus name -> list of frames.
+    """
+    instruments = load_instruments()
+    return {
+        'book_small': [_book(n, 1) for n in range(1, 51)],
+        'book_deep': [_book(n, 10) for n in range(1, 51)],
+        'incremental': [_incremental(n) for n in range(1, 101)],
+        'exec_new': [_execution(n, '0', '0') for n in range(1, 51)],
+        'exec_fill': ([_execution(n, 'F', '1', 4, 4, 6) for n in range(1, 26)] +
+                      [_execution(n, 'F', '2', 6, 10, 0) for n in range(26, 51)]),
+        'exec_reject': [_execution(n, '8', '8', leaves_qty=0, text='Insufficient margin') for n in range(1, 51)],
+        'security_list': [_security_list(n, instruments[i:i + 100])
+                          for n, i in enumerate(range(0, len(instruments), 100), 1)],
+    }
+
+
+def main():
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    for name, frames in sorted(corpus().items()):
+        with open(os.path.join(CORPUS_DIR, name + '.fix'), 'wb') as f:
+            f.write(b''.join(frames))
+        print('%-14s %4d frames' % (name, len(frames)))
+
+
+if __name__ == '__main__':
+    main()
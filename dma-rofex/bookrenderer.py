@@ -0,0 +1,156 @@
+"""
+Terminal book display redrawn at a fixed frame rate, off the market data thread.
+
+CLASSES:
+BookRenderer ------------------------------ Redraws dirty DepthBooks in fixed screen regions (ANSI cursor moves).
+
+    FIELDS:
+    depth --------------------------------- Levels drawn per book.
+    fps ----------------------------------- Frames per second.
+    frames -------------------------------- Frames drawn.
+    log ----------------------------------- Logger receiving the full text of every message (None = not logged).
+    marks --------------------------------- mark_dirty() calls (ticks seen).
+    redraws ------------------------------- Book regions redrawn (<= fps per book and second).
+
+    METHODS:
+    mark_dirty() -------------------------- Flag a book for the next frame (handler side, no lock, no I/O).
+    message() ----------------------------- Add a line to the message area below the books (full text to log).
+    start() ------------------------------- Clear the screen and start the render thread.
+    stop() -------------------------------- Stop the render thread and move the cursor below the display.
+"""
+
+import shutil
+import sys
+import threading
+from collections import deque
+
+CSI = '\033['
+HEADER_STYLE = CSI + '0;30;47m'
+RESET_STYLE = CSI + '0m'
+
+
+class BookRenderer(object):
+    """
+    Every book gets a fixed region (header, column titles, depth levels, top line) in
+    the order it is first marked, with a message area below the last one.
+
+    Handlers only call mark_dirty(); every 1 / fps seconds the render thread copies
+    each dirty book (DepthBook.copy(), under the book lock so never half an update)
+    and redraws its region in place (cursor positioning, no scrolling), writing the
+    whole frame with a single write. Output is bounded by fps
+    and the number of books, whatever the tick rate.
+    """
+
+    def __init__(self, fps=10, depth=5, messages=8, out=None, log=None):
+        self.fps = fps
+        self.depth = depth
+        self.out = out or sys.stdout
+        self.log = log
+        self.frames = 0
+        self.marks = 0
+        self.redraws = 0
+
+        self._region_height = depth + 4
+        self._books = {}
+        self._rows = {}
+        self._dirty = {}
+        self._messages = deque(maxlen=messages)
+        self._messages_dirty = False
+        self._width = shutil.get_terminal_size().columns
+        self._stop = threading.Event()
+        self._thread = None
+
+    def mark_dirty(self, book):
+        symbol = book.symbol
+        if symbol not in self._books:
+            self._books[symbol] = book
+        self._dirty[symbol] = True
+        self.marks += 1
+
+    def message(self, text):
+        """
+        Add text (first line, truncated to the terminal width) to the message area; the
+        full text goes to log.
+        """
+        text = str(text)
+        if self.log is not None:
+            self.log.info(text)
+        self._messages.append(text.split('\n', 1)[0][:self._width])
+        self._messages_dirty = True
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self.out.write(CSI + '2J' + CSI + '?25l')
+        self.out.flush()
+        self._thread = threading.Thread(target=self._run, name='BookRenderer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._render()
+        self.out.write(CSI + '%d;1H' % (self._messages_row() + self._messages.maxlen) + CSI + '?25h\n')
+        self.out.flush()
+
+    def _run(self):
+        interval = 1.0 / self.fps
+        while not self._stop.wait(interval):
+            self._render()
+
+    def _messages_row(self):
+        return 1 + len(self._rows) * self._region_height
+
+    def _render(self):
+        dirty = self._dirty
+        symbols = list(dirty)
+        if not symbols and not self._messages_dirty:
+            return
+
+        parts = []
+        messages_row = self._messages_row()
+        for symbol in symbols:
+            # Popped before the copy: a tick arriving meanwhile marks it again for the next frame.
+            dirty.pop(symbol, None)
+            book = self._books[symbol]
+            row = self._rows.get(symbol)
+            if row is None:
+                row = self._rows[symbol] = self._messages_row()
+            self._draw_book(parts, row, book)
+            self.redraws += 1
+
+        if self._messages_dirty or messages_row != self._messages_row():
+            self._messages_dirty = False
+            self._draw_messages(parts)
+
+        self.out.write(''.join(parts))
+        self.out.flush()
+        self.frames += 1
+
+    def _line(self, parts, row, text):
+        parts.append(CSI + '%d;1H' % row + text[:self._width] + CSI + 'K')
+
+    def _draw_book(self, parts, row, book):
+        levels, bid_levels, ask_levels, last_price, last_size = book.copy(self.depth)
+        bid_levels = min(bid_levels, self.depth)
+        ask_levels = min(ask_levels, self.depth)
+
+        title = ('%s - MarketData' % book.symbol).ljust(self._width)[:self._width]
+        parts.append(CSI + '%d;1H' % row + HEADER_STYLE + title + RESET_STYLE)
+        self._line(parts, row + 1, '%10s %12s | %-12s %10s' % ('BS', 'BP', 'OP', 'OS'))
+        for i in range(self.depth):
+            bid = '%10g %12g' % (levels[i, 0], levels[i, 1]) if i < bid_levels else ' ' * 23
+            ask = '%-12g %10g' % (levels[i, 2], levels[i, 3]) if i < ask_levels else ''
+            self._line(parts, row + 2 + i, bid + ' | ' + ask)
+        self._line(parts, row + 2 + self.depth, 'Last: %g x %g' % (last_price, last_size))
+        self._line(parts, row + 3 + self.depth, '')
+
+    def _draw_messages(self, parts):
+        row = self._messages_row()
+        messages = list(self._messages)
+        for i in range(self._messages.maxlen):
+            self._line(parts, row + i, messages[i] if i < len(messages) else '')
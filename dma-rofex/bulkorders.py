@@ -0,0 +1,243 @@
+"""
+Bulk order operations: concurrent REST cancel / replace, and mass cancel (FIX when available).
+
+CLASSES:
+BulkOrders -------------------------------- Bulk cancel/replace and cancel_all on a bounded pool, one HTTP session.
+
+    FIELDS:
+    cancel_timeout ------------------------ Seconds a replace waits for its cancel to be confirmed.
+    fix ----------------------------------- FIX Connection used for mass cancels (None = REST only).
+    orders -------------------------------- OrderManager with the session orders.
+    session ------------------------------- requests.Session shared by every worker (pooled keep-alive connections).
+    workers ------------------------------- Maximum concurrent requests.
+
+    METHODS:
+    cancel_all() -------------------------- Cancel every live order, of one symbol or one segment.
+    cancel_many() ------------------------- Cancel orders concurrently.
+    close() ------------------------------- Stop the pool and close the HTTP session.
+    replace_many() ------------------------ Replace orders (price / size) concurrently.
+
+BulkResult -------------------------------- Aggregated outcome of a bulk operation.
+
+    FIELDS:
+    elapsed ------------------------------- Seconds taken.
+    errors -------------------------------- Key -> exception of the failed requests.
+    ok ------------------------------------ True if nothing failed.
+    requests ------------------------------ Requests issued (HTTP calls or FIX messages).
+    results ------------------------------- Key -> API response of the successful requests.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import pyRofex
+import requests
+from pyRofex.components import globals as rofex_globals
+from pyRofex.components import urls
+from pyRofex.components.exceptions import ApiException
+from requests.adapters import HTTPAdapter
+
+from ordermanager import CANCELLED, PENDING_CANCEL
+
+
+class BulkResult(object):
+    """
+    Responses and errors of a bulk operation, keyed by ClOrdID.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.requests = 0
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def __repr__(self):
+        return 'BulkResult(requests=%d, ok=%d, errors=%d, elapsed=%.3fs)' % (self.requests, len(self.results),
+                                                                              len(self.errors), self.elapsed)
+
+
+class BulkOrders(object):
+    """
+    Every request of a bulk operation is submitted at once to a pool of at most
+    workers threads sharing one requests.Session: connections are kept alive and
+    reused instead of a new TLS handshake per call (pyRofex uses requests.get), so N
+    cancels take about N / workers round-trips. With a logged on FIX connection
+    cancel_all() is a single OrderMassCancelRequest (q) instead.
+
+    REST has no replace: replace_many() cancels each order, waits until the order
+    report stream confirms it CANCELLED and only then sends the new order, with the
+    quantity still unfilled by default (the orders in parallel). A replace whose
+    cancel is rejected, whose order fills, or that is not confirmed within
+    cancel_timeout is aborted. Order states keep coming from the order report stream;
+    cancels only mark the orders PENDING_CANCEL.
+    """
+
+    def __init__(self, orders, workers=8, fix=None, environment=None, cancel_timeout=5.0):
+        self.orders = orders
+        self.workers = workers
+        self.fix = fix
+        self.cancel_timeout = cancel_timeout
+        self.environment = environment or rofex_globals.default_environment
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='BulkOrders')
+        self._segments = None
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self.session.close()
+
+    @property
+    def _config(self):
+        return rofex_globals.environment_config[self.environment]
+
+    def _request(self, path, retry=True):
+        config = self._config
+        response = self.session.get(config['url'] + path, headers={'X-Auth-Token': config['token']},
+                                    verify=config['ssl'], proxies=config['proxies'])
+        if response.status_code == 401:
+            if not retry:
+                raise ApiException('Authentication Fails.')
+            config['rest_client'].update_token()
+            return self._request(path, False)
+
+        content = response.json()
+        if content.get('status') == 'ERROR':
+            raise ApiException(content.get('description') or content.get('message') or 'Request failed.')
+        return content
+
+    def _cancel(self, order):
+        proprietary = order.proprietary or self._config['proprietary']
+        response = self._request(urls.cancel_order.format(id=order.cl_ord_id, p=proprietary))
+        self.orders.cancel_sent(order.cl_ord_id, (response.get('order') or {}).get('clientId'))
+        return response
+
+    def _new_order(self, symbol, side, price, size):
+        path = (urls.new_order + urls.limit_order).format(market=pyRofex.Market.ROFEX.value, ticker=symbol, size=size,
+                                                          type=pyRofex.OrderType.LIMIT.value, side=side.lower(),
+                                                          time_force=pyRofex.TimeInForce.DAY.value,
+                                                          account=self._config['account'], price=price,
+                                                          cancel_previous=False)
+        response = self._request(path)
+        order = response['order']
+        self.orders.sent(order['clientId'], symbol, side.upper(), price, size, order.get('proprietary'))
+        return response
+
+    def _replace(self, order, price, size):
+        leaves_qty, cum_qty = order.leaves_qty, order.cum_qty
+        self._cancel(order)
+        if not self.orders.wait(order, lambda o: o.state != PENDING_CANCEL or o.cancel_rejected, self.cancel_timeout):
+            raise ApiException('Replace of %s aborted: cancel not confirmed.' % order.cl_ord_id)
+        if order.state != CANCELLED:
+            raise ApiException('Replace of %s aborted: order %s.' % (order.cl_ord_id, order.state))
+
+        if size is None:
+            # Fills reported between the cancel request and its confirmation.
+            size = leaves_qty - (order.cum_qty - cum_qty)
+        return self._new_order(order.symbol, order.side, order.price if price is None else price, size)
+
+    def _run(self, function, jobs, requests_per_job=1):
+        """
+        Run function(order, *args) on the pool for every (order or ClOrdID, args) of jobs.
+        Return BulkResult keyed by ClOrdID; unknown ClOrdIDs are reported as KeyError.
+        """
+        result = BulkResult()
+        started = time.perf_counter()
+
+        futures = {}
+        for order, args in jobs:
+            if isinstance(order, str):
+                cl_ord_id, order = order, self.orders.get(order)
+                if order is None:
+                    result.errors[cl_ord_id] = KeyError('Unknown ClOrdID %s' % cl_ord_id)
+                    continue
+            futures[order.cl_ord_id] = self._pool.submit(function, order, *args)
+
+        for cl_ord_id, future in futures.items():
+            try:
+                result.results[cl_ord_id] = future.result()
+            except Exception as e:
+                result.errors[cl_ord_id] = e
+        result.requests = len(futures) * requests_per_job
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def cancel_many(self, orders):
+        """
+        Cancel orders (ManagedOrders or ClOrdIDs) concurrently. Return BulkResult keyed by ClOrdID.
+        """
+        return self._run(self._cancel, [(order, ()) for order in orders])
+
+    def replace_many(self, replacements):
+        """
+        Replace orders given as (order or ClOrdID, price, size) tuples (None keeps the current value).
+        Return BulkResult keyed by the ClOrdID of the replaced order, with the new order responses.
+        """
+        return self._run(self._replace, [(order, (price, size)) for order, price, size in replacements],
+                         requests_per_job=2)
+
+    def cancel_all(self, symbol=None, segment=None, session_only=False):
+        """
+        Cancel every live order (of symbol, or of market segment e.g. 'DDF'). One OrderMassCancelRequest
+        through the FIX connection when it is logged on (segment 'DDF' by default, MarketSegmentID is
+        required; confirmed through its reader thread), concurrent REST cancels otherwise. With
+        session_only, only the orders sent by this session are cancelled, always through REST (a mass
+        cancel reaches every order of the account).
+        """
+        fix = self.fix
+        if fix is not None and fix.connected and not session_only:
+            return self._mass_cancel(fix, symbol, segment or 'DDF')
+
+        orders = self.orders.active(symbol, session_only)
+        if segment is not None:
+            segments = self._symbol_segments()
+            orders = [order for order in orders if segments.get(order.symbol) == segment]
+        return self.cancel_many(orders)
+
+    def _mass_cancel(self, fix, symbol, segment):
+        """
+        Send an OrderMassCancelRequest and wait (cancel_timeout) for its OrderMassCancelReport (r).
+        Return BulkResult keyed by its ClOrdID: the report, or an error when the request could not
+        be sent, no report came back or the gateway rejected it (MassCancelResponse (531) = 0).
+        """
+        result = BulkResult()
+        started = time.perf_counter()
+        msg, cl_ord_id = fix.FIX_engine.order_mass_cancel_request_msg(symbol, segment)
+        cl_ord_id_bytes = str(cl_ord_id).encode()
+        pending = fix.expect(b'r', lambda report: report.get(11) == cl_ord_id_bytes)
+
+        result.requests = 1
+        if not fix.send(msg, flush=True):
+            pending.cancel()
+            result.errors[cl_ord_id] = ConnectionError('OrderMassCancelRequest not sent: FIX connection down.')
+        else:
+            try:
+                report = pending.result(self.cancel_timeout)
+            except FutureTimeoutError:
+                pending.cancel()
+                result.errors[cl_ord_id] = ApiException('No OrderMassCancelReport within %ss.' % self.cancel_timeout)
+            except Exception as e:
+                result.errors[cl_ord_id] = e
+            else:
+                if report.get(531) == b'0':
+                    reason = report.get(532)
+                    result.errors[cl_ord_id] = ApiException('Mass cancel rejected (MassCancelRejectReason %s).'
+                                                            % (reason.decode('cp1252') if reason else '?'))
+                else:
+                    result.results[cl_ord_id] = report
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def _symbol_segments(self):
+        if self._segments is None:
+            instruments = self._request(urls.detailed_instruments).get('instruments') or []
+            self._segments = {instrument['instrumentId']['symbol']: instrument['segment']['marketSegmentId']
+                              for instrument in instruments}
+        return self._segments
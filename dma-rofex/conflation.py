@@ -0,0 +1,139 @@
+"""
+Dispatch of websocket callbacks to a worker pool, off the websocket thread.
+
+CLASSES:
+ConflatingDispatcher ---------------------- Conflated market data per symbol, FIFO order reports, symbol-affine workers.
+
+    FIELDS:
+    conflated ----------------------------- Market data messages replaced by a newer one before being handled.
+    conflated_by_symbol ------------------- Symbol -> conflated messages.
+    delivered ----------------------------- Market data messages handled.
+    errors -------------------------------- Handler exceptions.
+    order_reports ------------------------- Order reports handled.
+    workers ------------------------------- Worker threads.
+
+    METHODS:
+    stats() ------------------------------- Return dict of dispatch / conflation metrics.
+    stop() -------------------------------- Let the workers finish queued work and stop them.
+    submit_market_data() ------------------ Store the latest message of a symbol (websocket thread).
+    submit_order_report() ----------------- Queue an order report, never conflated (websocket thread).
+
+FUNCTIONS:
+message_symbol() -------------------------- Return symbol of a MarketData or OrderReport message, None if absent.
+"""
+
+import queue
+import threading
+import zlib
+from collections import Counter
+
+_MARKET_DATA = 0
+_ORDER_REPORT = 1
+_STOP = 2
+
+
+def message_symbol(message):
+    """
+    Return instrumentId symbol of a pyRofex MarketData or OrderReport message, None if absent.
+    """
+    instrument = message.get('instrumentId')
+    if instrument is None:
+        instrument = (message.get('orderReport') or {}).get('instrumentId') or {}
+    return instrument.get('symbol')
+
+
+class ConflatingDispatcher(object):
+    """
+    The websocket thread only stores or queues: a slow handler delays its own
+    symbol, not the socket nor the other instruments.
+
+    Each symbol is served by one worker (crc32(symbol) % workers), so everything of
+    a symbol is handled in arrival order and never concurrently. Market data keeps
+    one slot per symbol: a message arriving while the previous one is still waiting
+    replaces it (counted in conflated), so the handler always sees the latest book
+    and the backlog is at most one message per symbol. Order reports are queued
+    FIFO on the same worker and every one of them is handled.
+    """
+
+    def __init__(self, market_data_handler, order_report_handler, workers=4, on_error=None):
+        self.market_data_handler = market_data_handler
+        self.order_report_handler = order_report_handler
+        self.on_error = on_error
+
+        self.conflated = 0
+        self.delivered = 0
+        self.order_reports = 0
+        self.errors = 0
+        self.conflated_by_symbol = Counter()
+
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._queues = [queue.SimpleQueue() for _ in range(workers)]
+        self.workers = [threading.Thread(target=self._run, args=(q,), name='Dispatch-%d' % n, daemon=True)
+                        for n, q in enumerate(self._queues)]
+        for worker in self.workers:
+            worker.start()
+
+    def _queue(self, symbol):
+        return self._queues[zlib.crc32(symbol.encode('utf-8')) % len(self._queues)]
+
+    def submit_market_data(self, message):
+        symbol = message_symbol(message)
+        if symbol is None:
+            return
+
+        with self._lock:
+            waiting = symbol in self._slots
+            self._slots[symbol] = message
+            if waiting:
+                self.conflated += 1
+                self.conflated_by_symbol[symbol] += 1
+                return
+
+        self._queue(symbol).put((_MARKET_DATA, symbol))
+
+    def submit_order_report(self, message):
+        symbol = message_symbol(message) or ''
+        self._queue(symbol).put((_ORDER_REPORT, message))
+
+    def stop(self):
+        for q in self._queues:
+            q.put((_STOP, None))
+        for worker in self.workers:
+            worker.join()
+
+    def stats(self):
+        return {
+            'workers': len(self.workers),
+            'delivered': self.delivered,
+            'conflated': self.conflated,
+            'conflated_by_symbol': dict(self.conflated_by_symbol),
+            'order_reports': self.order_reports,
+            'errors': self.errors,
+            'queued': [q.qsize() for q in self._queues],
+        }
+
+    def _run(self, work):
+        while True:
+            kind, item = work.get()
+            if kind == _STOP:
+                return
+
+            if kind == _MARKET_DATA:
+                with self._lock:
+                    message = self._slots.pop(item)
+                    self.delivered += 1
+                handler = self.market_data_handler
+            else:
+                message = item
+                handler = self.order_report_handler
+                with self._lock:
+                    self.order_reports += 1
+
+            try:
+                handler(message)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                if self.on_error is not None:
+                    self.on_error(e, message)
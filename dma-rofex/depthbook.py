@@ -0,0 +1,173 @@
+"""
+Fixed depth order books backed by preallocated arrays, for the websocket MarketData handlers.
+
+CLASSES:
+DepthBook --------------------------------- Top depth bid/offer levels of one instrument.
+
+    FIELDS:
+    bid_levels / ask_levels --------------- Levels currently filled on each side.
+    depth --------------------------------- Levels kept per side.
+    last_price / last_size ---------------- Last trade (LA), 0 if none.
+    levels -------------------------------- depth x 4 float array, columns BS, BP, OP, OS, best level first.
+    lock ---------------------------------- RLock held by update() / clear() (hold it to read several fields).
+    symbol -------------------------------- Ticker symbol.
+    timestamp ----------------------------- Timestamp of the last payload applied, None if not given.
+    updates ------------------------------- MarketData payloads applied.
+
+    METHODS:
+    best_bid() ---------------------------- Return (price, size) of the best bid, (0, 0) if empty.
+    best_offer() -------------------------- Return (price, size) of the best offer, (0, 0) if empty.
+    clear() ------------------------------- Zero every level.
+    copy() -------------------------------- Return consistent copy of levels, level counts and last trade.
+    crossed() ----------------------------- Return True if best bid >= best offer.
+    frame() ------------------------------- Return DataFrame view of the filled levels (display only).
+    set_last() ---------------------------- Set the last trade from an LA entry.
+    set_side() ---------------------------- Overwrite one side with a list of {'price', 'size'} levels.
+    spread() ------------------------------ Return best offer - best bid, None if a side is empty.
+    top() --------------------------------- Return (BS, BP, OP, OS) of the best level.
+    update() ------------------------------ Apply a marketData payload (BI / OF / LA).
+
+COLUMNS ----------------------------------- Column names of levels.
+"""
+
+import threading
+
+import numpy as np
+
+COLUMNS = ('BS', 'BP', 'OP', 'OS')
+
+_BS, _BP, _OP, _OS = range(4)
+
+
+class DepthBook(object):
+    """
+    Bid and offer levels of one instrument, best first, in one preallocated
+    depth x 4 float64 array (BS, BP, OP, OS) updated in place.
+
+    A MarketData push carries the full top of book of each side it includes, so a
+    side is overwritten level by level and the rest of its rows zeroed: no
+    allocation per update. frame() wraps the same memory in a DataFrame for
+    printing; it is a view, so it must not be kept across updates.
+
+    update() and clear() run under lock, so a reader on another thread (display)
+    gets a whole update, never a half-applied side, through copy().
+    """
+
+    def __init__(self, symbol, depth=10):
+        self.symbol = symbol
+        self.depth = depth
+        self.levels = np.zeros((depth, len(COLUMNS)))
+        self.bid_levels = 0
+        self.ask_levels = 0
+        self.last_price = 0.0
+        self.last_size = 0.0
+        self.timestamp = None
+        self.updates = 0
+        self.lock = threading.RLock()
+
+    def clear(self):
+        with self.lock:
+            self.levels.fill(0)
+            self.bid_levels = 0
+            self.ask_levels = 0
+            self.timestamp = None
+
+    def copy(self, depth=None):
+        """
+        Return (levels[:depth] copy, bid_levels, ask_levels, last_price, last_size) of one update.
+        """
+        with self.lock:
+            return (self.levels[:depth].copy(), self.bid_levels, self.ask_levels, self.last_price,
+                    self.last_size)
+
+    def set_side(self, entries, bid):
+        """
+        Overwrite the bid (bid=True) or offer side with entries ({'price', 'size'} dicts,
+        best first), truncated to depth. Return the number of levels set.
+        """
+        levels = self.levels
+        price_col, size_col = (_BP, _BS) if bid else (_OP, _OS)
+
+        count = 0
+        for entry in entries[:self.depth]:
+            levels[count, price_col] = entry['price']
+            levels[count, size_col] = entry['size']
+            count += 1
+
+        previous = self.bid_levels if bid else self.ask_levels
+        if previous > count:
+            levels[count:previous, price_col] = 0
+            levels[count:previous, size_col] = 0
+
+        if bid:
+            self.bid_levels = count
+        else:
+            self.ask_levels = count
+        return count
+
+    def update(self, market_data, timestamp=None):
+        """
+        Apply a pyRofex marketData payload: BI / OF replace their side, LA sets the last trade.
+        Entries absent from the payload leave their side unchanged.
+        Return False, without applying it, if timestamp is older than the last one applied.
+        """
+        with self.lock:
+            if timestamp is not None:
+                if self.timestamp is not None and timestamp < self.timestamp:
+                    return False
+                self.timestamp = timestamp
+
+            bids = market_data.get('BI')
+            if bids is not None:
+                self.set_side(bids, True)
+
+            offers = market_data.get('OF')
+            if offers is not None:
+                self.set_side(offers, False)
+
+            last = market_data.get('LA')
+            if last:
+                self.set_last(last)
+
+            self.updates += 1
+        return True
+
+    def set_last(self, last):
+        """
+        Set last_price / last_size from an LA entry ({'price', 'size', ...}); None is ignored.
+        """
+        if last:
+            self.last_price = last.get('price') or 0.0
+            self.last_size = last.get('size') or 0.0
+
+    def best_bid(self):
+        if not self.bid_levels:
+            return 0.0, 0.0
+        return float(self.levels[0, _BP]), float(self.levels[0, _BS])
+
+    def best_offer(self):
+        if not self.ask_levels:
+            return 0.0, 0.0
+        return float(self.levels[0, _OP]), float(self.levels[0, _OS])
+
+    def spread(self):
+        if not self.bid_levels or not self.ask_levels:
+            return None
+        return float(self.levels[0, _OP] - self.levels[0, _BP])
+
+    def crossed(self):
+        return bool(self.bid_levels and self.ask_levels and self.levels[0, _BP] >= self.levels[0, _OP])
+
+    def top(self):
+        row = self.levels[0]
+        return float(row[_BS]), float(row[_BP]), float(row[_OP]), float(row[_OS])
+
+    def frame(self):
+        """
+        Return a pandas DataFrame sharing memory with the filled rows of levels (at least one row).
+        Display only: the view changes with the next update.
+        """
+        import pandas as pd
+
+        rows = max(self.bid_levels, self.ask_levels, 1)
+        return pd.DataFrame(self.levels[:rows], columns=COLUMNS, copy=False)
@@ -0,0 +1,156 @@
+"""
+Order books maintained from FIX market data.
+
+CLASSES:
+FIXOrderBook ------------------------------ Price keyed bid/ask book of one symbol.
+
+    FIELDS:
+    asks ---------------------------------- Offer price -> size.
+    bids ---------------------------------- Bid price -> size.
+    consistent ---------------------------- False after a gap or invalid update, until the next snapshot.
+    rpt_seq ------------------------------- Last RptSeq (83) applied, None if the server does not send it.
+    symbol -------------------------------- Ticker symbol.
+
+    METHODS:
+    apply() ------------------------------- Apply one MDUpdateAction (279) entry, return False on inconsistency.
+    clear() ------------------------------- Remove every level (snapshot start).
+    levels() ------------------------------ Return bid_px, bid_qty, ask_px, ask_qty arrays, best level first.
+
+FUNCTIONS:
+md_entries() ------------------------------ Yield (symbol, action, entry_type, price, size, rpt_seq) per W/X entry.
+"""
+
+from array import array
+
+MD_NEW = 48     # b'0'
+MD_CHANGE = 49  # b'1'
+MD_DELETE = 50  # b'2'
+
+MD_BID = 48     # b'0'
+MD_OFFER = 49   # b'1'
+
+
+class FIXOrderBook(object):
+    """
+    Bid and offer levels of one symbol, keyed by price.
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = {}
+        self.asks = {}
+        self.rpt_seq = None
+        self.consistent = False
+
+    def clear(self):
+        """
+        Remove every level, ready to load a snapshot.
+        """
+        self.bids.clear()
+        self.asks.clear()
+        self.rpt_seq = None
+        self.consistent = True
+
+    def apply(self, action, entry_type, price, size, rpt_seq=None):
+        """
+        Apply one entry (action, entry_type as the first byte of 279/269).
+        Return False, and flag the book inconsistent, on a RptSeq gap or an update of an unknown level.
+        """
+        if rpt_seq is not None and rpt_seq != self.rpt_seq:
+            # Entries of one message may share a message level RptSeq.
+            if self.rpt_seq is not None and rpt_seq != self.rpt_seq + 1:
+                self.consistent = False
+                return False
+            self.rpt_seq = rpt_seq
+
+        if price is None:
+            return True
+
+        if entry_type == MD_BID:
+            side = self.bids
+        elif entry_type == MD_OFFER:
+            side = self.asks
+        else:
+            return True
+
+        if action == MD_NEW:
+            side[price] = size
+
+        elif action == MD_CHANGE:
+            if price not in side:
+                self.consistent = False
+                return False
+            side[price] = size
+
+        elif action == MD_DELETE:
+            if side.pop(price, None) is None:
+                self.consistent = False
+                return False
+
+        return True
+
+    def levels(self, depth=5):
+        """
+        Return bid_px, bid_qty, ask_px, ask_qty arrays, best level first, truncated to depth.
+        """
+        bids = self.bids
+        asks = self.asks
+        bid_px = sorted(bids, reverse=True)[:depth]
+        ask_px = sorted(asks)[:depth]
+
+        return (array('d', bid_px), array('d', [bids[px] for px in bid_px]),
+                array('d', ask_px), array('d', [asks[px] for px in ask_px]))
+
+
+def md_entries(frame):
+    """
+    Yield (symbol, action, entry_type, price, size, rpt_seq) for each MDEntry of a tokenized W/X message.
+    action and entry_type are the first byte of 279/269 (action is MD_NEW for snapshots).
+    Symbol (55) and RptSeq (83) are inherited from message level when not repeated per entry;
+    symbol is None when the message carries no Symbol at all.
+    """
+    buf = frame.buf
+    starts = frame.starts
+    ends = frame.ends
+
+    symbol = None
+    rpt_seq = None
+    entry = None
+
+    for i, tag in enumerate(frame.tags):
+        if tag == 279 or (tag == 269 and (entry is None or entry[2] is not None)):
+            if entry is not None:
+                yield tuple(entry)
+
+            entry = [symbol, MD_NEW, None, None, 0.0, rpt_seq]
+            if tag == 279:
+                entry[1] = buf[starts[i]]
+            else:
+                entry[2] = buf[starts[i]]
+
+        elif tag == 269:
+            entry[2] = buf[starts[i]]
+
+        elif tag == 55:
+            symbol = bytes(buf[starts[i]:ends[i]]).decode('cp1252')
+            if entry is not None:
+                entry[0] = symbol
+
+        elif tag == 83:
+            rpt_seq = int(buf[starts[i]:ends[i]])
+            if entry is not None:
+                entry[5] = rpt_seq
+
+        elif entry is not None:
+            # An empty MDEntryPx / MDEntrySize leaves the entry without price / size.
+            if tag == 270:
+                value = buf[starts[i]:ends[i]]
+                if value:
+                    entry[3] = float(value)
+            elif tag == 271:
+                value = buf[starts[i]:ends[i]]
+                if value:
+                    entry[4] = float(value)
+
+    if entry is not None:
+        yield tuple(entry)
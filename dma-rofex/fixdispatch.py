@@ -0,0 +1,103 @@
+"""
+Table driven routing of inbound FIX messages.
+
+CLASSES:
+FIXDispatcher ----------------------------- Route messages to handlers registered by MsgType (35).
+
+    FIELDS:
+    default ------------------------------- Handler for types without a registered handler (None = drop).
+    handlers ------------------------------ MsgType (bytes) -> handler.
+    received ------------------------------ Messages dispatched per MsgType.
+    unknown ------------------------------- Messages per MsgType that reached the default handler.
+
+    METHODS:
+    dispatch() ---------------------------- Route one message, return handler result.
+    register() ---------------------------- Register handler for a MsgType.
+    set_default() ------------------------- Set handler for unregistered MsgTypes.
+    unregister() -------------------------- Remove handler for a MsgType.
+
+MSG_TYPES --------------------------------- MsgType (bytes) -> name, for every message sent by the ROFEX gateway.
+"""
+
+from collections import Counter
+
+MSG_TYPES = {
+    b'0': 'Heartbeat',
+    b'1': 'TestRequest',
+    b'2': 'ResendRequest',
+    b'3': 'ERROR_msj',                          # Reject
+    b'4': 'SequenceReset',
+    b'5': 'Logout',
+    b'8': 'ExecutionReport',
+    b'9': 'ERROR_order',                        # OrderCancelReject
+    b'A': 'Logon',
+    b'W': 'MarketDataSnapshotFullRefresh',
+    b'X': 'MarketDataIncrementalRefresh',
+    b'Y': 'MarketDataRequestReject',
+    b'f': 'SecurityStatus',
+    b'h': 'TradingSessionStatus',
+    b'j': 'BusinessMessageReject',
+    b'r': 'OrderMassCancelReport',
+    b'y': 'SecurtityList',
+    b'AD': 'TradeCaptureReportRequest',
+    b'AE': 'TradeCaptureReport',
+    b'AQ': 'TradeCaptureReportRequestAck',
+    b'BK': 'SecurityListUpdateReport',
+}
+
+
+def _msg_type(msg_type):
+    return msg_type.encode('ASCII') if isinstance(msg_type, str) else bytes(msg_type)
+
+
+class FIXDispatcher(object):
+    """
+    Route inbound messages through a dict of handlers keyed by MsgType.
+
+    MsgType is read once per message. Handlers are called as handler(msg) and
+    messages without a registered handler go to default and are counted in unknown.
+    """
+
+    def __init__(self, default=None):
+        self.handlers = {}
+        self.default = default
+        self.received = Counter()
+        self.unknown = Counter()
+
+    def register(self, msg_type, handler):
+        """
+        Register handler for msg_type (str or bytes, e.g. '8'), replacing any previous one.
+        """
+        self.handlers[_msg_type(msg_type)] = handler
+
+    def unregister(self, msg_type):
+        """
+        Remove handler for msg_type, if any.
+        """
+        self.handlers.pop(_msg_type(msg_type), None)
+
+    def set_default(self, handler):
+        """
+        Set handler for messages without a registered handler (None drops them).
+        """
+        self.default = handler
+
+    def dispatch(self, msg):
+        """
+        Route msg (simplefix message or FIXFrame) to its handler and return the handler result.
+        """
+        msg_type = msg.get(35)
+        if msg_type is not None and type(msg_type) is not bytes:
+            msg_type = bytes(msg_type)
+
+        self.received[msg_type] += 1
+        handler = self.handlers.get(msg_type)
+
+        if handler is None:
+            self.unknown[msg_type] += 1
+            handler = self.default
+
+            if handler is None:
+                return None
+
+        return handler(msg)
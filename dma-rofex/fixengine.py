@@ -5,12 +5,33 @@ CLASSES:
 FIXEngine --------------------------------- Implementation of a FIX Engine.
 
     FIELDS:
+    books --------------------------------- Symbol -> FIXOrderBook maintained from W/X messages.
+    clock --------------------------------- SendingTime (52) cached per millisecond.
+    dispatcher ---------------------------- FIXDispatcher routing inbound messages by MsgType.
+    latency ------------------------------- LatencyRecorder timing dispatch() (None = not instrumented).
+    log ----------------------------------- Logger of rejected / lost resync snapshot requests.
+    session ------------------------------- FIXSession with the identity and counters of this engine.
+    stamp_on_send ------------------------- Allocate MsgSeqNum / SendingTime in stamp() (when sent), not when built.
+    md_rejected --------------------------- MDEntries dropped for carrying no Symbol (55).
+    md_resync ----------------------------- Symbols whose book needs a snapshot (gap or invalid update).
+    md_resync_timeout --------------------- Seconds to wait for a resync snapshot before requesting it again.
+    md_subscriptions ---------------------- MDReqID -> MarketDataSubscription of every active request.
+    open_orders --------------------------- OrderID -> (Symbol, Side) of orders not yet filled/cancelled/rejected.
     protocol_type_head -------------------- FIX message header. Always '8=FIXT.1.1|'.
+    resync_send --------------------------- Callable sending snapshot requests as md_resync fills (None = manual).
+    security_list ------------------------- SecurityListIndex built from SecurityList (y) responses.
+    store --------------------------------- SessionStore journaling outbound frames (None = not journaled).
+    use_templates ------------------------- Build order messages from pre-encoded templates.
 
     METHODS:
+    attach_store() ------------------------ Journal outbound frames in a SessionStore, resuming its checkpoints.
     bid_ask_data_request_msg()------------- Request snapshot and updates of market depth.
+    build_templates() --------------------- Pre-encode header and order templates for the session.
     cancel_order_msg() -------------------- Cancel specific Order.
     change_order_msg() -------------------- Change Order request.
+    decode_execution_report() ------------- Return ExecutionReport record with all fields parsed once.
+    decode_trade_capture_reports() -------- Return TradeCaptureReport records for a batch of messages.
+    dispatch() ---------------------------- Route inbound message to its registered handler.
     extract_avgPx() ----------------------- Return calculated average price of all fills on this Order.
     extract_ClOrdID() --------------------- Return unique OrderID for a day anf client.
     extract_CumQty() ---------------------- Return total quantity (e.g. number of shares) filled.
@@ -18,6 +39,7 @@ FIXEngine --------------------------------- Implementation of a FIX Engine.
     --------------------------------------- of the day), used to identify previous Order in cancel/replace requests.
     extract_leavesQty() ------------------- Return quantity open for further execution.
     extract_market_changes() -------------- Return market changes for bid and ask books.
+    extract_market_levels() --------------- Return bid and ask books as numeric arrays.
     extract_market_segments() ------------- Return market segment.
     extract_msg_tye() --------------------- Return FIX message type.
     extract_OrderID() --------------------- Return unique OrderID assigned by sell-side.
@@ -30,24 +52,73 @@ FIXEngine --------------------------------- Implementation of a FIX Engine.
     list_request_msg() -------------------- Request snapshots and updates of all securities subscribed.
     log_out() ----------------------------- Log out from server.
     logon() ------------------------------- Logon to server.
-    msg_Heartbeat() ----------------------- Send heartbeat.
+    market_data_request_batch_msgs() ------ Subscribe to many symbols, chunked, one MDReqID per chunk.
+    market_data_resync_msgs() ------------- Snapshot requests for books flagged in md_resync.
+    market_data_snapshot_msg() ------------ Request a one-off snapshot of market depth.
+    msg_Heartbeat() ----------------------- Send heartbeat (echoing TestReqID when answering a TestRequest).
     msg_TestRequest() --------------------- Add identifier included in Test Request message to be returned in
     --------------------------------------- resulting Heartbeat. ('TestReqIDtemp')
-    order_mass_cancel_request_msg() ------- Return OrderMassCancelRequest message
+    on_market_data_incremental() ---------- Apply MarketDataIncrementalRefresh (X) to books.
+    on_market_data_reject() --------------- Release a book whose resync snapshot request was rejected (Y).
+    on_market_data_snapshot() ------------- Load MarketDataSnapshotFullRefresh (W) into books.
+    on_resend_request() ------------------- Return stored frames / gap fills answering a ResendRequest.
+    order_mass_cancel_request_msg() ------- Return OrderMassCancelRequest message (all, one symbol or one segment).
     order_status_msg() -------------------- Status of specific Order.
+    order_status_msgs() ------------------- Status of every order in open_orders (after reconnect).
     place_order_msg() --------------------- Place new Order.
+    record_inbound() ---------------------- Track inbound MsgSeqNum in session.seq_num_server, detecting gaps.
+    record_outbound() --------------------- Journal encoded outbound frame in store.
+    reset_templates() --------------------- Discard pre-encoded templates (session values changed).
     ResendRequest() ----------------------- ResendRequest of an incomplete message
+    resubscribe_msgs() -------------------- Renew every active subscription (after reconnect), batched.
+    sequence_reset_msg() ------------------ SequenceReset-GapFill for a resent range.
+    stamp() ------------------------------- Encode message, allocating its MsgSeqNum now (stamp_on_send).
+    session_level() ----------------------- Return messages owed to the peer for an inbound message.
     symbol_right() ------------------------ Return True if symbol ticker belongs to market list, False otherwise.
+    track_order() ------------------------- Update open_orders from an ExecutionReport.
     trade_report_msg() -------------------- Request trading report of fills and orders.
+    unsubscribe_batch_msgs() -------------- Unsubscribe every (or the given) MDReqID.
     unsubscribe_bid_ask_data_request_msg()- Unsubscribe snapshot and updates request.
+    update_security_list() ---------------- Merge SecurityList (y/BK) message into security_list.
 """
 
-import re
-from datetime import datetime
+import logging
+import time
+from collections import namedtuple
 
 import simplefix
 
+from fixbook import FIXOrderBook, md_entries
+from fixdispatch import FIXDispatcher, MSG_TYPES
+from fixrecords import ExecutionReport, TradeCaptureReport
+from fixsession import FIXSession
+from fixtemplates import DeferredMessage, EncodedMessage, MessageTemplate, SendingTimeClock, fix_val
+from fixtokenizer import book_levels, market_levels, tokenize
 from global_queue import *
+from securitylist import SecurityListIndex
+from sessionstore import ADMIN_MSG_TYPES, frame_seq_type, possdup_frame
+
+MD_ENTRY_BID = "0"
+MD_ENTRY_OFFER = "1"
+MD_ENTRY_TRADE = "2"
+MD_ENTRY_INDEX_VALUE = "3"
+MD_ENTRY_OPENING_PRICE = "4"
+MD_ENTRY_CLOSING_PRICE = "5"
+MD_ENTRY_SETTLEMENT_PRICE = "6"
+MD_ENTRY_HIGH_PRICE = "7"
+MD_ENTRY_LOW_PRICE = "8"
+MD_ENTRY_TRADE_VOLUME = "B"
+MD_ENTRY_OPEN_INTEREST = "C"
+BID_OFFER = (MD_ENTRY_BID, MD_ENTRY_OFFER)
+
+# OrdStatus (39) values of orders that can no longer trade.
+ORD_STATUS_DONE = (b'2', b'3', b'4', b'8', b'C')
+
+# MsgSeqNum pair left open by header_msg() with stamp_on_send (position 2: after 8 and 35).
+_UNSTAMPED = (b'34', b'0')
+
+# Active MarketDataRequest (kept per MDReqID for unsubscribe / re-subscribe after reconnect).
+MarketDataSubscription = namedtuple('MarketDataSubscription', 'symbols entry_types max_depth incremental')
 
 
 class FIXEngine(object):
@@ -55,42 +126,159 @@ class FIXEngine(object):
     Class implementing FIX engine.
 
     Used to build and parse FIX messages.
+
+    Every engine owns a FIXSession (session=None: GlobalsSession, reading the
+    global_queue values live), so engines for different sessions do not share counters.
+    ClOrdIDs passed in by the caller advance session.cl_ord_id (FIXSession.note_cl_ord_id).
+
+    With use_templates=True, place_order_msg, cancel_order_msg and change_order_msg
+    return pre-encoded frames (EncodedMessage) instead of simplefix messages.
+
+    With stamp_on_send=True (set by threaded transports), built messages leave
+    MsgSeqNum and SendingTime open and stamp() allocates them while encoding: the
+    transport stamps and enqueues under one lock, so frames built on different
+    threads always reach the wire in MsgSeqNum order.
     """
 
-    def __init__(self):
+    def __init__(self, use_templates=False, session=None):
+        self.session = session if session is not None else FIXSession.from_globals()
         self.protocol_type_head = b'8=' + str.encode(protocol_type) + b'\x01'
-
-    def header_msg(self, tag):
+        self.clock = SendingTimeClock()
+        self.use_templates = use_templates
+        self.stamp_on_send = False
+        self._templates = None
+        self._templates_identity = None
+        self.security_list = SecurityListIndex()
+        self._list_market = (None, None)
+
+        self.dispatcher = FIXDispatcher()
+        self.dispatcher.register("y", self.update_security_list)
+        self.dispatcher.register("BK", self.update_security_list)
+
+        self.store = None
+        self._inbound_synced = False
+        self._resend_to = None
+        self.open_orders = {}
+        self.latency = None
+
+        self.md_subscriptions = {}
+        self.books = {}
+        self.md_resync = set()
+        self.md_rejected = 0
+        self.resync_send = None
+        self.md_resync_timeout = 5.0
+        self.log = logging.getLogger('fixengine')
+        # Symbol -> (MDReqID, time.monotonic() requested) of the resync snapshots not yet received.
+        self._md_resync_pending = {}
+        self.dispatcher.register("W", self.on_market_data_snapshot)
+        self.dispatcher.register("X", self.on_market_data_incremental)
+        self.dispatcher.register("Y", self.on_market_data_reject)
+
+    def header_msg(self, tag, msg_seq_num=None):
         """
         Return standard FIX message header with MsgType = tag.
+        msg_seq_num overrides the allocated MsgSeqNum (SequenceReset-GapFill of resent ranges).
         """
 
-        # Build msg seq_nu from all messages sent to server.
-        global seq_num
+        session = self.session
 
         msg = simplefix.FixMessage()
-        seq_num[0] += 1
-        sendingTime = datetime.now().strftime('%Y%m%d-%H:%M:%S.%f')[:-3]
+        if msg_seq_num is None:
+            msg_seq_num = 0 if self.stamp_on_send else session.next_seq_num()
+        sendingTime = self.clock.now()
 
         msg.append_pair(8, protocol_type)      # Protocol Type
         msg.append_pair(35, tag)               # MsgType
-        msg.append_pair(34, seq_num[0])        # MsgSeqNum
-        msg.append_pair(49, "fedejbrun5018")        # SenderCompID
+        msg.append_pair(34, msg_seq_num)       # MsgSeqNum
+        msg.append_pair(49, session.sender_comp_id)  # SenderCompID
         msg.append_pair(52, sendingTime)       # SendingTime
-        msg.append_pair(56, "ROFX")   # TargetCompID
-        msg.append_pair(115, User[0])          # OnBehalfOfCompID
-        msg.append_pair(128, xchange_name[0])  # DeliverToCompID
+        msg.append_pair(56, session.target_comp_id)  # TargetCompID
+        msg.append_pair(115, session.user)     # OnBehalfOfCompID
+        msg.append_pair(128, session.xchange_name)  # DeliverToCompID
         return msg
 
-    def logon(self):
+    def build_templates(self):
+        """
+        Pre-encode header and static order fields for the current session values.
+        """
+        session = self.session
+        self._templates_identity = session.identity()
+        header = [(49, session.sender_comp_id),  # SenderCompID
+                  (52, None),                    # SendingTime
+                  (56, session.target_comp_id),  # TargetCompID
+                  (115, session.user),           # OnBehalfOfCompID
+                  (128, session.xchange_name)]   # DeliverToCompID
+        parties = [(453, 1), (448, session.party_id), (447, "D"), (452, 11)]
+
+        def template(tag, body):
+            return MessageTemplate(protocol_type, [(35, tag), (34, None)] + header + body)
+
+        # Variable fields (None) in slot order: 34, 52, then the body ones.
+        self._templates = {
+            "D": template("D", [(1, None), (11, None), (38, None), (40, 2), (44, None), (54, None), (55, None),
+                                (60, None)]),
+            "F": template("F", [(1, None), (11, None), (38, None), (41, None), (54, None), (55, None),
+                                (60, None)] + parties),
+            "G": template("G", [(1, None), (11, None), (38, None), (40, 2), (41, None), (44, None), (54, None),
+                                (55, None), (60, None)] + parties),
+        }
+        return self._templates
+
+    def reset_templates(self):
+        """
+        Discard pre-encoded templates, rebuilt on next use (also done when User/PartyID change).
+        """
+        self._templates = None
+        self._templates_identity = None
+
+    def _render(self, tag, *values):
+        """
+        Return EncodedMessage for template tag, allocating MsgSeqNum and SendingTime
+        (DeferredMessage allocating them on encode with stamp_on_send).
+        TransactTime (60) is always the last variable field and equals SendingTime.
+        """
+        if self.stamp_on_send:
+            return DeferredMessage(self, tag, values)
+        return self._render_now(tag, values)
+
+    def _render_now(self, tag, values):
+        templates = self._templates
+        if templates is None or self._templates_identity != self.session.identity():
+            templates = self.build_templates()
+        msg_seq_num = self.session.next_seq_num()
+        sendingTime = self.clock.now_bytes()
+
+        return templates[tag].render((str(msg_seq_num).encode('ASCII'), sendingTime)
+                                     + tuple(map(fix_val, values)) + (sendingTime,))
+
+    def stamp(self, msg):
         """
-        Return LogOn message.
+        Return msg encoded. A message built with stamp_on_send gets its MsgSeqNum (34) and
+        SendingTime (52) now; anything else (already sequenced) is encoded unchanged.
         """
+        if type(msg) is DeferredMessage:
+            return self._render_now(msg.tag, msg.values)
+
+        pairs = getattr(msg, 'pairs', None)
+        if pairs is not None and len(pairs) > 4 and pairs[2] == _UNSTAMPED:
+            pairs[2] = (b'34', str(self.session.next_seq_num()).encode('ASCII'))
+            pairs[4] = (b'52', self.clock.now_bytes())
+        return msg.encode()
+
+    def logon(self, heart_bt_int=60):
+        """
+        Return LogOn message. Raise ValueError if the session has no SenderCompID, Username or Password.
+        """
+        session = self.session
+        if not (session.sender_comp_id and session.username and session.password):
+            raise ValueError('FIX session credentials missing: set sender_comp_id, username and password '
+                             '(FIXSession arguments or global_queue SenderCompID, Username and Password)')
+
         msg = self.header_msg("A")
         msg.append_pair(98, "0")                # EncryptMethod: None / Other
-        msg.append_pair(108, "60")              # HeartBtInt: 60 seconds
-        msg.append_pair(553, "fedejbrun5018")           # Username
-        msg.append_pair(554, "ugklxY0*")     # Password
+        msg.append_pair(108, heart_bt_int)      # HeartBtInt: 60 seconds by default
+        msg.append_pair(553, session.username)  # Username
+        msg.append_pair(554, session.password)  # Password
         msg.append_pair(1137, "9")              # DefaultApplVerID
         return msg
 
@@ -101,20 +289,20 @@ class FIXEngine(object):
         msg = self.header_msg("5")
         return msg
 
-    def msg_Heartbeat(self):
+    def msg_Heartbeat(self, TestReqID=None):
         """
-        Return HeartBeat message.
+        Return HeartBeat message (TestReqID: answer to a TestRequest).
         """
-        return self.header_msg("0")
+        msg = self.header_msg("0")
+        if TestReqID is not None:
+            msg.append_pair(112, TestReqID)     # TestReqID of the TestRequest answered
+        return msg
 
     def msg_TestReq(self):
         """
         Return TestReqID message.
         """
-        global TestReqID
-
-        TestReqID[0] += 1
-        TestReqIDtemp = TestReqID[0]
+        TestReqIDtemp = self.session.next_test_req_id()
 
         msg = self.header_msg("1")  # MsgType                               (35) = (1) TestRequest
         msg.append_pair(112, TestReqIDtemp)  # TestRequestID               (112) = TestRequestIDtemp
@@ -130,45 +318,149 @@ class FIXEngine(object):
         msg.append_pair(559, "4")  # SecurityListRequestType               (559) = (4) All Securities
         return msg
 
-    def bid_ask_data_request_msg(self, prod, max_depth=2):
+    def _market_data_request(self, MDReqIDtemp, subscription, symbols, entry_types, max_depth, incremental=False):
         """
-        Return MarketDataRequest Subscribe message and MDReqIDtemp.
+        Return MarketDataRequest message for symbols and entry_types.
         """
-        global MDReqID
-
-        MDReqID[0] += 1
-        MDReqIDtemp = MDReqID[0]
-
         msg = self.header_msg("V")
         msg.append_pair(262, MDReqIDtemp)  # MDReqID                       (262) = MDReqIDtemp
-        msg.append_pair(263, "1")  # SubscriptionRequestType               (263) = (1) Snapshot + Updates (Subscribe)
-        msg.append_pair(264, str(max_depth))  # MarketDepth                (264) = (2) Book depth (default)
-        msg.append_pair(265, "0")  # MDUpdateType                          (265) = (0) Full refresh TODO revisar
-        msg.append_pair(266, "Y")  # AggregatedBook                        (266) = (Y) Book entries to be aggregated
-        msg.append_pair(7118, "D")  # TODO no se de donde salió esto
-        msg.append_pair(146, "1")  # NoRelatedSym                          (146) = (1) N° of repeating symbols specified
-        msg.append_pair(55, prod)  # Symbol                                 (55) = (prod) Ticker symbol
-        msg.append_pair(267, "2")  # NoMDEntryTypes                        (267) = (2) N° of MDEntryType (269) requested
-        msg.append_pair(269, "0")  # MDEntryType                           (269) = (0) Bid
-        msg.append_pair(269, "1")  # MDEntryType                           (269) = (1) Offer
+        msg.append_pair(263, subscription)  # SubscriptionRequestType      (263) = (0) Snapshot / (1) Sub. / (2) Unsub.
+        msg.append_pair(264, str(max_depth))  # MarketDepth                (264) = Book depth
+        if subscription == "0":
+            # Snapshot requests carry no MDUpdateType (265) / 7118.
+            msg.append_pair(266, "Y")  # AggregatedBook                    (266) = (Y) Book entries to be aggregated
+        else:
+            if incremental:
+                msg.append_pair(265, "1")  # MDUpdateType                  (265) = (1) Incremental refresh
+            else:
+                msg.append_pair(265, "0")  # MDUpdateType                  (265) = (0) Full refresh TODO revisar
+            msg.append_pair(266, "Y")  # AggregatedBook                    (266) = (Y) Book entries to be aggregated
+            msg.append_pair(7118, "D")  # TODO no se de donde salió esto
+        msg.append_pair(146, len(symbols))  # NoRelatedSym                 (146) = N° of repeating symbols specified
+        for prod in symbols:
+            msg.append_pair(55, prod)  # Symbol                             (55) = (prod) Ticker symbol
+        msg.append_pair(267, len(entry_types))  # NoMDEntryTypes           (267) = N° of MDEntryType (269) requested
+        for entry_type in entry_types:
+            msg.append_pair(269, entry_type)  # MDEntryType                (269) = (0) Bid / (1) Offer / ...
+        return msg
 
+    def bid_ask_data_request_msg(self, prod, max_depth=2, incremental=False):
+        """
+        Return MarketDataRequest Subscribe message and MDReqIDtemp.
+        With incremental=True the server sends a snapshot followed by MarketDataIncrementalRefresh (X)
+        updates, applied to books by on_market_data_incremental.
+        """
+        MDReqIDtemp = self.session.next_md_req_id()
+        self.md_subscriptions[MDReqIDtemp] = MarketDataSubscription((prod,), BID_OFFER, max_depth, incremental)
+
+        msg = self._market_data_request(MDReqIDtemp, "1", (prod,), BID_OFFER, max_depth, incremental)
         return msg, MDReqIDtemp
 
-    def order_mass_cancel_request_msg(self):
+    def market_data_request_batch_msgs(self, symbols, entry_types=BID_OFFER, max_depth=2, incremental=False,
+                                       chunk_size=50):
+        """
+        Return list of (MarketDataRequest Subscribe message, MDReqIDtemp), one per chunk_size symbols.
+        entry_types are MDEntryType (269) values, e.g. (MD_ENTRY_BID, MD_ENTRY_OFFER, MD_ENTRY_TRADE).
+        """
+        entry_types = tuple(entry_types)
+        symbols = list(symbols)
+        msgs = []
+
+        for n in range(0, len(symbols), chunk_size):
+            chunk = tuple(symbols[n:n + chunk_size])
+            MDReqIDtemp = self.session.next_md_req_id()
+            self.md_subscriptions[MDReqIDtemp] = MarketDataSubscription(chunk, entry_types, max_depth, incremental)
+            msgs.append((self._market_data_request(MDReqIDtemp, "1", chunk, entry_types, max_depth, incremental),
+                         MDReqIDtemp))
+
+        return msgs
+
+    def unsubscribe_batch_msgs(self, MDReqIDs=None):
         """
-        Return OrderMassCancelRequest message.
+        Return list of MarketDataRequest Unsubscribe messages for MDReqIDs (default: every subscription).
         """
-        global ClOrdID
+        if MDReqIDs is None:
+            MDReqIDs = list(self.md_subscriptions)
 
-        lk.acquire()
-        ClOrdID[0] += 1
-        ClOrdID_temp = ClOrdID[0]
-        lk.release()
+        msgs = []
+        for MDReqIDtemp in MDReqIDs:
+            subscription = self.md_subscriptions.pop(MDReqIDtemp, None)
+            if subscription is not None:
+                msgs.append(self._market_data_request(MDReqIDtemp, "2", subscription.symbols,
+                                                      subscription.entry_types, subscription.max_depth,
+                                                      subscription.incremental))
+        return msgs
+
+    def resubscribe_msgs(self, chunk_size=50):
+        """
+        Return list of (MarketDataRequest Subscribe message, MDReqIDtemp) renewing every subscription
+        in md_subscriptions (e.g. after reconnect). Subscriptions with the same entry types, depth and
+        update type are merged and re-chunked; the old MDReqIDs are dropped.
+        """
+        groups = {}
+        for subscription in self.md_subscriptions.values():
+            key = (subscription.entry_types, subscription.max_depth, subscription.incremental)
+            groups.setdefault(key, []).extend(subscription.symbols)
+
+        self.md_subscriptions.clear()
+
+        msgs = []
+        for (entry_types, max_depth, incremental), symbols in groups.items():
+            msgs.extend(self.market_data_request_batch_msgs(list(dict.fromkeys(symbols)), entry_types, max_depth,
+                                                            incremental, chunk_size))
+        return msgs
+
+    def market_data_snapshot_msg(self, prod, max_depth=5):
+        """
+        Return MarketDataRequest Snapshot message and MDReqIDtemp (no 265 / 7118, as before batching).
+        """
+        MDReqIDtemp = self.session.next_md_req_id()
+        return self._market_data_request(MDReqIDtemp, "0", (prod,), BID_OFFER, max_depth), MDReqIDtemp
+
+    def market_data_resync_msgs(self, max_depth=5):
+        """
+        Return list of snapshot requests for the books flagged in md_resync, and clear the flags.
+        Snapshots requested more than md_resync_timeout seconds ago and never received are
+        requested again.
+        """
+        now = time.monotonic()
+        pending = self._md_resync_pending
+        for symbol, (MDReqID, requested) in list(pending.items()):
+            if now - requested > self.md_resync_timeout:
+                self.log.warning('FIXEngine: no snapshot for %s (MDReqID %s) within %ss, requested again',
+                                 symbol, MDReqID, self.md_resync_timeout)
+                self.md_resync.add(symbol)
+
+        msgs = []
+        for prod in sorted(self.md_resync):
+            msg, MDReqIDtemp = self.market_data_snapshot_msg(prod, max_depth)
+            pending[prod] = (MDReqIDtemp, now)
+            msgs.append(msg)
+        self.md_resync.clear()
+        return msgs
+
+    def _request_resync(self):
+        send = self.resync_send
+        if send is not None and (self.md_resync or self._md_resync_pending):
+            for msg in self.market_data_resync_msgs():
+                send(msg)
+
+    def order_mass_cancel_request_msg(self, symbol=None, segment="DDF"):
+        """
+        Return OrderMassCancelRequest message, ClOrdID. With symbol only the orders of that symbol
+        are cancelled, otherwise every order of segment (segment=None: every order).
+        """
+        ClOrdID_temp = self.session.next_cl_ord_id()
 
         msg = self.header_msg("q")
         msg.append_pair(11, ClOrdID_temp)  # ClOrdID                        (11) = ClOrdID_temp
-        msg.append_pair(530, "7")  # MassCancelRequestType                 (530) = (7) Cancel all orders
-        msg.append_pair(1300, "DDF")  # MarketSegmentID                   (1300) = (DDF) Market segment
+        if symbol is not None:
+            msg.append_pair(530, "1")  # MassCancelRequestType             (530) = (1) Cancel orders for a security
+            msg.append_pair(55, symbol)  # Symbol                           (55) = Ticker symbol
+        else:
+            msg.append_pair(530, "7")  # MassCancelRequestType             (530) = (7) Cancel all orders
+        if segment is not None:
+            msg.append_pair(1300, segment)  # MarketSegmentID             (1300) = Market segment
         msg.append_pair(60, msg.get(52))  # TransactTime                    (60) = Transaction Time
         return msg, ClOrdID_temp
 
@@ -181,15 +473,25 @@ class FIXEngine(object):
         msg.append_pair(54, side)  # Side                                   (54) = Side
         msg.append_pair(55, prod)  # Symbol                                 (55) = Ticker symbol
         msg.append_pair(453, 1)  # NoPartyIDs                              (453) = Number of PartyID
-        msg.append_pair(448, PartyID[0])  # PartyID                        (448) = PartyID
+        msg.append_pair(448, self.session.party_id)  # PartyID                        (448) = PartyID
         msg.append_pair(447, "D")  # PartyIDSource                         (447) = (D) Proprietary / Custom code
         msg.append_pair(452, 11)  # PartyRole                              (452) = (11) Order Origination Trader
         return msg
 
+    def order_status_msgs(self):
+        """
+        Return list of OrderStatusRequest messages, one per order in open_orders.
+        """
+        return [self.order_status_msg(OrderID, prod, side) for OrderID, (prod, side) in list(self.open_orders.items())]
+
     def place_order_msg(self, prod, price, qty, side, ClOrdID_temp,account):
         """
         Return NewOrderSingle message.
         """
+        self.session.note_cl_ord_id(ClOrdID_temp)
+        if self.use_templates:
+            return self._render("D", account, ClOrdID_temp, qty, price, side, prod)
+
         msg = self.header_msg("D")
         msg.append_pair(1, account)  # Account                               (1) = account
         msg.append_pair(11, ClOrdID_temp)  # ClOrdID                        (11) = ClOrdID_temp
@@ -205,6 +507,10 @@ class FIXEngine(object):
         """
         Return OrderCancelRequest message.
         """
+        self.session.note_cl_ord_id(ClOrdID_temp)
+        if self.use_templates:
+            return self._render("F", account, ClOrdID_temp, qty, OrigClOrdID, side, prod)
+
         msg = self.header_msg("F")
         msg.append_pair(1, account)  # Account                               (1) = account
         msg.append_pair(11, ClOrdID_temp)  # ClOrdID                        (11) = ClOrdID_temp_temp)
@@ -214,7 +520,7 @@ class FIXEngine(object):
         msg.append_pair(55, prod)  # Symbol                                 (55) = Ticker symbol
         msg.append_pair(60, msg.get(52))  # TransactTime                    (60) = Transaction Time
         msg.append_pair(453, 1)  # NoPartyIDs                              (453) = Number of PartyID
-        msg.append_pair(448, PartyID[0])  # PartyID                        (448) = PartyID
+        msg.append_pair(448, self.session.party_id)  # PartyID                        (448) = PartyID
         msg.append_pair(447, "D")  # PartyIDSource                         (447) = (D) Proprietary / Custom code
         msg.append_pair(452, 11)  # PartyRole                              (452) = (11) Order Origination Trader
         return msg
@@ -223,6 +529,10 @@ class FIXEngine(object):
         """
         Return OrderCancelReplaceRequest message.
         """
+        self.session.note_cl_ord_id(ClOrdID_temp)
+        if self.use_templates:
+            return self._render("G", account, ClOrdID_temp, qty, OrigClOrdID, price, side, prod)
+
         msg = self.header_msg("G")
         msg.append_pair(1, account)  # Account                               (1) = account
         msg.append_pair(11, ClOrdID_temp)  # ClOrdID                        (11) = ClOrdID_temp_temp)_temp)
@@ -234,7 +544,7 @@ class FIXEngine(object):
         msg.append_pair(55, prod)  # Symbol                                 (55) = Ticker symbol
         msg.append_pair(60, msg.get(52))  # TransactTime                    (60) = Transaction Time
         msg.append_pair(453, 1)  # NoPartyIDs                              (453) = Number of PartyID
-        msg.append_pair(448, PartyID[0])  # PartyID                        (448) = PartyIDrtyID[0])
+        msg.append_pair(448, self.session.party_id)  # PartyID                        (448) = PartyIDrtyID[0])
         msg.append_pair(447, "D")  # PartyIDSource                         (447) = (D) Proprietary / Custom code
         msg.append_pair(452, 11)  # PartyRole                              (452) = (11) Order Origination Trader
         return msg
@@ -248,38 +558,142 @@ class FIXEngine(object):
         msg.append_pair(16, EndSeqNo)  # PartyRole                         (452) = EndSeqNo
         return msg
 
+    def sequence_reset_msg(self, MsgSeqNum, NewSeqNo):
+        """
+        Return SequenceReset-GapFill message sent as MsgSeqNum, covering up to NewSeqNo - 1.
+        """
+        msg = self.header_msg("4", MsgSeqNum)
+        msg.append_pair(43, "Y")  # PossDupFlag                            (43) = (Y) Possible duplicate
+        msg.append_pair(123, "Y")  # GapFillFlag                          (123) = (Y) Gap fill message
+        msg.append_pair(36, NewSeqNo)  # NewSeqNo                           (36) = Next MsgSeqNum to be sent
+        return msg
+
+    def attach_store(self, store):
+        """
+        Journal outbound frames in SessionStore store. A store holding checkpoints
+        (restart after a crash) restores the session seq_num, seq_num_server and cl_ord_id from it.
+        """
+        session = self.session
+        self.store = store
+
+        if store.out_seq:
+            with session.lock:
+                session.seq_num = store.out_seq
+                session.seq_num_server = store.in_seq
+                session.cl_ord_id = max(session.cl_ord_id, store.cl_ord_id)
+            self._inbound_synced = True
+
+    def record_outbound(self, frame):
+        """
+        Journal encoded frame under its MsgSeqNum and checkpoint the ClOrdID counter.
+        """
+        if self.store is None:
+            return
+
+        seq, msg_type = frame_seq_type(frame)
+        self.store.append(seq, frame, msg_type in ADMIN_MSG_TYPES)
+        self.store.checkpoint(cl_ord_id=self.session.cl_ord_id)
+
+    def record_inbound(self, msg):
+        """
+        Track (and checkpoint) MsgSeqNum of an inbound message in session.seq_num_server.
+        Return list of messages to send: a ResendRequest (2) when a gap is detected.
+
+        Only a higher MsgSeqNum advances it; PossDup (43=Y) resends never do, and a
+        SequenceReset (4) moves it to NewSeqNo (36) - 1. Without a store checkpoint the
+        first inbound message is the starting point. A gap is requested once, up to
+        the MsgSeqNum that revealed it.
+        """
+        msg_seq_num = msg.get(34)
+        if msg_seq_num is None:
+            return []
+
+        session = self.session
+        seq = int(msg_seq_num)
+        expected = session.seq_num_server + 1
+        replies = []
+
+        if msg.get(35) == b'4':
+            seq = int(msg.get(36)) - 1
+            if self._resend_to is not None and seq >= self._resend_to:
+                self._resend_to = None
+        elif msg.get(43) == b'Y':
+            if self._resend_to is not None and seq >= self._resend_to:
+                self._resend_to = None
+            return replies
+        elif self._inbound_synced and seq > expected and (self._resend_to is None or expected > self._resend_to):
+            replies.append(self.ResendRequest(expected, 0))
+            self._resend_to = seq - 1
+
+        self._inbound_synced = True
+        if seq > session.seq_num_server:
+            session.seq_num_server = seq
+            if self.store is not None:
+                self.store.checkpoint(in_seq=seq)
+        return replies
+
+    def session_level(self, msg):
+        """
+        Return list of messages the session owes the peer for inbound msg: a ResendRequest
+        when it reveals a gap (record_inbound) and, for a ResendRequest (2), the stored
+        frames / gap fills answering it (EncodedMessage, already sequenced: sent as is).
+        Called by the transport for every inbound message, before dispatch().
+        """
+        replies = self.record_inbound(msg)
+        if msg.get(35) == b'2':
+            replies.extend(self.on_resend_request(msg))
+        return replies
+
+    def on_resend_request(self, msg):
+        """
+        Return list of frames answering a ResendRequest (2): stored application messages
+        re-stamped as PossDup, and SequenceReset-GapFill for admin messages and frames
+        no longer in the store. EndSeqNo (16) = 0 means up to the last frame sent.
+        """
+        BeginSeqNo = int(msg.get(7))
+        EndSeqNo = int(msg.get(16)) or self.session.seq_num
+        sendingTime = self.clock.now_bytes()
+
+        frames = []
+        gap_start = None
+
+        for seq in range(BeginSeqNo, EndSeqNo + 1):
+            stored = self.store.get(seq) if self.store is not None else None
+
+            if stored is None or stored[1]:
+                if gap_start is None:
+                    gap_start = seq
+                continue
+
+            if gap_start is not None:
+                frames.append(EncodedMessage(self.sequence_reset_msg(gap_start, seq).encode()))
+                gap_start = None
+
+            frames.append(EncodedMessage(possdup_frame(stored[0], sendingTime)))
+
+        if gap_start is not None:
+            frames.append(EncodedMessage(self.sequence_reset_msg(gap_start, EndSeqNo + 1).encode()))
+
+        return frames
+
     def unsubscribe_bid_ask_data_request_msg(self, prod, MDReqID, max_depth=5):
         """
         Return MarketDataRequest Unsubscribe message .
         """
-        msg = self.header_msg("V")
-        msg.append_pair(262, MDReqID)  # MDReqID                           (262) = MDReqIDtemp
-        msg.append_pair(263, "2")  # SubscriptionRequestType               (263) = (2) Disable previous Snapshot + Update Request (Unsubscribe)
-        msg.append_pair(264, str(max_depth))  # MarketDepth                (264) = (5) Book depth (default)
-        msg.append_pair(265, "0")  # MDUpdateType                          (265) = (0) Full refresh # TODO revisar
-        msg.append_pair(266, "Y")  # AggregatedBook                        (266) = (Y) Book entries to be aggregated
-        msg.append_pair(7118, "D")  # TODO no se de donde salió esto
-        msg.append_pair(146, "1")  # NoRelatedSym                          (146) = (1) N° of repeating symbols specified
-        msg.append_pair(55, prod)  # Symbol                                 (55) = (prod) Ticker symbol
-        msg.append_pair(267, "2")  # NoMDEntryTypes                        (267) = (2) N° of MDEntryType (269) requested
-        msg.append_pair(269, "0")  # MDEntryType                           (269) = (0) Bid
-        msg.append_pair(269, "1")  # MDEntryType                           (269) = (1) Offer
-        return msg
+        self.md_subscriptions.pop(MDReqID, None)
+        return self._market_data_request(MDReqID, "2", (prod,), BID_OFFER, max_depth)
 
     def trade_report_msg(self):
         """
         Return TradeCaptureReportRequest message.
         """
-        global TradeRequestID
-        TradeRequestID[0] += 1
-
         msg = self.header_msg("AD")
-        msg.append_pair(568, TradeRequestID[0])  # TradeRequestID          (568) = TradeRequestID
+        msg.append_pair(568, self.session.next_trade_request_id())  # TradeRequestID (568) = TradeRequestID
         msg.append_pair(569, 1)  # TradeRequestType                        (569) = (1) Matched trades matching criteria provided on request
         msg.append_pair(828, 0)  # TrdType                                 (828) = (0) Regular Trade
         msg.append_pair(830, 'AccountDetail')  # TransferReason            (830) = Reason trade is being transferred
         msg.append_pair(453, 1)  # NoPartyIDs                              (453) = Number of PartyID
-        msg.append_pair(448, PartyID[0])  # PartyID                        (448) = PartyIDrtyID[0])
+        msg.append_pair(448, self.session.party_id)  # PartyID                        (448) = PartyIDrtyID[0])
         msg.append_pair(447, "D")  # PartyIDSource                         (447) = (D) Proprietary / Custom code
         msg.append_pair(452, 24)  # PartyRole                              (452) = (24) Customer Account
         return msg
@@ -290,19 +704,56 @@ class FIXEngine(object):
         """
         return msg.get(55).decode("cp1252")
 
-    def extract_symbol_tick(self, symbol, list_market):
+    def update_security_list(self, msg):
+        """
+        Merge SecurityList (y) or SecurityListUpdateReport (BK) message into security_list.
+        """
+        return self.security_list.update(msg)
+
+    def _security_index(self, list_market):
+        """
+        Return SecurityListIndex for list_market.
+        None uses security_list; a raw list string is indexed once and reused while unchanged.
+        """
+        if list_market is None:
+            return self.security_list
+
+        if isinstance(list_market, SecurityListIndex):
+            return list_market
+
+        source, index = self._list_market
+        if list_market is not source:
+            if isinstance(list_market, str):
+                index = SecurityListIndex(list_market.encode("cp1252"))
+            else:
+                index = SecurityListIndex(list_market)
+            self._list_market = (list_market, index)
+
+        return index
+
+    def extract_symbol_tick(self, symbol, list_market=None):
         """
         Return Tick for a Ticker Symbol from market.
         """
-        symbol_tick = float(re.search(re.compile('.*\x01107=' + symbol + '\x01969=(.+?)\x01.*'), list_market).group(1))
-        return symbol_tick
+        return self._security_index(list_market)[symbol].tick_size
 
-    def symbol_right(self, symbol, list_market):
+    def symbol_right(self, symbol, list_market=None):
         """
         Return True if Ticker Symbol exists in market, False otherwise.
         """
-        symbol_right = symbol in re.findall(r'\x01107=(.*?)\x01', list_market)
-        return symbol_right
+        return symbol in self._security_index(list_market)
+
+    def decode_execution_report(self, msg):
+        """
+        Return ExecutionReport record (OrderID, ClOrdID, quantities, prices...) decoded in one pass.
+        """
+        return ExecutionReport.decode(msg)
+
+    def decode_trade_capture_reports(self, msgs):
+        """
+        Return list of TradeCaptureReport records for a list of messages or a buffer of concatenated frames.
+        """
+        return TradeCaptureReport.decode_all(msgs)
 
     def extract_OrderID(self, msg):
         """
@@ -373,75 +824,159 @@ class FIXEngine(object):
 
     def extract_msg_type(self, msg):
         """
-        Return MsgType, extracted from FIX message.
+        Return MsgType name, extracted from FIX message ('' if unknown).
         AD = TradeCaptureReportRequest
         y = SecurtityList
+        8 = ExecutionReport
         9 = ERROR_order
         3 = ERROR_msj
         0 = Heartbeat
         W = MarketDataSnapshotFullRefresh
-        or ExecutionReport
+        X = MarketDataIncrementalRefresh
+        See fixdispatch.MSG_TYPES for the full table.
         """
-        msg_type = ''
-
-        if msg.get(35) == b'AD':
-            msg_type = 'TradeCaptureReportRequest'
-
-        elif msg.get(35) == b'y':
-            msg_type = 'SecurtityList'
+        msg_type = msg.get(35)
+        return MSG_TYPES.get(bytes(msg_type), '') if msg_type is not None else ''
 
-        elif msg.get(35) == b'9':
-            msg_type = 'ERROR_order'
+    def dispatch(self, msg):
+        """
+        Route inbound message to the handler registered in dispatcher for its MsgType.
+        Neither sequenced nor answered here: the transport runs session_level() first.
+        """
+        msg_type = msg.get(35)
+        if msg_type == b'8':
+            self.track_order(msg)
 
-        elif msg.get(35) == b'3':
-            msg_type = 'ERROR_msj'
+        latency = self.latency
+        if latency is None:
+            return self.dispatcher.dispatch(msg)
 
-        elif msg.get(35) == b'0':
-            msg_type = 'Heartbeat'
+        entry_ns = time.perf_counter_ns()
+        result = self.dispatcher.dispatch(msg)
+        latency.handler(msg, msg_type, entry_ns, time.perf_counter_ns())
+        return result
 
-        elif msg.get(35) == b'W':
-            msg_type = 'MarketDataSnapshotFullRefresh'
+    def track_order(self, msg):
+        """
+        Add/remove the order of ExecutionReport msg in open_orders according to its OrdStatus (39).
+        """
+        OrderID = msg.get(37)
+        OrdStatus = msg.get(39)
+        if OrderID is None or OrdStatus is None or OrderID == b'NONE':
+            return
 
+        OrderID = bytes(OrderID)
+        if OrdStatus in ORD_STATUS_DONE:
+            self.open_orders.pop(OrderID, None)
         else:
-            try:
-                if b'Operada' in msg.get(58):
-                    msg_type = 'ExecutionReport'
-            except:
-                pass
-
-        return msg_type
+            self.open_orders[OrderID] = (bytes(msg.get(55)), bytes(msg.get(54)))
+
+    def _book(self, symbol):
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = FIXOrderBook(symbol)
+        return book
+
+    def _flag_resync(self, symbol):
+        if symbol not in self._md_resync_pending:
+            self.md_resync.add(symbol)
+
+    def on_market_data_snapshot(self, msg):
+        """
+        Replace the book of every symbol in a MarketDataSnapshotFullRefresh (W) message.
+        Entries without Symbol (55) are dropped (md_rejected). Return set of symbols loaded.
+        """
+        frame = tokenize(msg)
+        symbol = frame.get(55)
+        loaded = set()
+
+        if 10 in frame.index and not frame.checksum_ok():
+            if symbol is not None:
+                self._flag_resync(bytes(symbol).decode("cp1252"))
+                self._request_resync()
+            return loaded
+
+        if symbol is not None:
+            symbol = bytes(symbol).decode("cp1252")
+            self._book(symbol).clear()
+            loaded.add(symbol)
+
+        for symbol, action, entry_type, price, size, rpt_seq in md_entries(frame):
+            if symbol is None:
+                self.md_rejected += 1
+                continue
+            book = self._book(symbol)
+            if symbol not in loaded:
+                book.clear()
+                loaded.add(symbol)
+            book.apply(action, entry_type, price, size, rpt_seq)
+
+        for symbol in loaded:
+            self._md_resync_pending.pop(symbol, None)
+            self.md_resync.discard(symbol)
+
+        return loaded
+
+    def on_market_data_reject(self, msg):
+        """
+        Handle MarketDataRequestReject (Y). A rejected resync snapshot request no longer holds its
+        book pending: the book is flagged in md_resync again, requested with the next market data
+        (not at once, so a request rejected every time is not resent in a loop).
+        Return symbol of the rejected resync request, None if it was another request.
+        """
+        MDReqID = msg.get(262)
+        if MDReqID is None:
+            return None
+
+        MDReqID = bytes(MDReqID)
+        for symbol, (pending_id, _) in list(self._md_resync_pending.items()):
+            if str(pending_id).encode() == MDReqID:
+                del self._md_resync_pending[symbol]
+                self.md_resync.add(symbol)
+                reason = msg.get(58) or msg.get(281) or b''
+                self.log.warning('FIXEngine: snapshot request for %s (MDReqID %s) rejected: %s',
+                                 symbol, MDReqID.decode('cp1252'), bytes(reason).decode('cp1252'))
+                return symbol
+        return None
+
+    def on_market_data_incremental(self, msg):
+        """
+        Apply every MDUpdateAction of a MarketDataIncrementalRefresh (X) message to books.
+        Frames with a bad CheckSum, RptSeq gaps and updates of unknown levels flag the symbol
+        in md_resync; its book ignores updates until the snapshot arrives, requested right away
+        through resync_send when set (see market_data_resync_msgs). Entries without Symbol (55)
+        are dropped (md_rejected). Return set of symbols updated.
+        """
+        frame = tokenize(msg)
+        valid = 10 not in frame.index or frame.checksum_ok()
+        updated = set()
+
+        for symbol, action, entry_type, price, size, rpt_seq in md_entries(frame):
+            if symbol is None:
+                self.md_rejected += 1
+                continue
+            book = self._book(symbol)
+
+            if valid and book.consistent and book.apply(action, entry_type, price, size, rpt_seq):
+                updated.add(symbol)
+            else:
+                book.consistent = False
+                updated.discard(symbol)
+                self._flag_resync(symbol)
+
+        self._request_resync()
+        return updated
 
     def extract_market_changes(self, msg):
         """
-        Return bid_book and ask_book (max_depth=5) provided by server in FIX message.
+        Return bid_book and ask_book (max_depth=5) provided by server in FIX message,
+        as lists of (price, size) float tuples (str tuples before the tokenizer: no str is built).
+        Accepts a simplefix message, a raw frame or a FIXFrame index.
         """
-        mqt_data_list = msg.encode().decode("cp1252").split('\x01269=')
-        bid_book = []
-        ask_book = []
-
-        if len(mqt_data_list) > 1:
-
-            for msg_parse in mqt_data_list[1:]:
-
-                if msg_parse[0] == '0':
-                    data = re.match(r'.*\x01270=(.+?)\x01271=(.+?)\x01.*', msg_parse)
+        return book_levels(msg, 5)
 
-                    if data:
-                        bid_book.append(data.group(1, 2))
-
-                if msg_parse[0] == '1':
-                    data = re.match(r'.*\x01270=(.+?)\x01271=(.+?)\x01.*', msg_parse)
-
-                    if data:
-                        ask_book.append(data.group(1, 2))
-
-        bid_book.sort(key=lambda tup: float(tup[0]), reverse=True)
-        ask_book.sort(key=lambda tup: float(tup[0]))
-
-        if len(bid_book) > 5:
-            bid_book = bid_book[:5]
-
-        if len(ask_book) > 5:
-            ask_book = ask_book[:5]
-
-        return bid_book, ask_book
+    def extract_market_levels(self, msg, max_depth=5):
+        """
+        Return bid_px, bid_qty, ask_px, ask_qty arrays (best level first) provided by server in FIX message.
+        """
+        return market_levels(msg, max_depth)
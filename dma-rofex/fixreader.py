@@ -0,0 +1,277 @@
+"""
+Dedicated socket reader: streaming frame assembly and a bounded inbound queue.
+
+CLASSES:
+FrameAssembler ---------------------------- Split a byte stream into complete FIX frames.
+
+    FIELDS:
+    bad_frames ---------------------------- Frames dropped for a malformed BodyLength or a wrong CheckSum.
+    buffer -------------------------------- Bytes received and not yet framed.
+
+    METHODS:
+    feed() -------------------------------- Append received bytes, return list of complete frames.
+
+SPSCQueue --------------------------------- Bounded single-producer/single-consumer ring queue.
+
+    FIELDS:
+    capacity ------------------------------ Maximum items queued.
+    full_waits ---------------------------- Times the producer had to wait for room.
+    high_water_mark ----------------------- Maximum items queued at once.
+
+    METHODS:
+    get() --------------------------------- Return next item, waiting up to timeout (None if none).
+    get_nowait() -------------------------- Return next item or None.
+    put() --------------------------------- Queue item, waiting for room if full.
+    stats() ------------------------------- Return dict of queue metrics.
+
+ReaderThread ------------------------------ Thread owning the socket reads.
+
+    FIELDS:
+    assembler ----------------------------- FrameAssembler of the stream.
+    bytes_received ------------------------ Bytes read from the socket.
+    latency ------------------------------- LatencyRecorder stamping frames with their read time (None = off).
+    queue --------------------------------- SPSCQueue of FIXFrame objects for the strategy thread.
+
+    METHODS:
+    stop() -------------------------------- Finish the thread: unblock its read and join it.
+"""
+
+import socket
+import threading
+import time
+
+from fixtokenizer import FIXFrame
+
+
+class FrameAssembler(object):
+    """
+    Reassemble FIX frames from arbitrary chunks of a stream.
+    A frame ends BodyLength (9) bytes after the BodyLength field, plus the 7 byte CheckSum field.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.bad_frames = 0
+
+    def feed(self, data):
+        """
+        Append data, return list of complete frames (bytes) with a valid CheckSum.
+        """
+        buf = self.buffer
+        buf += data
+        frames = []
+        pos = 0
+        size = len(buf)
+
+        while True:
+            start = buf.find(b'8=', pos)
+            if start < 0:
+                pos = max(pos, size - 1)  # keep a trailing '8'
+                break
+
+            length_start = buf.find(b'\x019=', start)
+            length_end = buf.find(b'\x01', length_start + 3) if length_start >= 0 else -1
+            if length_end < 0:
+                pos = start
+                break
+
+            try:
+                end = length_end + 1 + int(buf[length_start + 3:length_end]) + 7
+            except ValueError:
+                self.bad_frames += 1
+                pos = start + 2
+                continue
+
+            if end > size:
+                pos = start
+                break
+
+            frame = bytes(buf[start:end])
+            checksum = frame[-4:-1]
+            if frame[-7:-4] != b'10=' or not checksum.isdigit() or sum(frame[:-7]) % 256 != int(checksum):
+                self.bad_frames += 1
+                pos = start + 2
+                continue
+
+            frames.append(frame)
+            pos = end
+
+        del buf[:pos]
+        return frames
+
+
+class SPSCQueue(object):
+    """
+    Bounded ring queue for exactly one producer and one consumer thread.
+
+    The producer only advances tail and the consumer only advances head, so neither
+    put() nor get_nowait() takes a lock. A consumer blocked in get() is woken through
+    an Event that the producer only touches while the consumer is waiting.
+    """
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._head = 0
+        self._tail = 0
+        self._waiting = False
+        self._event = threading.Event()
+
+        self.high_water_mark = 0
+        self.full_waits = 0
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def put(self, item):
+        """
+        Queue item. When full, wait for the consumer instead of dropping (backpressure to the socket).
+        """
+        tail = self._tail
+        while tail - self._head >= self.capacity:
+            self.full_waits += 1
+            time.sleep(0.0001)
+
+        self._items[tail % self.capacity] = item
+        self._tail = tail + 1
+
+        depth = tail + 1 - self._head
+        if depth > self.high_water_mark:
+            self.high_water_mark = depth
+
+        if self._waiting:
+            self._event.set()
+
+    def get_nowait(self):
+        """
+        Return next item, None if the queue is empty.
+        """
+        head = self._head
+        if head == self._tail:
+            return None
+
+        index = head % self.capacity
+        item = self._items[index]
+        self._items[index] = None
+        self._head = head + 1
+        return item
+
+    def get(self, timeout=None):
+        """
+        Return next item, waiting up to timeout seconds (None waits forever). None on timeout.
+        """
+        item = self.get_nowait()
+        if item is not None:
+            return item
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._event.clear()
+            self._waiting = True
+            item = self.get_nowait()
+            if item is not None:
+                self._waiting = False
+                return item
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                self._waiting = False
+                return None
+
+            self._event.wait(remaining)
+            self._waiting = False
+
+    def stats(self):
+        """
+        Return dict with depth, capacity, high_water_mark and full_waits.
+        """
+        return {
+            'depth': len(self),
+            'capacity': self.capacity,
+            'high_water_mark': self.high_water_mark,
+            'full_waits': self.full_waits,
+        }
+
+
+class ReaderThread(threading.Thread):
+    """
+    Own the socket reads of a Connection.
+
+    Reads into one reusable bytearray, assembles complete frames, tokenizes them
+    (FIXFrame) and pushes them onto queue. The strategy thread consumes queue, so
+    handler latency never delays the socket. on_frame(frame) is called on this
+    thread for every frame before it is queued (e.g. session level bookkeeping),
+    on_disconnect(ex) when the socket fails or is closed by the peer.
+    """
+
+    def __init__(self, sock, queue=None, chunk_size=65536, on_frame=None, on_disconnect=None):
+        threading.Thread.__init__(self, name='FIXReader', daemon=True)
+        self.sock = sock
+        self.queue = queue if queue is not None else SPSCQueue()
+        self.assembler = FrameAssembler()
+        self.on_frame = on_frame
+        self.on_disconnect = on_disconnect
+        self.bytes_received = 0
+        self.latency = None
+
+        self._chunk = bytearray(chunk_size)
+        self._running = True
+
+    def stop(self, timeout=5.0):
+        """
+        Finish the thread: shut the socket down so a blocked read returns, and join it (up to
+        timeout seconds). Called from the thread itself (e.g. a reconnect started by on_frame)
+        it only asks it to finish: the loop exits once on_frame returns, without on_disconnect
+        and without handling or queueing the frames left in the chunk already read.
+        Return True if the thread has finished (it then never touches queue again).
+        """
+        self._running = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, ValueError):
+            pass
+
+        if self.ident is not None and threading.current_thread() is not self:
+            self.join(timeout)
+
+        return not self.is_alive()
+
+    def run(self):
+        view = memoryview(self._chunk)
+        recv_into = self.sock.recv_into
+        feed = self.assembler.feed
+        put = self.queue.put
+        on_frame = self.on_frame
+        error = None
+
+        while self._running:
+            try:
+                n = recv_into(view)
+            except socket.timeout:
+                continue
+            except OSError as ex:
+                error = ex
+                break
+
+            if not n:
+                break
+
+            self.bytes_received += n
+            latency = self.latency
+            if latency is not None:
+                recv_ns = time.perf_counter_ns()
+                wall_ns = time.time_ns()
+
+            for raw in feed(view[:n]):
+                if not self._running:
+                    break
+                frame = FIXFrame(raw)
+                if latency is not None:
+                    frame.recv_ns = recv_ns
+                    latency.frame_parsed(frame, wall_ns)
+                if on_frame is not None:
+                    on_frame(frame)
+                put(frame)
+
+        if self._running and self.on_disconnect is not None:
+            self.on_disconnect(error)
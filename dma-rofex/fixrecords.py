@@ -0,0 +1,291 @@
+"""
+Typed records decoded from FIX application messages in a single pass.
+
+CLASSES:
+ExecutionReport --------------------------- ExecutionReport (35=8) fields, parsed and typed once.
+TradeCaptureReport ------------------------ TradeCaptureReport (35=AE) fields, parsed and typed once.
+TradeSide --------------------------------- One entry of the TradeCaptureReport NoSides (552) group.
+
+    METHODS (all):
+    decode() ------------------------------ Return record for one message.
+    decode_all() -------------------------- Return records for a batch of messages or a buffer of concatenated frames.
+"""
+
+from fixtokenizer import FIXFrame
+
+
+def _str(value):
+    return bytes(value).decode('cp1252')
+
+
+def _qty(value):
+    return int(float(value))
+
+
+def _id(value):
+    """
+    Numeric IDs as int (as extract_ClOrdID does), anything else as str.
+    """
+    value = bytes(value)
+    return int(value) if value.isdigit() else value.decode('cp1252')
+
+
+def _fields(message):
+    """
+    Yield (tag, value) of a FIXFrame (int tags) or a simplefix message (bytes tags).
+    """
+    if isinstance(message, FIXFrame):
+        buf = message.buf
+        starts = message.starts
+        ends = message.ends
+        for i, tag in enumerate(message.tags):
+            yield tag, buf[starts[i]:ends[i]]
+    else:
+        for tag, value in message.pairs:
+            yield tag, value
+
+
+class _Record(object):
+    """
+    Record with one slot per mapped tag. FIELDS maps tag -> (slot, converter).
+    """
+
+    __slots__ = ()
+    FIELDS = {}
+
+    def __init__(self, *values):
+        for slot, value in zip(self.__slots__, values or (None,) * len(self.__slots__)):
+            setattr(self, slot, value)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__,
+                           ', '.join('%s=%r' % (slot, getattr(self, slot)) for slot in self.__slots__))
+
+    @classmethod
+    def _index(cls):
+        """
+        Return tag -> (slot position, converter), keyed by int and by bytes tag.
+        """
+        index = cls.__dict__.get('_INDEX')
+        if index is None:
+            index = {}
+            for tag, (slot, converter) in cls.FIELDS.items():
+                index[tag] = index[str(tag).encode('ASCII')] = (cls.__slots__.index(slot), converter)
+            setattr(cls, '_INDEX', index)
+        return index
+
+    @classmethod
+    def _decode_into(cls, values, message, index):
+        if isinstance(message, FIXFrame):
+            buf = message.buf
+            starts = message.starts
+            ends = message.ends
+            for i, tag in enumerate(message.tags):
+                field = index.get(tag)
+                if field is not None:
+                    values[field[0]] = field[1](buf[starts[i]:ends[i]])
+        else:
+            # simplefix message: pairs of (bytes tag, bytes value).
+            for tag, value in message.pairs:
+                field = index.get(tag)
+                if field is not None:
+                    values[field[0]] = field[1](value)
+
+    @classmethod
+    def decode(cls, message):
+        """
+        Return record with every mapped field of message parsed and typed.
+        """
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            message = FIXFrame(message)
+
+        values = [None] * len(cls.__slots__)
+        cls._decode_into(values, message, cls._index())
+        return cls(*values)
+
+    @classmethod
+    def decode_all(cls, messages):
+        """
+        Return list of records for an iterable of messages, or for a single buffer
+        (bytes or FIXFrame) holding several concatenated frames, tokenized once.
+        """
+        if not isinstance(messages, (bytes, bytearray, memoryview, FIXFrame)):
+            return [cls.decode(message) for message in messages]
+
+        if not isinstance(messages, FIXFrame):
+            messages = FIXFrame(messages)
+
+        index = cls._index()
+        size = len(cls.__slots__)
+        buf = messages.buf
+        starts = messages.starts
+        ends = messages.ends
+        records = []
+        values = None
+
+        for i, tag in enumerate(messages.tags):
+            if tag == 8:
+                # BeginString starts the next frame.
+                if values is not None:
+                    records.append(cls(*values))
+                values = [None] * size
+                continue
+
+            field = index.get(tag)
+            if field is not None and values is not None:
+                values[field[0]] = field[1](buf[starts[i]:ends[i]])
+
+        if values is not None:
+            records.append(cls(*values))
+
+        return records
+
+
+class ExecutionReport(_Record):
+    """
+    ExecutionReport (35=8).
+    """
+
+    __slots__ = ('order_id', 'cl_ord_id', 'orig_cl_ord_id', 'exec_id', 'exec_type', 'ord_status', 'symbol', 'side',
+                 'order_qty', 'price', 'last_qty', 'last_px', 'cum_qty', 'leaves_qty', 'avg_px', 'text',
+                 'transact_time')
+
+    FIELDS = {
+        37: ('order_id', _str),          # OrderID
+        11: ('cl_ord_id', _id),          # ClOrdID
+        41: ('orig_cl_ord_id', _id),     # OrigClOrdID
+        17: ('exec_id', _str),           # ExecID
+        150: ('exec_type', _str),        # ExecType
+        39: ('ord_status', _str),        # OrdStatus
+        55: ('symbol', _str),            # Symbol
+        54: ('side', _str),              # Side
+        38: ('order_qty', _qty),         # OrderQty
+        44: ('price', float),            # Price
+        32: ('last_qty', _qty),          # LastQty
+        31: ('last_px', float),          # LastPx
+        14: ('cum_qty', _qty),           # CumQty
+        151: ('leaves_qty', _qty),       # LeavesQty
+        6: ('avg_px', float),            # AvgPx
+        58: ('text', _str),              # Text
+        60: ('transact_time', _str),     # TransactTime
+    }
+
+
+class TradeSide(_Record):
+    """
+    One side of a trade: an entry of the NoSides (552) group, started by Side (54).
+    """
+
+    __slots__ = ('side', 'order_id', 'cl_ord_id', 'account')
+
+    FIELDS = {
+        54: ('side', _str),              # Side
+        37: ('order_id', _str),          # OrderID
+        11: ('cl_ord_id', _id),          # ClOrdID
+        1: ('account', _str),            # Account
+    }
+
+
+class TradeCaptureReport(_Record):
+    """
+    TradeCaptureReport (35=AE).
+
+    sides holds a TradeSide per entry of the NoSides (552) group; side, order_id,
+    cl_ord_id and account are those of the first side. A report without the group
+    (Side/OrderID/ClOrdID/Account in the body) has those as its only side.
+    """
+
+    __slots__ = ('trade_report_id', 'exec_id', 'order_id', 'cl_ord_id', 'symbol', 'side', 'last_qty', 'last_px',
+                 'trade_date', 'transact_time', 'account', 'sides')
+
+    FIELDS = {
+        571: ('trade_report_id', _str),  # TradeReportID
+        17: ('exec_id', _str),           # ExecID
+        37: ('order_id', _str),          # OrderID
+        11: ('cl_ord_id', _id),          # ClOrdID
+        55: ('symbol', _str),            # Symbol
+        54: ('side', _str),              # Side
+        32: ('last_qty', _qty),          # LastQty
+        31: ('last_px', float),          # LastPx
+        75: ('trade_date', _str),        # TradeDate
+        60: ('transact_time', _str),     # TransactTime
+        1: ('account', _str),            # Account
+    }
+
+    @classmethod
+    def _decode_into(cls, values, message, index):
+        cls._decode_fields(values, _fields(message), index)
+
+    @classmethod
+    def _decode_fields(cls, values, fields, index):
+        side_index = TradeSide._index()
+        sides = []
+        side = None
+        in_group = False
+
+        for tag, value in fields:
+            if in_group:
+                field = side_index.get(tag)
+                if field is not None:
+                    if field[0] == 0:
+                        # Side (54) starts the next entry.
+                        side = [None] * len(TradeSide.__slots__)
+                        sides.append(side)
+                    if side is not None:
+                        side[field[0]] = field[1](value)
+                    continue
+            elif tag == 552 or tag == b'552':
+                in_group = True
+                continue
+
+            field = index.get(tag)
+            if field is not None:
+                values[field[0]] = field[1](value)
+
+        slots = cls.__slots__
+        if sides:
+            sides = [TradeSide(*side) for side in sides]
+            for slot in TradeSide.__slots__:
+                position = slots.index(slot)
+                if values[position] is None:
+                    values[position] = getattr(sides[0], slot)
+        else:
+            flat = [values[slots.index(slot)] for slot in TradeSide.__slots__]
+            sides = [TradeSide(*flat)] if any(value is not None for value in flat) else []
+
+        values[slots.index('sides')] = sides
+
+    @classmethod
+    def decode_all(cls, messages):
+        """
+        Return list of records for an iterable of messages, or for a single buffer
+        (bytes or FIXFrame) holding several concatenated frames, tokenized once.
+        """
+        if not isinstance(messages, (bytes, bytearray, memoryview, FIXFrame)):
+            return [cls.decode(message) for message in messages]
+
+        if not isinstance(messages, FIXFrame):
+            messages = FIXFrame(messages)
+
+        index = cls._index()
+        size = len(cls.__slots__)
+        records = []
+        frame = None
+
+        for tag, value in _fields(messages):
+            if tag == 8:
+                # BeginString starts the next frame.
+                if frame is not None:
+                    values = [None] * size
+                    cls._decode_fields(values, frame, index)
+                    records.append(cls(*values))
+                frame = []
+            elif frame is not None:
+                frame.append((tag, value))
+
+        if frame is not None:
+            values = [None] * size
+            cls._decode_fields(values, frame, index)
+            records.append(cls(*values))
+
+        return records
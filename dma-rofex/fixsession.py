@@ -0,0 +1,192 @@
+"""
+State of one FIX session.
+
+CLASSES:
+FIXSession -------------------------------- Identity and counters of one FIX session, owned by a FIXEngine.
+
+    FIELDS:
+    account ------------------------------- Trading account.
+    cl_ord_id ----------------------------- Last ClOrdID allocated.
+    md_req_id ----------------------------- Last MDReqID allocated.
+    party_id ------------------------------ PartyID (448) sent in order and report messages.
+    password ------------------------------ Logon Password (554).
+    sender_comp_id ------------------------ SenderCompID (49).
+    seq_num ------------------------------- Last outbound MsgSeqNum.
+    seq_num_server ------------------------ Last inbound MsgSeqNum.
+    target_comp_id ------------------------ TargetCompID (56).
+    test_req_id --------------------------- Last TestReqID allocated.
+    trade_request_id ---------------------- Last TradeRequestID allocated.
+    user ---------------------------------- OnBehalfOfCompID (115).
+    username ------------------------------ Logon Username (553).
+    xchange_name -------------------------- DeliverToCompID (128).
+
+    METHODS:
+    from_globals() ------------------------ Return GlobalsSession, reading and writing the global_queue values live.
+    identity() ---------------------------- Return the header/party values pre-encoded in order templates.
+    next_cl_ord_id() ---------------------- Allocate ClOrdID.
+    next_md_req_id() ---------------------- Allocate MDReqID.
+    next_seq_num() ------------------------ Allocate outbound MsgSeqNum.
+    next_test_req_id() -------------------- Allocate TestReqID.
+    next_trade_request_id() --------------- Allocate TradeRequestID.
+    note_cl_ord_id() ---------------------- Advance cl_ord_id past a ClOrdID allocated by the caller.
+
+GlobalsSession ---------------------------- FIXSession whose fields are the global_queue values (live).
+"""
+
+from threading import Lock
+
+import global_queue
+
+# Lock of the global_queue counters (see GlobalsSession).
+_GLOBALS_LOCK = Lock()
+
+
+class FIXSession(object):
+    """
+    Identity and counters of one FIX session.
+
+    Every FIXEngine owns one, so several sessions/accounts (e.g. the Futures_Users
+    one) can run in the same process. Counters are allocated under a per-session
+    lock, so IDs are unique across the threads sharing a session.
+
+    sender_comp_id, username and password have no default: FIXEngine.logon()
+    raises ValueError while any of them is empty.
+    """
+
+    def __init__(self, user='', party_id='', account=0, xchange_name='',
+                 sender_comp_id='', target_comp_id="ROFX", username='', password='',
+                 seq_num=0, seq_num_server=1, cl_ord_id=1, md_req_id=1, test_req_id=1, trade_request_id=1):
+        self.user = user
+        self.party_id = party_id
+        self.account = account
+        self.xchange_name = xchange_name
+        self.sender_comp_id = sender_comp_id
+        self.target_comp_id = target_comp_id
+        self.username = username
+        self.password = password
+
+        self.seq_num = seq_num
+        self.seq_num_server = seq_num_server
+        self.cl_ord_id = cl_ord_id
+        self.md_req_id = md_req_id
+        self.test_req_id = test_req_id
+        self.trade_request_id = trade_request_id
+
+        self.lock = Lock()
+
+    @staticmethod
+    def from_globals():
+        """
+        Return GlobalsSession: identity and counters are the global_queue values, read when
+        each message is built (set them at any time, as before sessions existed).
+        """
+        return GlobalsSession()
+
+    def identity(self):
+        """
+        Return (sender_comp_id, target_comp_id, user, xchange_name, party_id).
+        """
+        return self.sender_comp_id, self.target_comp_id, self.user, self.xchange_name, self.party_id
+
+    def next_seq_num(self):
+        """
+        Return next outbound MsgSeqNum.
+        """
+        with self.lock:
+            self.seq_num += 1
+            return self.seq_num
+
+    def next_cl_ord_id(self):
+        """
+        Return next ClOrdID.
+        """
+        with self.lock:
+            self.cl_ord_id += 1
+            return self.cl_ord_id
+
+    def next_md_req_id(self):
+        """
+        Return next MDReqID.
+        """
+        with self.lock:
+            self.md_req_id += 1
+            return self.md_req_id
+
+    def next_test_req_id(self):
+        """
+        Return next TestReqID.
+        """
+        with self.lock:
+            self.test_req_id += 1
+            return self.test_req_id
+
+    def next_trade_request_id(self):
+        """
+        Return next TradeRequestID.
+        """
+        with self.lock:
+            self.trade_request_id += 1
+            return self.trade_request_id
+
+    def note_cl_ord_id(self, cl_ord_id):
+        """
+        Advance cl_ord_id to cl_ord_id (allocated by the caller, e.g. from the global ClOrdID
+        counter) if higher, so next_cl_ord_id() and store checkpoints never fall behind it.
+        """
+        try:
+            cl_ord_id = int(cl_ord_id)
+        except (TypeError, ValueError):
+            return
+
+        if cl_ord_id > self.cl_ord_id:
+            with self.lock:
+                if cl_ord_id > self.cl_ord_id:
+                    self.cl_ord_id = cl_ord_id
+
+
+def _global_field(name):
+    # global_queue values are one element lists, updated in place by the scripts.
+    def get_value(self):
+        return getattr(global_queue, name)[0]
+
+    def set_value(self, value):
+        getattr(global_queue, name)[0] = value
+
+    return property(get_value, set_value)
+
+
+class GlobalsSession(FIXSession):
+    """
+    FIXSession of the single-session scripts: every field reads and writes its
+    global_queue value (User, PartyID, ClOrdID, seq_num, ...) when used. Counters
+    are allocated under a lock of their own, shared by every GlobalsSession (they
+    share the counters), never global_queue.lk: a script holding lk while it builds
+    a message would deadlock on it (it is not reentrant).
+    TargetCompID falls back to "ROFX" while the global is empty.
+    """
+
+    user = _global_field('User')
+    party_id = _global_field('PartyID')
+    account = _global_field('account')
+    xchange_name = _global_field('xchange_name')
+    sender_comp_id = _global_field('SenderCompID')
+    username = _global_field('Username')
+    password = _global_field('Password')
+
+    seq_num = _global_field('seq_num')
+    seq_num_server = _global_field('seq_num_server')
+    cl_ord_id = _global_field('ClOrdID')
+    md_req_id = _global_field('MDReqID')
+    test_req_id = _global_field('TestReqID')
+    trade_request_id = _global_field('TradeRequestID')
+
+    def __init__(self):
+        self.lock = _GLOBALS_LOCK
+
+    @property
+    def target_comp_id(self):
+        return global_queue.TargetCompID[0] or "ROFX"
+
+    @target_comp_id.setter
+    def target_comp_id(self, value):
+        global_queue.TargetCompID[0] = value
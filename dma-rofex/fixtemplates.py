@@ -0,0 +1,161 @@
+"""
+Pre-encoded FIX message templates.
+
+CLASSES:
+DeferredMessage --------------------------- Template message rendered when sent (MsgSeqNum allocated then).
+EncodedMessage ---------------------------- Encoded FIX frame usable wherever a simplefix message is sent.
+MessageTemplate --------------------------- Static bytes of a message type with slots for the variable fields.
+
+    FIELDS:
+    chunks -------------------------------- Static bytes between variable fields.
+    static_len ---------------------------- Length of all static body bytes.
+    static_sum ---------------------------- Byte sum of all static body bytes.
+
+    METHODS:
+    render() ------------------------------ Return encoded frame for the given variable values.
+
+SendingTimeClock -------------------------- SendingTime (52) string cached per millisecond.
+
+    METHODS:
+    now() --------------------------------- Return current SendingTime as str.
+    now_bytes() --------------------------- Return current SendingTime as bytes.
+
+FUNCTIONS:
+fix_val() --------------------------------- Encode a value the same way simplefix does.
+"""
+
+import time
+from datetime import datetime
+
+from fixtokenizer import FIXFrame
+
+
+def fix_val(value):
+    """
+    Return value encoded as FIX bytes (same rules as simplefix.FixMessage.append_pair).
+    """
+    if type(value) is bytes:
+        return value
+
+    if type(value) is str:
+        return value.encode('UTF-8')
+
+    return str(value).encode('ASCII')
+
+
+class EncodedMessage(bytes):
+    """
+    Already encoded FIX frame.
+    encode() returns the frame itself so Connection.send treats it like a simplefix message.
+    """
+
+    def encode(self):
+        return bytes(self)
+
+    def get(self, tag, nth=1):
+        return FIXFrame(bytes(self)).get(tag, nth)
+
+
+class DeferredMessage(object):
+    """
+    Template message whose MsgSeqNum and SendingTime are allocated when it is encoded
+    (FIXEngine.stamp), not when it is built.
+    """
+
+    __slots__ = ('engine', 'tag', 'values')
+
+    def __init__(self, engine, tag, values):
+        self.engine = engine
+        self.tag = tag
+        self.values = values
+
+    def encode(self):
+        return self.engine.stamp(self)
+
+
+class MessageTemplate(object):
+    """
+    Message type pre-encoded once per session.
+
+    fields is the ordered list of (tag, value) pairs following BeginString and BodyLength,
+    starting with MsgType (35). A value of None marks a variable field, filled on render().
+    BodyLength and CheckSum are derived from the precomputed static length and byte sum plus
+    the variable values only.
+    """
+
+    __slots__ = ('begin', 'begin_sum', 'chunks', 'static_len', 'static_sum', 'slots')
+
+    def __init__(self, begin_string, fields):
+        self.begin = b'8=' + fix_val(begin_string) + b'\x019='
+        self.begin_sum = sum(self.begin) + 1  # SOH after BodyLength value
+
+        chunks = []
+        current = b''
+
+        for tag, value in fields:
+            current += str(tag).encode('ASCII') + b'='
+
+            if value is None:
+                chunks.append(current)
+                current = b'\x01'
+            else:
+                current += fix_val(value) + b'\x01'
+
+        chunks.append(current)
+
+        self.chunks = chunks
+        self.slots = len(chunks) - 1
+        self.static_len = sum(map(len, chunks))
+        self.static_sum = sum(map(sum, chunks))
+
+    def render(self, values):
+        """
+        Return EncodedMessage with values (bytes, in slot order) placed in the variable fields.
+        """
+        parts = [None] * (2 * self.slots + 1)
+        parts[0::2] = self.chunks
+        parts[1::2] = values
+
+        body_length = str(self.static_len + sum(map(len, values))).encode('ASCII')
+        checksum = (self.begin_sum + sum(body_length) + self.static_sum + sum(map(sum, values))) % 256
+
+        return EncodedMessage(b''.join((self.begin, body_length, b'\x01', b''.join(parts),
+                                        b'10=%03d\x01' % checksum)))
+
+
+class SendingTimeClock(object):
+    """
+    Local SendingTime (52) in '%Y%m%d-%H:%M:%S.mmm' format.
+    The string is rebuilt once per millisecond and strftime runs once per second.
+    """
+
+    def __init__(self):
+        self._second = (None, '')
+        self._cache = (None, '', b'')
+
+    def _refresh(self):
+        ms = int(time.time() * 1000)
+        cache = self._cache
+
+        if ms != cache[0]:
+            second = ms // 1000
+
+            if second != self._second[0]:
+                self._second = (second, datetime.fromtimestamp(second).strftime('%Y%m%d-%H:%M:%S.'))
+
+            value = self._second[1] + '%03d' % (ms % 1000)
+            cache = self._cache = (ms, value, value.encode('ASCII'))
+
+        return cache
+
+    def now(self):
+        """
+        Return current SendingTime as str.
+        """
+        return self._refresh()[1]
+
+    def now_bytes(self):
+        """
+        Return current SendingTime as bytes.
+        """
+        return self._refresh()[2]
@@ -0,0 +1,247 @@
+"""
+Single-pass tokenizer for raw FIX frames.
+
+CLASSES:
+FIXFrame ---------------------------------- Tag -> offset index over a raw FIX frame.
+
+    FIELDS:
+    buf ----------------------------------- Raw frame (bytes, bytearray or memoryview).
+    ends ---------------------------------- End offset (exclusive) of every field value.
+    index --------------------------------- Position of the first occurrence of every tag.
+    recv_ns ------------------------------- time.perf_counter_ns() of the socket read of the frame (0 if unknown).
+    starts -------------------------------- Start offset of every field value.
+    tags ---------------------------------- Integer tag of every field, in wire order.
+
+    METHODS:
+    book_levels() ------------------------- Return bid and ask (price, size) lists, best first.
+    checksum_ok() ------------------------- Return True if CheckSum (10) matches the frame bytes.
+    get() --------------------------------- Return n-th value for tag as bytes (simplefix compatible).
+    market_levels() ----------------------- Return bid and ask levels as numeric arrays.
+    value() ------------------------------- Return value of the field at a given position.
+
+FUNCTIONS:
+book_levels() ----------------------------- Return bid and ask (price, size) lists of a frame or simplefix message.
+frame_bytes() ----------------------------- Return raw frame of a simplefix message (no re-encoding).
+market_levels() --------------------------- Return bid and ask levels of a frame or simplefix message as numeric arrays.
+tokenize() -------------------------------- Return FIXFrame for a raw frame or a simplefix message.
+"""
+
+from array import array
+from itertools import accumulate, chain, repeat
+from operator import add, itemgetter
+
+SOH = 1
+EQUALS = 61
+
+_first = itemgetter(0)
+
+
+class FIXFrame(object):
+    """
+    Index of a raw FIX frame.
+
+    The frame is split once, recording the integer tag and the value
+    offsets of every field; the per field work (split, partition, int,
+    offsets) runs in C through map/accumulate. Values are never decoded
+    to str: callers slice them out as bytes and convert them directly to numbers.
+    """
+
+    __slots__ = ('buf', 'tags', 'starts', 'ends', 'index', 'recv_ns')
+
+    def __init__(self, buf):
+        if isinstance(buf, memoryview):
+            # bytes.find does not work on memoryview; scan the exporting object when
+            # the view spans all of it, otherwise take a single contiguous copy.
+            if buf.c_contiguous and isinstance(buf.obj, (bytes, bytearray)) and buf.nbytes == len(buf.obj):
+                buf = buf.obj
+            else:
+                buf = buf.tobytes()
+
+        self.buf = buf
+        self.recv_ns = 0
+
+        fields = buf.split(b'\x01')
+        if fields and b'=' not in fields[-1]:
+            # Trailing SOH (or an incomplete last field).
+            fields.pop()
+
+        tag_bytes = list(map(_first, map(type(buf).partition, fields, repeat(b'='))))
+        lengths = list(map(len, fields))
+        field_starts = list(accumulate(chain((0,), map(add, lengths, repeat(1)))))
+
+        self.tags = tags = list(map(int, tag_bytes))
+        self.starts = list(map(add, field_starts, map(add, map(len, tag_bytes), repeat(1))))
+        self.ends = list(map(add, field_starts, lengths))
+        # Position of the first occurrence: earlier positions overwrite later ones.
+        self.index = dict(zip(reversed(tags), range(len(tags) - 1, -1, -1)))
+
+    def __len__(self):
+        return len(self.tags)
+
+    def value(self, i):
+        """
+        Return value of the field at position i, as bytes.
+        """
+        return self.buf[self.starts[i]:self.ends[i]]
+
+    def get(self, tag, nth=1):
+        """
+        Return n-th value for tag, None if not present.
+        Same contract as simplefix.FixMessage.get, so extract_* helpers accept either.
+        """
+        tag = int(tag)
+        i = self.index.get(tag)
+
+        if i is None:
+            return None
+
+        if nth == 1:
+            return self.buf[self.starts[i]:self.ends[i]]
+
+        tags = self.tags
+        for j in range(i + 1, len(tags)):
+            if tags[j] == tag:
+                nth -= 1
+                if nth == 1:
+                    return self.buf[self.starts[j]:self.ends[j]]
+
+        return None
+
+    def checksum_ok(self):
+        """
+        Return True if CheckSum (10) matches the sum of the bytes preceding it.
+        """
+        i = self.index.get(10)
+
+        if i is None:
+            return False
+
+        # Value of tag 10 starts 3 bytes after the beginning of its field ('10=').
+        return sum(self.buf[:self.starts[i] - 3]) % 256 == int(self.value(i))
+
+    def book_levels(self, depth=5):
+        """
+        Return (bids, asks) lists of (price, size) floats of the MDEntryType (269) 0/1 entries,
+        best first, truncated to depth. One walk of tags from the first 269; no regex, no str.
+        """
+        buf = self.buf
+        first = self.index.get(269)
+        if first is None:
+            return [], []
+
+        bids = []
+        asks = []
+        side = None
+        px = qty = None
+
+        for tag, start, end in zip(self.tags[first:], self.starts[first:], self.ends[first:]):
+            if tag == 269:
+                if side is not None and px and qty:
+                    side.append((float(px), float(qty)))
+
+                entry_type = buf[start:end]
+                side = bids if entry_type == b'0' else asks if entry_type == b'1' else None
+                px = qty = None
+
+            elif tag == 270:
+                px = buf[start:end]
+
+            elif tag == 271:
+                qty = buf[start:end]
+
+        if side is not None and px and qty:
+            side.append((float(px), float(qty)))
+
+        return _best(bids, asks, depth)
+
+    def market_levels(self, depth=5):
+        """
+        Return (bid_px, bid_qty, ask_px, ask_qty) arrays for MDEntryType (269) 0/1 entries.
+        Bids are sorted best (highest) first, asks best (lowest) first, both truncated to depth.
+        """
+        return _arrays(*self.book_levels(depth))
+
+
+def _best(bids, asks, depth):
+    bids.sort(key=_first, reverse=True)
+    asks.sort(key=_first)
+    del bids[depth:]
+    del asks[depth:]
+    return bids, asks
+
+
+def _arrays(bids, asks):
+    return (array('d', [level[0] for level in bids]), array('d', [level[1] for level in bids]),
+            array('d', [level[0] for level in asks]), array('d', [level[1] for level in asks]))
+
+
+def _pairs_levels(pairs, depth):
+    # Same walk as FIXFrame.book_levels over the (tag, value) pairs of a simplefix message.
+    bids = []
+    asks = []
+    side = None
+    px = qty = None
+
+    for tag, value in pairs:
+        if tag == b'269':
+            if side is not None and px and qty:
+                side.append((float(px), float(qty)))
+
+            side = bids if value == b'0' else asks if value == b'1' else None
+            px = qty = None
+
+        elif tag == b'270':
+            px = value
+
+        elif tag == b'271':
+            qty = value
+
+    if side is not None and px and qty:
+        side.append((float(px), float(qty)))
+
+    return _best(bids, asks, depth)
+
+
+def frame_bytes(msg):
+    """
+    Return the raw frame of simplefix message msg, joining its pairs as they are. A parsed
+    message gives back the bytes received (CheckSum included), far cheaper than msg.encode().
+    """
+    return b'\x01'.join(map(b'='.join, msg.pairs)) + b'\x01'
+
+
+def book_levels(msg, depth=5):
+    """
+    Return (bids, asks) lists of (price, size) floats of the MDEntryType (269) 0/1 entries of
+    msg, best first, truncated to depth. Entries with an empty MDEntryPx / MDEntrySize carry no level.
+    msg may be raw bytes/bytearray/memoryview, a FIXFrame or a simplefix.FixMessage, whose
+    pairs are walked as they are (never joined back into a frame).
+    """
+    if isinstance(msg, FIXFrame):
+        return msg.book_levels(depth)
+
+    if isinstance(msg, (bytes, bytearray, memoryview)):
+        return FIXFrame(msg).book_levels(depth)
+
+    return _pairs_levels(msg.pairs, depth)
+
+
+def market_levels(msg, depth=5):
+    """
+    Return (bid_px, bid_qty, ask_px, ask_qty) arrays of msg (see book_levels).
+    """
+    return _arrays(*book_levels(msg, depth))
+
+
+def tokenize(msg):
+    """
+    Return FIXFrame for msg.
+    msg may be raw bytes/bytearray/memoryview, an existing FIXFrame or a simplefix.FixMessage.
+    """
+    if isinstance(msg, FIXFrame):
+        return msg
+
+    if isinstance(msg, (bytes, bytearray, memoryview)):
+        return FIXFrame(msg)
+
+    return FIXFrame(frame_bytes(msg))
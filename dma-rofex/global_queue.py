@@ -24,6 +24,9 @@ owned_accounts = "OwnAccounts.json"
 protocol_type = 'FIXT.1.1'
 xchange_name = ['']
 TargetCompID = ['']
+SenderCompID = ['']
+Username = ['']
+Password = ['']
 Futures_Users = ['']
 xchange_name_Futures = ['']
 API_KEY = ['']
@@ -0,0 +1,137 @@
+"""
+Session level liveness: Heartbeat (0) and TestRequest (1) scheduling.
+
+CLASSES:
+HeartbeatMonitor -------------------------- Send Heartbeat/TestRequest only when needed and detect a dead peer.
+
+    FIELDS:
+    dead_peer_timeout --------------------- Seconds without inbound traffic after which the peer is dead.
+    heart_bt_int -------------------------- HeartBtInt (108) negotiated at logon, in seconds.
+    heartbeats_sent ----------------------- Heartbeats sent because nothing else was sent for heart_bt_int.
+    last_received ------------------------- time.monotonic() of the last inbound message.
+    last_sent ----------------------------- time.monotonic() of the last outbound message.
+    test_requests_sent -------------------- TestRequests sent because nothing was received.
+
+    METHODS:
+    on_received() ------------------------- Note inbound message (answers TestRequest with Heartbeat(112)).
+    on_sent() ----------------------------- Note outbound message.
+    reset() ------------------------------- Restart the timers (after logon).
+    stop() -------------------------------- Stop scheduling.
+"""
+
+import time
+
+from timerwheel import TimerWheel
+
+
+class HeartbeatMonitor(object):
+    """
+    Keep a FIX session alive through quiet periods.
+
+    - Heartbeat when nothing was sent for heart_bt_int seconds.
+    - TestRequest when nothing was received for heart_bt_int + test_request_grace seconds.
+    - on_dead_peer() when nothing was received for dead_peer_timeout seconds
+      (default: twice heart_bt_int, i.e. the TestRequest went unanswered).
+
+    Only one timer per session is armed, always for the nearest deadline, on a
+    TimerWheel that may be shared with other sessions. send(msg) is called from the
+    wheel thread (or from the thread calling on_received), so it must be thread safe
+    and allocate the MsgSeqNum when it enqueues (Connection.send stamps the message
+    under its send lock): messages are built here with the engine stamp_on_send.
+    """
+
+    def __init__(self, engine, send, heart_bt_int=60, dead_peer_timeout=None, test_request_grace=None,
+                 on_dead_peer=None, wheel=None):
+        self.engine = engine
+        self.send = send
+        self.heart_bt_int = heart_bt_int
+        self.test_request_grace = test_request_grace if test_request_grace is not None else heart_bt_int * 0.2
+        self.dead_peer_timeout = dead_peer_timeout if dead_peer_timeout is not None else 2 * heart_bt_int
+        self.on_dead_peer = on_dead_peer
+
+        self._own_wheel = wheel is None
+        self.wheel = wheel if wheel is not None else TimerWheel(tick=min(0.05, heart_bt_int / 100.0))
+
+        self.heartbeats_sent = 0
+        self.test_requests_sent = 0
+        self.last_sent = self.last_received = time.monotonic()
+        self._test_request_at = None
+        self._timer = None
+        self._running = False
+
+        self.reset()
+
+    def reset(self):
+        """
+        Restart last_sent/last_received from now and arm the timer.
+        """
+        self.last_sent = self.last_received = time.monotonic()
+        self._test_request_at = None
+        self._running = True
+        self._arm()
+
+    def stop(self):
+        """
+        Cancel the timer and stop an own wheel (not joined when called from a wheel callback).
+        """
+        self._running = False
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._own_wheel:
+            self.wheel.stop()
+
+    def on_sent(self):
+        self.last_sent = time.monotonic()
+
+    def on_received(self, msg):
+        """
+        Note inbound msg. Any message proves the peer alive; a TestRequest is answered
+        right away with a Heartbeat echoing its TestReqID (112).
+        """
+        self.last_received = time.monotonic()
+        self._test_request_at = None
+
+        if msg.get(35) == b'1':
+            self.send(self.engine.msg_Heartbeat(msg.get(112)))
+            self.on_sent()
+
+    def _arm(self):
+        if self._timer is not None:
+            self._timer.cancel()
+
+        if not self._running:
+            return
+
+        if self._test_request_at is None:
+            due = min(self.last_sent + self.heart_bt_int,
+                      self.last_received + self.heart_bt_int + self.test_request_grace,
+                      self.last_received + self.dead_peer_timeout)
+        else:
+            due = min(self.last_sent + self.heart_bt_int, self.last_received + self.dead_peer_timeout)
+
+        self._timer = self.wheel.schedule(max(0.0, due - time.monotonic()), self._check)
+
+    def _check(self):
+        if not self._running:
+            return
+
+        now = time.monotonic()
+        silent = now - self.last_received
+
+        if silent >= self.dead_peer_timeout:
+            self._running = False
+            if self.on_dead_peer is not None:
+                self.on_dead_peer()
+            return
+
+        if self._test_request_at is None and silent >= self.heart_bt_int + self.test_request_grace:
+            self._test_request_at = now
+            self.test_requests_sent += 1
+            self.send(self.engine.msg_TestReq())
+            self.on_sent()
+        elif now - self.last_sent >= self.heart_bt_int:
+            self.heartbeats_sent += 1
+            self.send(self.engine.msg_Heartbeat())
+            self.on_sent()
+
+        self._arm()
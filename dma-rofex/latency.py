@@ -0,0 +1,275 @@
+"""
+Hot path latency instrumentation.
+
+CLASSES:
+LatencyHistogram -------------------------- HDR-style log-linear histogram of nanosecond values.
+
+    FIELDS:
+    count --------------------------------- Values recorded.
+    max / min ----------------------------- Largest / smallest value recorded.
+    significant_digits -------------------- Decimal digits of precision kept at every magnitude.
+
+    METHODS:
+    percentile() -------------------------- Return value at a percentile (0-100).
+    record() ------------------------------ Record a value.
+    reset() ------------------------------- Clear every count.
+    summary() ----------------------------- Return dict with count, min, mean, p50, p90, p99, p99.9, max.
+    to_dict() ----------------------------- Return summary plus the non-empty buckets.
+
+LatencyRecorder --------------------------- Named histograms of the stages between a frame read and an order sent.
+
+    FIELDS:
+    histograms ---------------------------- Stage name -> LatencyHistogram (see STAGES).
+    last_tick_ns -------------------------- Socket read time of the last market data frame handled.
+    skewed -------------------------------- Frames whose SendingTime (52) was later than the local receive time.
+
+    METHODS:
+    frame_parsed() ------------------------ Record socket read -> frame parsed, and SendingTime -> receive.
+    handler() ----------------------------- Record queueing and handler time of an inbound frame.
+    order_sent() -------------------------- Record encode, send and tick-to-order time of an outbound frame.
+    snapshot() ---------------------------- Return dict of every histogram.
+    start_snapshots() --------------------- Append snapshots to a file every interval seconds.
+    stop_snapshots() ---------------------- Stop the snapshot thread.
+
+FUNCTIONS:
+sending_time_ns() ------------------------- Return SendingTime (52) value as epoch nanoseconds.
+
+STAGES ------------------------------------ Histogram names, in hot path order.
+"""
+
+import calendar
+import json
+import threading
+import time
+
+STAGES = (
+    'read_to_parsed',     # socket read -> FIXFrame built (reader thread)
+    'one_way',            # gateway SendingTime (52) -> local receive time (wall clocks)
+    'parsed_to_handler',  # socket read -> handler entry (inbound queue wait)
+    'handler',            # handler entry -> handler exit
+    'encode',             # outbound message encode
+    'send',               # encoded -> handed to the socket / coalescing queue
+    'tick_to_order',      # socket read of the last market data frame -> order sent
+)
+
+ORDER_MSG_TYPES = (b'D', b'F', b'G', b'q')
+MARKET_DATA_MSG_TYPES = (b'W', b'X')
+
+_epoch_seconds = {}
+
+
+def sending_time_ns(value):
+    """
+    Return UTCTimestamp value (YYYYMMDD-HH:MM:SS[.sss[sss]], bytes) as epoch nanoseconds.
+    """
+    value = bytes(value)
+    seconds = _epoch_seconds.get(value[:17])
+    if seconds is None:
+        if len(_epoch_seconds) > 4096:
+            _epoch_seconds.clear()
+        seconds = _epoch_seconds[value[:17]] = calendar.timegm(time.strptime(value[:17].decode('ASCII'),
+                                                                            '%Y%m%d-%H:%M:%S'))
+    fraction = value[18:]
+    nanos = int(fraction.ljust(9, b'0')[:9]) if fraction else 0
+    return seconds * 1000000000 + nanos
+
+
+class LatencyHistogram(object):
+    """
+    Counts of values in log-linear buckets, HdrHistogram style.
+
+    Values are exact up to 2 * 10 ** significant_digits; above that every power of
+    two range is split in the same number of linear sub-buckets, so the relative
+    error stays below 10 ** -significant_digits. record() is a bit_length, a shift and
+    a list increment; values above highest are counted as highest.
+    """
+
+    def __init__(self, highest=3600 * 10 ** 9, significant_digits=2):
+        self.highest = highest
+        self.significant_digits = significant_digits
+
+        self._sub_bucket_bits = (2 * 10 ** significant_digits - 1).bit_length()
+        self._sub_bucket_count = 1 << self._sub_bucket_bits
+        self._half_count = self._sub_bucket_count >> 1
+        buckets = max(1, highest.bit_length() - self._sub_bucket_bits + 1)
+        self._counts = [0] * ((buckets + 1) * self._half_count)
+
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        bucket = value.bit_length() - self._sub_bucket_bits
+        if bucket <= 0:
+            return value
+        return bucket * self._half_count + (value >> bucket)
+
+    def _value(self, index):
+        """
+        Return (lowest, highest) value counted at index.
+        """
+        if index < self._sub_bucket_count:
+            return index, index
+        bucket = index // self._half_count - 1
+        lowest = (index - bucket * self._half_count) << bucket
+        return lowest, lowest + (1 << bucket) - 1
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        elif value > self.highest:
+            value = self.highest
+
+        self._counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def reset(self):
+        self._counts = [0] * len(self._counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def percentile(self, percentile):
+        """
+        Return the highest value equivalent to the given percentile (0 if empty).
+        """
+        if not self.count:
+            return 0
+
+        target = max(1, int(round(self.count * percentile / 100.0)))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= target:
+                return min(self._value(index)[1], self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'min': self.min or 0,
+            'mean': self.total / self.count if self.count else 0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p99.9': self.percentile(99.9),
+            'max': self.max,
+        }
+
+    def to_dict(self):
+        """
+        Return summary plus buckets as [lowest value, count] pairs for non-empty buckets.
+        """
+        result = self.summary()
+        result['buckets'] = [[self._value(index)[0], count] for index, count in enumerate(self._counts) if count]
+        return result
+
+
+class LatencyRecorder(object):
+    """
+    Histograms of the stages a frame goes through, in nanoseconds (time.perf_counter_ns).
+
+    Instrumented components (ReaderThread, FIXEngine.dispatch, Connection.send) hold a
+    latency attribute that is None unless instrumentation is enabled, so the disabled
+    cost is a single attribute test per frame. The reader stamps every frame with its
+    socket read time (FIXFrame.recv_ns); the stages are measured from there.
+
+    one_way compares the gateway SendingTime (52) with the local wall clock at the
+    socket read: it includes the clock offset between both hosts, so it is only an
+    estimate of the one-way delay (frames sent "in the future" are counted in skewed).
+    """
+
+    def __init__(self, highest=3600 * 10 ** 9, significant_digits=2):
+        self.histograms = {stage: LatencyHistogram(highest, significant_digits) for stage in STAGES}
+        self.last_tick_ns = 0
+        self.skewed = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def frame_parsed(self, frame, wall_ns):
+        """
+        Record read_to_parsed and one_way of frame (wall_ns: time.time_ns() at the socket read).
+        """
+        self.histograms['read_to_parsed'].record(time.perf_counter_ns() - frame.recv_ns)
+
+        sending_time = frame.get(52)
+        if sending_time is not None:
+            try:
+                delay = wall_ns - sending_time_ns(sending_time)
+            except ValueError:
+                return
+            if delay < 0:
+                self.skewed += 1
+            else:
+                self.histograms['one_way'].record(delay)
+
+    def handler(self, frame, msg_type, entry_ns, exit_ns):
+        """
+        Record parsed_to_handler and handler for an inbound frame handled between entry_ns and exit_ns.
+        """
+        recv_ns = getattr(frame, 'recv_ns', 0)
+        if recv_ns:
+            self.histograms['parsed_to_handler'].record(entry_ns - recv_ns)
+            if msg_type in MARKET_DATA_MSG_TYPES:
+                self.last_tick_ns = recv_ns
+        self.histograms['handler'].record(exit_ns - entry_ns)
+
+    def order_sent(self, frame, start_ns, encoded_ns, sent_ns):
+        """
+        Record encode and send of an outbound frame, and tick_to_order when it is an order message.
+        """
+        self.histograms['encode'].record(encoded_ns - start_ns)
+        self.histograms['send'].record(sent_ns - encoded_ns)
+
+        if self.last_tick_ns:
+            start = frame.find(b'\x0135=') + 4
+            if frame[start:frame.find(b'\x01', start)] in ORDER_MSG_TYPES:
+                self.histograms['tick_to_order'].record(sent_ns - self.last_tick_ns)
+
+    def snapshot(self, buckets=False):
+        """
+        Return dict with a wall clock timestamp, skewed and every histogram (summary, plus buckets if asked).
+        """
+        return {
+            'time': time.time(),
+            'skewed': self.skewed,
+            'histograms': {stage: histogram.to_dict() if buckets else histogram.summary()
+                           for stage, histogram in self.histograms.items()},
+        }
+
+    def start_snapshots(self, path, interval=10.0, reset=False):
+        """
+        Append a JSON line snapshot (with buckets) to path every interval seconds.
+        With reset=True every snapshot covers only its interval.
+        """
+        self.stop_snapshots()
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self._dump(path, reset)
+            self._dump(path, reset)
+
+        self._thread = threading.Thread(target=run, name='LatencySnapshots', daemon=True)
+        self._thread.start()
+
+    def stop_snapshots(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _dump(self, path, reset):
+        snapshot = self.snapshot(buckets=True)
+        if reset:
+            for histogram in self.histograms.values():
+                histogram.reset()
+        with open(path, 'a') as f:
+            f.write(json.dumps(snapshot, sort_keys=True) + '\n')
@@ -24,6 +24,8 @@ import simplejson
 import datetime as dt
 import json
 
+from wsmarketdata import BookKeeper, market_data_subscription
+
 
 def send_buy_order(ticker, price, qty):
     order = pyRofex.send_order(ticker=ticker,
@@ -53,11 +55,11 @@ def market_data_handler(message):
     global order_sent
 
     try:
-        ticker = message.get('instrumentId').get('symbol')
-        ticker_entries = [pyRofex.MarketDataEntry.BIDS, pyRofex.MarketDataEntry.OFFERS]
+        # Book maintained from the websocket pushes, REST only for snapshot / resync
+        book = books.apply(message)
 
-        if ticker:
-            full_book = pyRofex.get_market_data(ticker, ticker_entries, depth=10)
+        if book is not None:
+            ticker = book.symbol
             # trade_history = pyRofex.get_trade_history(ticker, dt.date(2020, 1, 1), dt.date.today())
             # trade_history_df = pd.DataFrame.from_dict(trade_history.get('trades')).drop('servertime', axis=1)
             # trade_history_df = trade_history_df[['symbol', 'price', 'size', 'datetime']]
@@ -65,10 +67,10 @@ def market_data_handler(message):
             # print(pprint.pprint(trade_history_df))
 
             print(f"Full book for {ticker}")
-            print(pprint.pprint(full_book.get('marketData')))
-            market_price = float(full_book.get('marketData').get('BI')[0].get('price'))
+            print(book.frame())
+            market_price = book.best_bid()[0]
             quoting_price = market_price + 0.05
-            market_qty = int(full_book.get('marketData').get('OF')[0].get('size'))
+            market_qty = int(book.best_offer()[1])
             quoting_qty = market_qty
 
         if order_sent < 1:
@@ -112,16 +114,18 @@ entries = [pyRofex.MarketDataEntry.BIDS,
 quoting_price = 0.0
 quoting_qty = 0
 order_sent = 0
+books = BookKeeper(depth=10)
 
-pyRofex.market_data_subscription(tickers=instruments,
-                                 entries=entries)
+for instrument in instruments:
+    books.snapshot(instrument)
+market_data_subscription(instruments, entries, depth=books.depth)
 pyRofex.order_report_subscription()
 
 time.sleep(5)
 instruments.append("GGALDic20")
 
-pyRofex.market_data_subscription(tickers=instruments,
-                                 entries=entries)
+books.snapshot("GGALDic20")
+market_data_subscription(instruments, entries, depth=books.depth)
 
 while True:
     try:
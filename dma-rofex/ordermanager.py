@@ -0,0 +1,230 @@
+"""
+In-memory orders of the session, driven by the websocket order report stream.
+
+CLASSES:
+ManagedOrder ------------------------------ State and fills of one order.
+
+    FIELDS:
+    active -------------------------------- True if not in a terminal state.
+    avg_px / cum_qty / leaves_qty --------- Fill state from the last report.
+    cancel_rejected ----------------------- True if the last cancel request was rejected.
+    cl_ord_id ----------------------------- Client order id (clientId / clOrdId).
+    cl_ord_ids ---------------------------- Every ClOrdID of the order (original + cancel / replace requests).
+    order_id ------------------------------ Exchange order id, None until acknowledged.
+    price / size / side / symbol ---------- Order terms.
+    proprietary --------------------------- Proprietary returned by send_order (needed to cancel).
+    state --------------------------------- One of STATES.
+    text ---------------------------------- Text of the last report (reject reason).
+    transact_time ------------------------- transactTime of the last report.
+
+OrderManager ------------------------------ Orders indexed by ClOrdID and OrderID, updated from order reports.
+
+    FIELDS:
+    invalid_transitions ------------------- Reports ignored because their state cannot follow the current one.
+    reports ------------------------------- Order reports applied.
+    session_ids --------------------------- ClOrdIDs sent by this session (sent()), not loaded from reports.
+
+    METHODS:
+    active() ------------------------------ Return live orders (optionally of one symbol / of this session only).
+    by_order_id() ------------------------- Return order by exchange OrderID, None if unknown.
+    cancel_sent() ------------------------- Move an order to PENDING_CANCEL.
+    get() --------------------------------- Return order by ClOrdID, None if unknown.
+    on_order_report() --------------------- Apply a pyRofex order report message, return the order.
+    sent() -------------------------------- Register an order just sent (PENDING_NEW).
+    wait() -------------------------------- Block until a condition on an order holds (re-checked on every report).
+
+STATES ------------------------------------ Order states.
+TRANSITIONS ------------------------------- State -> states that may follow it.
+"""
+
+import threading
+
+PENDING_NEW = 'PENDING_NEW'
+NEW = 'NEW'
+PARTIALLY_FILLED = 'PARTIALLY_FILLED'
+FILLED = 'FILLED'
+PENDING_CANCEL = 'PENDING_CANCEL'
+CANCELLED = 'CANCELLED'
+REJECTED = 'REJECTED'
+
+STATES = (PENDING_NEW, NEW, PARTIALLY_FILLED, FILLED, PENDING_CANCEL, CANCELLED, REJECTED)
+
+TERMINAL_STATES = (FILLED, CANCELLED, REJECTED)
+
+TRANSITIONS = {
+    PENDING_NEW: {PENDING_NEW, NEW, PARTIALLY_FILLED, FILLED, PENDING_CANCEL, CANCELLED, REJECTED},
+    NEW: {NEW, PARTIALLY_FILLED, FILLED, PENDING_CANCEL, CANCELLED, REJECTED},
+    PARTIALLY_FILLED: {PARTIALLY_FILLED, FILLED, PENDING_CANCEL, CANCELLED},
+    PENDING_CANCEL: {NEW, PARTIALLY_FILLED, FILLED, PENDING_CANCEL, CANCELLED},
+    FILLED: set(),
+    CANCELLED: set(),
+    REJECTED: set(),
+}
+
+# Report status values that are not one of STATES.
+_STATUS_ALIASES = {
+    'CANCELED': CANCELLED,
+    'EXPIRED': CANCELLED,
+    'PENDING_REPLACE': NEW,
+    'REPLACED': NEW,
+}
+
+
+class ManagedOrder(object):
+    """
+    One order of the session; state changes only through OrderManager.
+    """
+
+    __slots__ = ('cl_ord_id', 'cl_ord_ids', 'order_id', 'proprietary', 'symbol', 'side', 'price', 'size', 'state',
+                 'cum_qty', 'leaves_qty', 'avg_px', 'text', 'transact_time', 'cancel_rejected')
+
+    def __init__(self, cl_ord_id, symbol=None, side=None, price=None, size=None, proprietary=None):
+        self.cl_ord_id = cl_ord_id
+        self.cl_ord_ids = [cl_ord_id]
+        self.order_id = None
+        self.proprietary = proprietary
+        self.symbol = symbol
+        self.side = side
+        self.price = price
+        self.size = size
+        self.state = PENDING_NEW
+        self.cum_qty = 0
+        self.leaves_qty = size
+        self.avg_px = 0.0
+        self.text = None
+        self.transact_time = None
+        self.cancel_rejected = False
+
+    @property
+    def active(self):
+        return self.state not in TERMINAL_STATES
+
+    def __repr__(self):
+        return 'ManagedOrder(%s %s %s %s@%s %s cum=%s)' % (self.cl_ord_id, self.symbol, self.side, self.size,
+                                                           self.price, self.state, self.cum_qty)
+
+
+class OrderManager(object):
+    """
+    Session orders in dicts by ClOrdID (every ClOrdID of the order, including those
+    of its cancel requests) and by OrderID: lookups are O(1) and the state comes from
+    the order report pushes, not from a status request per order.
+
+    A report for an unknown order creates it (reports may arrive before send_order
+    returns, and the subscription snapshot brings orders of earlier sessions). A
+    report whose state cannot follow the current one (e.g. NEW after FILLED, a late
+    or duplicated push) is ignored and counted in invalid_transitions. A REJECTED
+    report for the ClOrdID of a cancel request rejects the cancel, not the order: the
+    order goes back to NEW / PARTIALLY_FILLED with cancel_rejected set.
+    """
+
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self.reports = 0
+        self.invalid_transitions = 0
+        self.session_ids = set()
+
+        self._orders = {}
+        self._by_order_id = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def get(self, cl_ord_id):
+        return self._orders.get(cl_ord_id)
+
+    def by_order_id(self, order_id):
+        return self._by_order_id.get(order_id)
+
+    def active(self, symbol=None, session_only=False):
+        with self._lock:
+            orders = {id(order): order for order in self._orders.values()}.values()
+            return [order for order in orders if order.active and (symbol is None or order.symbol == symbol) and
+                    (not session_only or order.cl_ord_id in self.session_ids)]
+
+    def sent(self, cl_ord_id, symbol, side, price, size, proprietary=None):
+        """
+        Register an order accepted by send_order (PENDING_NEW). Return the order.
+        """
+        with self._lock:
+            order = self._orders.get(cl_ord_id)
+            if order is None:
+                order = self._orders[cl_ord_id] = ManagedOrder(cl_ord_id, symbol, side, price, size, proprietary)
+            else:
+                # Its first report was faster than the send_order response.
+                order.proprietary = proprietary
+            self.session_ids.add(order.cl_ord_id)
+        return order
+
+    def cancel_sent(self, cl_ord_id, cancel_cl_ord_id=None):
+        """
+        Move the order to PENDING_CANCEL and index the ClOrdID of the cancel request.
+        Return the order, None if unknown.
+        """
+        with self._lock:
+            order = self._orders.get(cl_ord_id)
+            if order is None:
+                return None
+            if cancel_cl_ord_id is not None and cancel_cl_ord_id not in self._orders:
+                self._orders[cancel_cl_ord_id] = order
+                order.cl_ord_ids.append(cancel_cl_ord_id)
+            if PENDING_CANCEL in TRANSITIONS[order.state]:
+                order.state = PENDING_CANCEL
+                order.cancel_rejected = False
+        return order
+
+    def wait(self, order, predicate, timeout=None):
+        """
+        Block until predicate(order) is true, re-evaluated after every report applied.
+        Return its last value (false on timeout).
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: predicate(order), timeout)
+
+    def on_order_report(self, message):
+        """
+        Apply a pyRofex order report message ({'type': 'or', 'orderReport': {...}}). Return the order.
+        """
+        report = message.get('orderReport', message)
+        cl_ord_id = report.get('clOrdId')
+        orig_cl_ord_id = report.get('origClOrdId')
+        order_id = report.get('orderId')
+        state = report.get('status')
+        state = _STATUS_ALIASES.get(state, state)
+
+        with self._lock:
+            order = (self._orders.get(cl_ord_id) or self._orders.get(orig_cl_ord_id) or
+                     self._by_order_id.get(order_id))
+            if order is None:
+                order = ManagedOrder(orig_cl_ord_id or cl_ord_id, (report.get('instrumentId') or {}).get('symbol'),
+                                     report.get('side'), report.get('price'), report.get('orderQty'),
+                                     report.get('proprietary'))
+                self._orders[order.cl_ord_id] = order
+
+            for key in (cl_ord_id, orig_cl_ord_id):
+                if key is not None and key not in self._orders:
+                    self._orders[key] = order
+                    order.cl_ord_ids.append(key)
+            if order_id is not None and order.order_id is None:
+                order.order_id = order_id
+                self._by_order_id[order_id] = order
+
+            self.reports += 1
+            if state == REJECTED and order.state == PENDING_CANCEL and cl_ord_id != order.cl_ord_id:
+                order.cancel_rejected = True
+                state = PARTIALLY_FILLED if order.cum_qty else NEW
+            if state not in TRANSITIONS[order.state]:
+                if state != order.state:
+                    self.invalid_transitions += 1
+                return order
+
+            order.state = state
+            order.cum_qty = report.get('cumQty', order.cum_qty)
+            order.leaves_qty = report.get('leavesQty', order.leaves_qty)
+            order.avg_px = report.get('avgPx', order.avg_px)
+            order.text = report.get('text')
+            order.transact_time = report.get('transactTime')
+            self._changed.notify_all()
+
+        if self.on_change is not None:
+            self.on_change(order)
+        return order
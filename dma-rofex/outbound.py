@@ -0,0 +1,166 @@
+"""
+Outbound write coalescing for FIX connections.
+
+CLASSES:
+OutboundQueue ----------------------------- Gather frames ready within a deadline into a single write.
+
+    FIELDS:
+    burst_sizes --------------------------- Frames per write -> number of writes.
+    deadline ------------------------------ Seconds a queued frame may wait for others before being written.
+    error --------------------------------- Last exception raised by a background write, None if none.
+    failed -------------------------------- True after a failed write until the next successful one or discard().
+    messages ------------------------------ Frames written.
+    writes -------------------------------- Writes (socket sendall calls) performed.
+
+    METHODS:
+    discard() ----------------------------- Drop and return queued frames (e.g. stale after a reconnect).
+    flush() ------------------------------- Write every queued frame now, on the calling thread.
+    put() --------------------------------- Queue a frame (flush=True writes it, and anything queued, now).
+    stats() ------------------------------- Return dict of burst metrics.
+    stop() -------------------------------- Flush and stop the background writer.
+"""
+
+import threading
+import time
+from collections import Counter
+
+# Deadlines below this are waited by spinning on perf_counter: time.sleep() and
+# Condition.wait() cannot wake up sooner than the OS timer resolution (~15 ms on Windows).
+SPIN_LIMIT = 0.02
+
+
+class OutboundQueue(object):
+    """
+    Micro-batching outbound queue.
+
+    Frames queued with put() are written by a background thread once deadline has
+    elapsed since the first of them, joined into one write() (one TLS record instead
+    of one per frame). put(frame, flush=True) is the explicit flush point for latency
+    critical orders: it writes on the calling thread, after anything already queued,
+    so the wire order is always the put() order. With deadline=0 every put() writes
+    immediately and no thread is started.
+
+    Frames of a failed write are put back at the head of the queue, never dropped:
+    the exception goes to the caller of flush() (background writes: error and
+    on_error(ex)) and the background writer pauses until a write succeeds or
+    discard() takes them (the connection decides how to resend them).
+    """
+
+    def __init__(self, write, deadline=0.00005, on_error=None):
+        self.write = write
+        self.deadline = deadline
+        self.on_error = on_error
+        self.error = None
+        self.failed = False
+
+        self.messages = 0
+        self.writes = 0
+        self.burst_sizes = Counter()
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._running = deadline > 0
+        self._thread = None
+
+        if self._running:
+            self._thread = threading.Thread(target=self._run, name='OutboundQueue', daemon=True)
+            self._thread.start()
+
+    def put(self, frame, flush=False):
+        """
+        Queue encoded frame. With flush=True, or no deadline, write it now on the calling thread.
+        """
+        with self._cond:
+            self._pending.append(frame)
+            if len(self._pending) == 1:
+                self._cond.notify()
+
+        if flush or not self._running:
+            self.flush()
+
+    def flush(self):
+        """
+        Write every queued frame in a single write() call. Exceptions propagate to the caller,
+        with the frames queued again.
+        """
+        with self._write_lock:
+            with self._cond:
+                frames = self._pending
+                self._pending = []
+
+            if not frames:
+                return
+
+            try:
+                self.write(frames[0] if len(frames) == 1 else b''.join(frames))
+            except Exception:
+                with self._cond:
+                    self._pending[:0] = frames
+                    self.failed = True
+                raise
+
+            self.failed = False
+            self.writes += 1
+            self.messages += len(frames)
+            self.burst_sizes[len(frames)] += 1
+
+    def discard(self):
+        """
+        Remove and return the queued frames (list, in put() order) and resume background writes.
+        """
+        with self._write_lock:
+            with self._cond:
+                frames = self._pending
+                self._pending = []
+                self.failed = False
+        return frames
+
+    def stats(self):
+        """
+        Return dict with messages, writes, records_saved (messages - writes), burst_sizes and pending.
+        """
+        return {
+            'messages': self.messages,
+            'writes': self.writes,
+            'records_saved': self.messages - self.writes,
+            'burst_sizes': dict(self.burst_sizes),
+            'pending': len(self._pending),
+        }
+
+    def stop(self):
+        """
+        Flush pending frames and stop the background writer.
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while (not self._pending or self.failed) and self._running:
+                    self._cond.wait()
+
+                if not self._running:
+                    return
+
+            # Let frames ready within the deadline join this write.
+            if self.deadline < SPIN_LIMIT:
+                until = time.perf_counter() + self.deadline
+                while time.perf_counter() < until:
+                    time.sleep(0)
+            else:
+                time.sleep(self.deadline)
+
+            try:
+                self.flush()
+            except Exception as ex:
+                self.error = ex
+                if self.on_error is not None:
+                    self.on_error(ex)
@@ -0,0 +1,188 @@
+"""
+Reconnection of FIX connections.
+
+CLASSES:
+Backoff ----------------------------------- Jittered exponential backoff delays.
+
+    METHODS:
+    next() -------------------------------- Return delay before the next attempt.
+    reset() ------------------------------- Restart from the initial delay.
+
+ReconnectManager -------------------------- Re-establish a Connection and restore its subscriptions.
+
+    FIELDS:
+    backoff ------------------------------- Backoff between failed attempts.
+    chunk_size ---------------------------- Symbols per MarketDataRequest on resubscription.
+    incidents ----------------------------- List of dicts describing every (re)connection.
+
+    METHODS:
+    connect() ----------------------------- Connect (blocking), replay subscriptions and order status requests.
+    stats() ------------------------------- Return dict of time-to-recover metrics.
+    trigger() ----------------------------- Reconnect on a background thread.
+"""
+
+import random
+import threading
+import time
+
+from global_queue import *
+
+
+class Backoff(object):
+    """
+    Delays initial, initial * factor, ... capped at maximum, each scaled by a random
+    factor in [1 - jitter, 1] so that many clients do not retry in lockstep.
+    """
+
+    def __init__(self, initial=0.1, maximum=5.0, factor=2.0, jitter=0.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self._attempt = 0
+
+    def reset(self):
+        self._attempt = 0
+
+    def next(self):
+        delay = min(self.maximum, self.initial * self.factor ** self._attempt)
+        self._attempt += 1
+        return delay * random.uniform(1 - self.jitter, 1)
+
+
+class ReconnectManager(object):
+    """
+    Reconnect a rofexclientcustom.Connection after a drop.
+
+    connect() retries Connection._open() (socket, TLS, Logon) with a jittered
+    exponential backoff (a ValueError, e.g. missing credentials, is raised at once).
+    Once logged on it restarts the reader thread and heartbeat that were running,
+    then sends, in one coalesced burst, the MarketDataRequests
+    renewing every active subscription (FIXEngine.resubscribe_msgs) and an
+    OrderStatusRequest per open order (FIXEngine.order_status_msgs), so books and
+    order states are refreshed as soon as the session is back.
+
+    Frames still queued in the OutboundQueue (a failed write puts them back) carry
+    MsgSeqNums of the dropped connection, so they are taken out before the Logon and
+    counted in the incident as unsent. With a session store they come back as PossDup
+    when the gateway asks for the gap (ResendRequest); without one they are re-stamped
+    and sent as new messages (Connection._recover_unsent, counted as resent).
+
+    Every call appends an incident to incidents with the time to logon and the
+    time to recover (replay sent).
+    """
+
+    def __init__(self, connection, backoff=None, chunk_size=50):
+        self.connection = connection
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.chunk_size = chunk_size
+        self.incidents = []
+        self._lock = threading.RLock()
+        self._thread = None
+
+    def trigger(self, reason=None):
+        """
+        Reconnect on a background thread (no-op while a reconnection is running).
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._thread = threading.Thread(target=self.connect, args=(reason,), name='Reconnect', daemon=True)
+        self._thread.start()
+
+    def connect(self, reason=None):
+        """
+        Connect, retrying until logged on, and replay the session state. Return the incident
+        dict, None if the connection was already up (e.g. restored by another thread).
+        """
+        with self._lock:
+            conn = self.connection
+            if conn.connected:
+                return None
+
+            started = time.monotonic()
+            reader_running = conn.reader is not None
+            conn.stop_reader()
+            unsent = conn.outbound.discard()
+            self.backoff.reset()
+
+            print("=" * width)
+            connected_message = 'Connecting to ROFEX Demo DMA servert at ' + str(conn.host) + ':' + str(conn.port)
+            print(connected_message.center(width))
+            print("=" * width)
+
+            attempts = 0
+            while True:
+                attempts += 1
+                try:
+                    conn._open()
+                    break
+                except ValueError:
+                    # Configuration (e.g. missing credentials): retrying cannot help.
+                    raise
+                except Exception as ex:
+                    template = "Socket_1: An exception with read msg, of type {0} occurred. Arguments:\n{1!r}"
+                    print(template.format(type(ex).__name__, ex.args))
+                    time.sleep(self.backoff.next())
+
+            logged_on = time.monotonic()
+
+            if reader_running:
+                conn.start_reader()
+            if conn.heartbeat is not None:
+                conn.heartbeat.reset()
+
+            resent = conn._recover_unsent(unsent)
+
+            resubscribed, status_requests = self.replay()
+            recovered = time.monotonic()
+
+            incident = {
+                'reason': reason,
+                'attempts': attempts,
+                'time_to_logon': logged_on - started,
+                'time_to_recover': recovered - started,
+                'resubscribed': resubscribed,
+                'status_requests': status_requests,
+                'unsent': len(unsent),
+                'resent': resent,
+            }
+            self.incidents.append(incident)
+
+            print("=" * width)
+            print('Connection Status: OK'.center(width))
+            print("=" * width)
+            print('Ready to Launch Strategies'.center(width))
+            print("=" * width)
+            return incident
+
+    def replay(self):
+        """
+        Send subscription renewals and order status requests in one burst.
+        Return (MarketDataRequests sent, OrderStatusRequests sent).
+        """
+        conn = self.connection
+        engine = conn.FIX_engine
+
+        subscriptions = engine.resubscribe_msgs(self.chunk_size)
+        for msg, _ in subscriptions:
+            conn.send(msg)
+
+        status_requests = engine.order_status_msgs()
+        for msg in status_requests:
+            conn.send(msg)
+
+        conn.outbound.flush()
+        return len(subscriptions), len(status_requests)
+
+    def stats(self):
+        """
+        Return dict with incidents (reconnections, initial connect excluded), and the last and
+        worst time to recover.
+        """
+        recoveries = [incident['time_to_recover'] for incident in self.incidents[1:]]
+        return {
+            'incidents': len(recoveries),
+            'last_time_to_recover': recoveries[-1] if recoveries else None,
+            'max_time_to_recover': max(recoveries) if recoveries else None,
+        }
@@ -1,20 +1,21 @@
 import logging
 import sys
-import traceback
 from os import system, name
 import os
 import time
-from pprint import pprint
-import pandas as pd
-from threading import Lock
 import datetime as dt
 
 import pyRofex
 
+from asynclog import setup_logging
+from bookrenderer import BookRenderer
+from bulkorders import BulkOrders
+from conflation import ConflatingDispatcher
+from ordermanager import OrderManager
+from wsmarketdata import BookKeeper, market_data_subscription
+
 width = os.get_terminal_size().columns
 dash_line = "-" * width
-active_orders = []
-lk = Lock()
 
 
 class ROFEXClient:
@@ -28,10 +29,25 @@ class ROFEXClient:
     :type account: Str.
     :param environment: Market environment.
     :type environment: Str.
+    :param verbose: Log verbosity: 0 errors, 1 warnings, 2 info, 3 debug.
+    :type verbose: Int.
+    :param log_dir: Log files directory (default $ROFEX_LOG_DIR or ~/logs).
+    :type log_dir: Str.
+    :param render_fps: Book display frames per second.
+    :type render_fps: Int.
+    :param dispatch_workers: Handler worker threads (each instrument always handled by the same one).
+    :type dispatch_workers: Int.
+    :param bulk_workers: Maximum concurrent REST requests of bulk order operations.
+    :type bulk_workers: Int.
+    :param fix_connection: Logged on FIX Connection used for mass cancels (optional).
+    :type fix_connection: rofexclientcustom.Connection.
     """
-    def __init__(self, user, password, account, environment, verbose=3):
+    def __init__(self, user, password, account, environment, verbose=3, log_dir=None, render_fps=10,
+                 dispatch_workers=4, bulk_workers=8, fix_connection=None):
 
         self.subscribed_instruments = []
+        self.market_data = BookKeeper(depth=10)
+        self.orders = OrderManager(on_change=self.order_changed)
         self.user = user
         self.password = password
         self.account = account
@@ -43,29 +59,24 @@ class ROFEXClient:
             'live': pyRofex.Environment.LIVE,
         }
         self.env = environments.get(env_param)
+        self.bulk = BulkOrders(self.orders, workers=bulk_workers, fix=fix_connection, environment=self.env)
 
-        # Create logging file
-        # TODO Implementar validacion para Windows/Linux
+        # Create logging file. Records are queued and written by a listener thread;
+        # self.debug is resolved once so hot paths test a plain boolean.
         self.session_time = dt.datetime.now()
-        filename = f'c:/logs/ROFEX{env_param}{self.session_time.year}-{self.session_time.month}-' \
-                   f'{self.session_time.hour}_{self.session_time.second}.log'
-        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s-%(threadName)s-%(message)s', filename=filename)
-
-        # TODO No entiendo muy bien cual es la funcion de los AddLevelName
-
-        verbosity = verbose
-        if verbosity == '1':
-            logging.addLevelName('DEBUG', 10)
-        elif verbosity == '2':
-            logging.addLevelName('DEBUG', 20)
-        elif verbosity == '3':
-            logging.addLevelName('DEBUG', 30)
-        else:
-            logging.basicConfig(level=None, format='%(asctime)s-%(threadName)s-%(message)s', filename=filename)
-            logging.addLevelName('DEBUG', 30)
+        self.log, self.log_listener = setup_logging('ROFEXClient', log_dir, verbose, file_prefix=f'ROFEX{env_param}')
+        self.debug = self.log.isEnabledFor(logging.DEBUG)
+        self.renderer = BookRenderer(fps=render_fps, depth=5, log=self.log)
+
+        # Websocket callbacks only hand messages to the dispatcher: MarketData is conflated per
+        # instrument (latest wins), OrderReports are kept FIFO; handlers run on its workers.
+        self.dispatcher = ConflatingDispatcher(self.market_data_handler, self.order_report_handler,
+                                               workers=dispatch_workers, on_error=self.dispatch_error)
 
         try:
             self.connect(self.user, self.password, self.account, self.env)
+            self.subscribe_order_report()
+            self.renderer.start()
         except KeyboardInterrupt:
             self.disconnect()
 
@@ -81,7 +92,7 @@ class ROFEXClient:
         try:
             self.process_market_data_message(message)
         except Exception:
-            traceback.print_exec()
+            self.log.exception('ROFEXClient ERROR: MarketData message not processed %s', message)
 
     def order_report_handler(self, message):
         """
@@ -89,8 +100,26 @@ class ROFEXClient:
         :param message: Message received. Comes as a JSON.
         :type message: Dict.
         """
-        # TODO implement
-        print("Order Report Message Received: {0}".format(message))
+        self.orders.on_order_report(message)
+
+    def order_changed(self, order):
+        """
+        Called by the order manager whenever an order changes state.
+        :param order: Updated order.
+        :type order: ManagedOrder.
+        """
+        self.renderer.message(f'Order {order.cl_ord_id} {order.symbol} {order.side} {order.size}@{order.price}: '
+                              f'{order.state} (filled {order.cum_qty})')
+
+    def dispatch_error(self, e, message):
+        """
+        Handles Exceptions raised by a handler on a dispatch worker.
+        :param e: Exception raised.
+        :type e: Exception.
+        :param message: Message being handled. Comes as a JSON.
+        :type message: Dict.
+        """
+        self.log.error('ROFEXClient ERROR: Handler failed on %s: %s', message, e, exc_info=e)
 
     def error_handler(self, message):
         """
@@ -99,13 +128,10 @@ class ROFEXClient:
         :type message: Dict.
         """
         # TODO implement
-        if logging.getLevelName('DEBUG') > 1:
-            logging.debug(f'ROFEXClient ERROR: Error message received {message}')
+        self.log.error('ROFEXClient ERROR: Error message received %s', message)
 
-        print(dash_line)
-        error_msg = f"\033[0;30;47mERROR: MESSAGE RECEIVED \"{message.get('description')}\". \nCheck log file " \
-                    "for detailed error message.\033[1;37;40m"
-        print(error_msg)
+        self.renderer.message(f"ERROR: MESSAGE RECEIVED \"{message.get('description')}\". Check log file "
+                              "for detailed error message.")
 
     def exception_handler(self, e):
         """
@@ -114,7 +140,7 @@ class ROFEXClient:
         :type message: Dict.
         """
         # TODO implement
-        print("Exception Occurred: {0}".format(e.message))
+        self.renderer.message("Exception Occurred: {0}".format(e))
 
     # ==================================================================================================================
     #   End HANDLERS definition
@@ -145,8 +171,8 @@ class ROFEXClient:
         print(message.center(width))
         print(dash_line)
 
-        if logging.getLevelName('DEBUG') > 1:
-            logging.debug(f'ROFEXClient: Starting connection to {environment} DMA Server ')
+        if self.debug:
+            self.log.debug('ROFEXClient: Starting connection to %s DMA Server ', environment)
         try:
             # Initialize Environment
             pyRofex.initialize(user=user,
@@ -156,12 +182,12 @@ class ROFEXClient:
 
             # Initialize WebSocket Cnnection with Handlers
 
-            pyRofex.init_websocket_connection(market_data_handler=self.market_data_handler,
+            pyRofex.init_websocket_connection(market_data_handler=self.dispatcher.submit_market_data,
+                                              order_report_handler=self.dispatcher.submit_order_report,
                                               error_handler=self.error_handler,
                                               exception_handler=self.exception_handler)
         except Exception as e:
-            if logging.getLevelName('DEBUG') > 1:
-                logging.debug(f'ROFEXClient ERROR: En exception occurred {e}')
+            self.log.error('ROFEXClient ERROR: En exception occurred %s', e)
 
             error_msg = "\033[0;30;47mERROR: CONNECTION ERROR. Check log file " \
                         "for detailed error message.\033[1;37;40m"
@@ -173,14 +199,19 @@ class ROFEXClient:
         Terminates Connection to ROFEX DMA Server.
         """
 
-        if logging.getLevelName('DEBUG') > 1:
-            logging.debug(f'ROFEXClient: Disconnecting.')
+        if self.debug:
+            self.log.debug('ROFEXClient: Disconnecting.')
 
+        self.renderer.stop()
+        self.dispatcher.stop()
+        self.bulk.close()
+        self.log.info('ROFEXClient: Dispatch stats %s', self.dispatcher.stats())
         print(dash_line)
         message = f'Terminating connection'
         print(message.center(width))
         print(dash_line)
         pyRofex.close_websocket_connection()
+        self.log_listener.stop()
         sys.exit(0)
 
     def subscribe_instruments(self, args):
@@ -198,112 +229,46 @@ class ROFEXClient:
             for instrument in args:
                 self.subscribed_instruments.append(instrument)
 
-                if logging.getLevelName('DEBUG') > 1:
-                    logging.debug(f'ROFEXClient: Subscribing to {instrument} MarketData')
+                if self.debug:
+                    self.log.debug('ROFEXClient: Subscribing to %s MarketData', instrument)
 
                 message = f'Subscribing to {instrument[0]} MarketData'
-                print(message)
+                self.renderer.message(message)
 
-                pyRofex.market_data_subscription(tickers=instrument,
-                                                 entries=entries)
+                # REST snapshot first, then the book is maintained from the websocket pushes.
+                for ticker in instrument:
+                    self.market_data.snapshot(ticker)
+                market_data_subscription(instrument, entries, depth=self.market_data.depth)
         except Exception as e:
 
-            if logging.getLevelName('DEBUG') > 1:
-                logging.debug(f'ROFEXClient ERROR: En exception occurred {e}')
-            e = str(e).upper()
-            error_msg = f"\033[0;30;47mERROR: {e} Check log file " \
-                        "for detailed error message.\033[1;37;40m"
-            print(error_msg)
-            print(dash_line)
+            self.log.error('ROFEXClient ERROR: En exception occurred %s', e)
+            self.renderer.message(f'ERROR: {str(e).upper()} Check log file for detailed error message.')
 
-    def subscribe_order_report(self, args):
+    def subscribe_order_report(self, snapshot=True):
         """
-        Subscribes to MarketData for specified products.
-        (Each given Ticker HAS to be a str inside a one element list).
-        :param args: List of tickers to subscribe to MarketData.
-        :type args: list of list
+        Subscribes to OrderReport messages of the account; they drive the order manager.
+        :param snapshot: Receive the active orders of the account on subscription.
+        :type snapshot: Bool.
         """
-        # TODO implement
-        pass
+        if self.debug:
+            self.log.debug('ROFEXClient: Subscribing to %s OrderReports', self.account)
 
-        """
-        entries = [pyRofex.MarketDataEntry.BIDS,
-                   pyRofex.MarketDataEntry.OFFERS,
-                   pyRofex.MarketDataEntry.LAST]
         try:
-            for instrument in args:
-                self.subscribed_instruments.append(instrument)
-
-                if logging.getLevelName('DEBUG') > 1:
-                    logging.debug(f'ROFEXClient: Subscribing to {instrument} MarketData')
-
-                message = f'Subscribing to {instrument[0]} MarketData'
-                print(message)
-
-                pyRofex.market_data_subscription(tickers=instrument,
-                                                 entries=entries)
+            pyRofex.order_report_subscription(account=self.account, snapshot=snapshot)
         except Exception as e:
-
-            if logging.getLevelName('DEBUG') > 1:
-                logging.debug(f'ROFEXClient ERROR: En exception occurred {e}')
-            e = str(e).upper()
-            error_msg = f"\033[0;30;47mERROR: {e} Check log file " \
-                        "for detailed error message.\033[1;37;40m"
-            print(error_msg)
-            print(dash_line)
-        """
+            self.log.error('ROFEXClient ERROR: En exception occurred %s', e)
+            self.renderer.message(f'ERROR: {str(e).upper()} Check log file for detailed error message.')
 
     def process_market_data_message(self, message):
         """
         TODO Later this should evaluate every possible action triggerd by specific MarketData messages
-        Prints book and MarketData for each updated Ticker whenever the market changes.
+        Updates the Ticker book and flags it for the next display frame (no terminal output here).
         :param message: Message received. Comes as a JSON.
         :type message: Dict.
         """
-
-        try:
-            ticker = message.get('instrumentId').get('symbol')
-            ticker_entries = [pyRofex.MarketDataEntry.BIDS, pyRofex.MarketDataEntry.OFFERS]
-            full_book = pyRofex.get_market_data(ticker, ticker_entries, depth=10)
-
-            if len(full_book.get('marketData').get('BI')) !=0\
-                    and len(full_book.get('marketData').get('OF')) != 0:
-                bid_book = full_book.get('marketData').get('BI')
-                bid_book_df = pd.DataFrame().from_dict(bid_book)
-                bid_book_df.columns = ['BP', 'BS']
-
-                ask_book = full_book.get('marketData').get('OF')
-                ask_book_df = pd.DataFrame().from_dict(ask_book)
-                ask_book_df.columns = ['OP', 'OS']
-
-                last_trade = [message.get('marketData').get('LA')]
-
-                full_book_df = pd.concat([bid_book_df, ask_book_df], axis=1)
-                full_book_df = full_book_df[['BS', 'BP', 'OP', 'OS']]
-                full_book_df.fillna(0, inplace=True)
-                lk.acquire()
-                print(dash_line)
-                msg_centered = f"{ticker} - MarketData".ljust(width, ' ')
-                md_header = f"\033[0;30;47m{msg_centered}\033[1;37;40m"
-                print(md_header)
-                print("   BID         ASK")
-                print(full_book_df)
-                print("\nTop:", full_book_df['BS'].iloc[0], full_book_df['BP'].iloc[0],
-                      full_book_df['OP'].iloc[0], full_book_df['OS'].iloc[0])
-                lk.release()
-
-            else:
-                empty_MD = pd.DataFrame.from_dict({'BS': [0], 'BP': [0],  'OP': [0], 'OS': [0]})
-                lk.acquire()
-                print(dash_line)
-                print(f"----------- {ticker} - MarketData ".ljust(width, '-'))
-                print("   BID              ASK")
-                print(empty_MD)
-                lk.release()
-
-        except Exception:
-            traceback.print_exc()
-            pass
+        book = self.market_data.apply(message)
+        if book is not None:
+            self.renderer.mark_dirty(book)
 
     def placer_order(self, ticker, order_side, order_price, order_qty):
         # TODO implement
@@ -312,12 +277,12 @@ class ROFEXClient:
         if order_side.lower() == 'buy':
             order_side = pyRofex.Side.BUY
         elif order_side.lower() == 'sell':
-            order_side = pyRofex.side.BUY
+            order_side = pyRofex.Side.SELL
         else:
             raise IncorrectOrderSide
 
-        if logging.getLevelName('DEBUG') > 1:
-            logging.debug(f'ROFEXClient: Sending {str(order_side).split(".")[-1]} order.')
+        if self.debug:
+            self.log.debug('ROFEXClient: Sending %s order.', order_side)
 
         try:
             order = pyRofex.send_order(ticker=ticker,
@@ -325,62 +290,85 @@ class ROFEXClient:
                                        size=order_qty,
                                        price=order_price,
                                        order_type=pyRofex.OrderType.LIMIT)
-            lk.acquire()
-            print(dash_line)
-            print(f"----------- Send Order Response: ".ljust(width, '-'))
-            pprint(order)
-            active_orders.append(order)
-            lk.release()
-
-            order_status = pyRofex.get_order_status(order["order"]["clientId"])
-            lk.acquire()
-            print(dash_line)
-            print(f"----------- Order Status Response: ".ljust(width, '-'))
-            pprint(order_status)
-            lk.release()
+            self.renderer.message(f'Send Order Response: {order}')
+            # State updates come from the OrderReport subscription, no status request per order.
+            self.orders.sent(order['order']['clientId'], ticker, order_side.value.upper(), order_price, order_qty,
+                             order['order'].get('proprietary'))
 
         except Exception as e:
-            if logging.getLevelName('DEBUG') > 1:
-                logging.debug(f'ROFEXClient ERROR: En exception occurred {e}')
+            self.log.error('ROFEXClient ERROR: En exception occurred %s', e)
 
-            error_msg = "\033[0;30;47mERROR: Check log file for detailed error message.\033[1;37;40m"
-            print(error_msg)
-            print(dash_line)
+            self.renderer.message('ERROR: Check log file for detailed error message.')
 
 
     def cancel_order(self, ClOrdId):
         # TODO implement
 
-        if logging.getLevelName('DEBUG') > 1:
-            logging.debug(f'ROFEXClient: Sending cancel message for order {ClOrdId}')
+        if self.debug:
+            self.log.debug('ROFEXClient: Sending cancel message for order %s', ClOrdId)
 
         try:
             cancel_order = pyRofex.cancel_order(ClOrdId)
 
-            lk.acquire()
-            print(dash_line)
-            print(f"----------- Cancel Order Response: ".ljust(width, '-'))
-            pprint(cancel_order)
-            lk.release()
-
-            order_status = pyRofex.get_order_status(ClOrdId)
-            lk.acquire()
-            print(dash_line)
-            print(f"----------- Cancel Order Status Response: ".ljust(width, '-'))
-            pprint(order_status)
-            lk.release()
+            self.renderer.message(f'Cancel Order Response: {cancel_order}')
+            self.orders.cancel_sent(ClOrdId, (cancel_order.get('order') or {}).get('clientId'))
 
         except Exception as e:
-            if logging.getLevelName('DEBUG') > 1:
-                logging.debug(f'ROFEXClient ERROR: En exception occurred {e}')
+            self.log.error('ROFEXClient ERROR: En exception occurred %s', e)
 
-            error_msg = "\033[0;30;47mERROR: Check log file for detailed error message.\033[1;37;40m"
-            print(error_msg)
-            print(dash_line)
+            self.renderer.message('ERROR: Check log file for detailed error message.')
 
-    def get_order_status(self):
-        # TODO implement
-        pass
+    def cancel_many(self, ClOrdIds):
+        """
+        Cancels the given orders concurrently.
+        :param ClOrdIds: ClOrdIDs (or ManagedOrders) to cancel.
+        :type ClOrdIds: List.
+        :return: Aggregated responses / errors by ClOrdID.
+        :rtype: BulkResult.
+        """
+        return self._bulk_done('Cancel many', self.bulk.cancel_many(ClOrdIds))
+
+    def replace_many(self, replacements):
+        """
+        Replaces the given orders concurrently (cancel + new order each).
+        :param replacements: (ClOrdID or ManagedOrder, new price, new size) tuples, None keeps the value.
+        :type replacements: List of tuples.
+        :return: Aggregated new order responses / errors by replaced ClOrdID.
+        :rtype: BulkResult.
+        """
+        return self._bulk_done('Replace many', self.bulk.replace_many(replacements))
+
+    def cancel_all(self, symbol=None, segment=None, session_only=False):
+        """
+        Cancels every active order, or those of one symbol or market segment.
+        Uses a FIX OrderMassCancelRequest when a FIX connection is available and session_only is False;
+        a request not sent or not confirmed by an OrderMassCancelReport is reported as an error.
+        :param symbol: Ticker symbol.
+        :type symbol: Str.
+        :param segment: Market segment (e.g. 'DDF').
+        :type segment: Str.
+        :param session_only: Cancel only the orders placed by this session, not those of the
+            OrderReport snapshot (earlier sessions of the account).
+        :type session_only: Bool.
+        :return: Aggregated responses / errors.
+        :rtype: BulkResult.
+        """
+        return self._bulk_done('Cancel all', self.bulk.cancel_all(symbol, segment, session_only))
+
+    def _bulk_done(self, operation, result):
+        if self.debug:
+            self.log.debug('ROFEXClient: %s %s', operation, result)
+        for cl_ord_id, e in result.errors.items():
+            self.log.error('ROFEXClient ERROR: %s failed for order %s: %s', operation, cl_ord_id, e)
+        self.renderer.message(f'{operation}: {len(result.results)} ok, {len(result.errors)} failed, '
+                              f'{result.requests} requests in {result.elapsed:.3f}s')
+        return result
+
+    def get_order_status(self, ClOrdId):
+        """
+        Returns the order with the given ClOrdID as kept by the order manager (None if unknown).
+        """
+        return self.orders.get(ClOrdId)
 
     def get_all_order_status(self):
         # TODO implement
@@ -403,19 +391,14 @@ class ROFEXClient:
                 if ord_time > self.session_time:
                     session_orders.append(order)
 
-            lk.acquire()
-            print(dash_line)
-            print(f"----------- All Orders Status: ".ljust(width, '-'))
-            pprint(session_orders)
-            lk.release()
+            self.renderer.message(f'All Orders Status: {len(session_orders)} orders this session')
+            for order in session_orders:
+                self.renderer.message(f'    {order}')
 
         except Exception as e:
-            if logging.getLevelName('DEBUG') > 1:
-                logging.debug(f'ROFEXClient ERROR: En exception occurred {e}')
+            self.log.error('ROFEXClient ERROR: En exception occurred %s', e)
 
-            error_msg = "\033[0;30;47mERROR: Check log file for detailed error message.\033[1;37;40m"
-            print(error_msg)
-            print(dash_line)
+            self.renderer.message('ERROR: Check log file for detailed error message.')
 
     def get_market_data(self):
         # TODO implement
@@ -443,6 +426,9 @@ class ROFEXClient:
 
     def get_market_price(self, ticker):
         # TODO implement
+        book = self.market_data.books.get(ticker)
+        if book is not None and book.bid_levels:
+            return book.best_bid()[0]
         ticker_entries = [pyRofex.MarketDataEntry.BIDS, pyRofex.MarketDataEntry.OFFERS]
         full_book = pyRofex.get_market_data(ticker, ticker_entries)
         market_price = float(full_book.get('marketData').get('BI')[0].get('price'))
@@ -454,6 +440,9 @@ class ROFEXClient:
 
     def get_market_qty(self, ticker):
         # TODO implement
+        book = self.market_data.books.get(ticker)
+        if book is not None and book.ask_levels:
+            return book.best_offer()[1]
         ticker_entries = [pyRofex.MarketDataEntry.BIDS, pyRofex.MarketDataEntry.OFFERS]
         full_book = pyRofex.get_market_data(ticker, ticker_entries)
         market_qty = float(full_book.get('marketData').get('OF')[0].get('size'))
@@ -502,15 +491,8 @@ if __name__ == '__main__':
     rofex_client.get_all_order_status()
 
     time.sleep(6)
-    lk.acquire()
-    print(dash_line)
-    print("CANCEL ORDERS")
-    lk.release()
-
-    for order in active_orders:
-        time.sleep(3)
-        cancel_orderId = order.get('order').get('clientId')
-        rofex_client.cancel_order(cancel_orderId)
+    rofex_client.renderer.message("CANCEL ORDERS")
+    rofex_client.cancel_all("GGALOct20", session_only=True)
 
     while True:
         try:
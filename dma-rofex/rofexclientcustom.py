@@ -5,67 +5,95 @@ Connection -------------------------------- Establish connection with server usi
     FIELDS:
     connected ----------------------------- True when connection is established, False otherwise.
     FIXEngine ---------------------------- Instance of FIXEngine to process FIX messages.
+    heart_bt_int -------------------------- HeartBtInt (108) sent at logon, in seconds.
+    heartbeat ----------------------------- HeartbeatMonitor of the session, None until start_heartbeat().
     host ---------------------------------- Destination host.
+    inbound ------------------------------- SPSCQueue of FIXFrame objects filled by the reader thread.
+    journal ------------------------------- WireJournal of every frame sent/received (None = not journaled).
+    latency ------------------------------- LatencyRecorder of the hot path, None until enable_latency().
     lst_50_msg_time ----------------------- Time that the last message has been sent.
     msg_send_to_sound --------------------- Quantity of messages sent.
+    outbound ------------------------------ OutboundQueue coalescing frames into single socket writes.
     port ---------------------------------- Destination port.
+    reader -------------------------------- ReaderThread owning the socket reads, None until start_reader().
     reconnected_needed -------------------- True if connection was lost and needs ro reconnect, False otherwise.
+    reconnector --------------------------- ReconnectManager (backoff, state replay and time-to-recover metrics).
+    send_lock ----------------------------- RLock held while a frame is stamped (MsgSeqNum), journaled and queued.
     sock ---------------------------------- Instance of SSL wrapped INET STREAM socket to handle connection.
     verbose ------------------------------- Prints messages about connection.
 
     METHODS:
     close() ------------------------------- Terminate connection.
-    connect() ----------------------------- Initialise connection.
+    connect() ----------------------------- Initialise connection (retried with jittered exponential backoff).
+    enable_latency() ---------------------- Record read/parse/handler/encode/send latency histograms.
+    expect() ------------------------------ Return Future of the next inbound frame matching MsgType/predicate.
     fileno() ------------------------------ Return file descriptor of the socket.
-    receive() ----------------------------- Return received data from server.
-    send() -------------------------------- Send data to server.
+    get_message() ------------------------- Return next inbound FIXFrame from the reader thread, None on timeout.
+    receive() ----------------------------- Return received data from server (only without reader thread).
+    reconnect() --------------------------- Re-establish connection, replaying subscriptions and order status requests.
+    send() -------------------------------- Send data to server (flush=True writes it now), False if not sent.
+    start_heartbeat() --------------------- Schedule Heartbeat/TestRequest and watch for a dead peer.
+    start_reader() ------------------------ Start the reader thread owning the socket reads.
+    stop_reader() ------------------------- Stop the reader thread (joined unless called from it).
 """
 
-import logging
 import socket
 import ssl
-from os import system, name
+import threading
+from concurrent.futures import Future
 
 import select
 import simplefix
 import winsound
 
 from fixengine import FIXEngine
+from fixreader import ReaderThread, SPSCQueue
+from fixtemplates import EncodedMessage
 from global_queue import *
-
-filename = 'c:/logs/' + 'ROFEXclient-log' + \
-           time.strftime('%Y-%m-%d_%H%M%S', time.localtime(time.time())) + '.log'
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s-%(threadName)s-%(message)s', filename=filename)
-
-
-def clear_screen():
-    # for windows
-    if name == 'nt':
-        _ = system('cls')
-
-        # for mac and linux(here, os.name is 'posix')
-    else:
-        _ = system('clear')
+from heartbeat import HeartbeatMonitor
+from latency import LatencyRecorder
+from outbound import OutboundQueue
+from reconnect import Backoff, ReconnectManager
+from sessionstore import ADMIN_MSG_TYPES, SessionStore, frame_seq_type, restamp_frame
+from wirejournal import INBOUND, OUTBOUND, WireJournal
 
 
 class Connection:
     def __init__(self,
                  host="fix.remarkets.primary.com.ar",
-                 port=9876, verbose=0):
+                 port=9876, verbose=0, coalesce_deadline=timeout, store_path=None, session=None,
+                 heart_bt_int=60, reconnect_chunk_size=50, journal_dir=None):
         self.msg_send_to_sound = 0
         self.host = host
         self.port = port
         self.verbose = verbose
         self.lst_50_msg_time = time.time()
+        self.outbound = OutboundQueue(self._write, coalesce_deadline, self._write_failed)
 
         if self.verbose:
             print('SocketUtils: Creating Socket')
 
         self.sock = None
-        self.FIX_engine = FIXEngine()
-        self.connect()
+        self.reader = None
+        self.inbound = None
+        self.heart_bt_int = heart_bt_int
+        self.heartbeat = None
+        self.latency = None
+        self.journal = WireJournal(journal_dir) if journal_dir is not None else None
+        # MsgSeqNum is allocated by send() under send_lock, so frames built on the strategy,
+        # timer and reader threads reach the wire in sequence order.
+        self.FIX_engine = FIXEngine(session=session)
+        self.FIX_engine.stamp_on_send = True
+        self.FIX_engine.resync_send = self.send
+        self.send_lock = threading.RLock()
+        self._waiters = []
+        self._waiters_lock = threading.Lock()
+        if store_path is not None:
+            self.FIX_engine.attach_store(SessionStore(store_path))
         self.reconnection_needed = False
         self.connected = False
+        self.reconnector = ReconnectManager(self, Backoff(), reconnect_chunk_size)
+        self.connect()
         self.msg_buffer = simplefix.FixParser()
 
     def close(self):
@@ -74,7 +102,22 @@ class Connection:
             info_msg = "\033[0;30;47mSocketUtils: Closing socket.\033[1;37;40m"
             print(info_msg)
 
-        self.sock.close()
+        try:
+            if self.heartbeat is not None:
+                self.heartbeat.stop()
+                self.heartbeat = None
+            # Final flush: raises on a dead socket, the socket and journal are closed anyway.
+            self.outbound.stop()
+        finally:
+            self.stop_reader()
+            self._fail_waiters(ConnectionError('FIX connection closed'))
+            if self.latency is not None:
+                self.latency.stop_snapshots()
+            try:
+                if self.journal is not None:
+                    self.journal.close()
+            finally:
+                self.sock.close()
 
         if self.verbose:
             print(dash_line)
@@ -84,75 +127,263 @@ class Connection:
     def fileno(self):
         return self.sock.fileno()
 
-    def connect(self):
-        self.connected = False
+    def _write(self, data):
+        self.sock.sendall(data)
 
-        while not self.connected:
-
-            try:
-
-                clear_screen()
-                print("=" * width)
-                connected_message = 'Connecting to ROFEX Demo DMA servert at ' + \
-                                    str(self.host) + ':' + str(self.port)
-                print(connected_message.center(width))
-                print("=" * width)
+    def _write_failed(self, ex):
+        template = "Socket_2: An exception with send msg, of type {0} occurred. Arguments:\n{1!r}"
+        print(template.format(type(ex).__name__, ex.args))
+        self.connected = False
+        self.reconnection_needed = True
+        self.reconnector.trigger('send failed')
 
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.settimeout(10)
-                self.sock = ssl.wrap_socket(s)
-                self.sock.connect((self.host, self.port))
+    def start_reader(self, capacity=65536):
+        """
+        Hand the socket reads to a ReaderThread feeding inbound. The queue is kept across
+        reconnects, so the consumer thread never has to re-attach.
+        """
+        if self.inbound is None:
+            self.inbound = SPSCQueue(capacity)
 
-                data = self.FIX_engine.logon()
+        self.stop_reader()
+        self.reader = ReaderThread(self.sock, self.inbound, on_frame=self._on_frame, on_disconnect=self._read_failed)
+        self.reader.latency = self.latency
+        self.reader.start()
 
-                logging.debug(simplefix.pretty_print(data.encode()))
+    def stop_reader(self):
+        """
+        Stop the reader thread and wait for it, so a new one never reads the same socket
+        and a dying one never reports a disconnect of the new connection. A reader that
+        cannot be joined (stopped from its own thread) keeps its queue: inbound is replaced,
+        so it never has two producers.
+        """
+        reader = self.reader
+        if reader is not None:
+            self.reader = None
+            if not reader.stop() and self.inbound is reader.queue:
+                self.inbound = SPSCQueue(reader.queue.capacity)
 
-                self.sock.send(data.encode())
-                self.connected = True
+    def expect(self, msg_type, predicate=None):
+        """
+        Return concurrent.futures.Future resolved, on the reader thread, with the next inbound
+        frame of msg_type (bytes, e.g. b'r') for which predicate(frame) is true. Needs start_reader();
+        cancel the future to stop waiting.
+        """
+        future = Future()
+        with self._waiters_lock:
+            self._waiters.append((msg_type, predicate, future))
+        return future
+
+    def _resolve_waiters(self, frame):
+        msg_type = frame.get(35)
+        with self._waiters_lock:
+            self._waiters = waiters = [waiter for waiter in self._waiters if not waiter[2].done()]
+            for waiter in waiters:
+                expected, predicate, future = waiter
+                if expected != msg_type:
+                    continue
+                try:
+                    matched = predicate is None or predicate(frame)
+                except Exception as ex:
+                    matched = ex
+                # A future cancelled meanwhile (caller gave up) leaves the frame to the next waiter.
+                if matched and future.set_running_or_notify_cancel():
+                    if isinstance(matched, Exception):
+                        future.set_exception(matched)
+                    else:
+                        future.set_result(frame)
+                    waiters.remove(waiter)
+                    break
+
+    def _fail_waiters(self, ex):
+        with self._waiters_lock:
+            for _, _, future in self._waiters:
+                if not future.done() and future.set_running_or_notify_cancel():
+                    future.set_exception(ex)
+            self._waiters = []
+
+    def get_message(self, timeout=None):
+        """
+        Return next inbound FIXFrame (see fixtokenizer), None if none arrives within timeout.
+        """
+        return self.inbound.get(timeout)
 
-                # TODO quitar
-                print(str(self.receive(1024)))
+    def start_heartbeat(self, dead_peer_timeout=None, wheel=None):
+        """
+        Send Heartbeat/TestRequest when the session is quiet; a peer silent for dead_peer_timeout
+        seconds (default 2 * heart_bt_int) is treated as a lost connection. Inbound traffic is
+        seen by the reader thread, so start_reader() is needed too.
+        """
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+        self.heartbeat = HeartbeatMonitor(self.FIX_engine, self.send, self.heart_bt_int, dead_peer_timeout,
+                                          on_dead_peer=self._peer_dead, wheel=wheel)
 
-                print("=" * width)
-                print('Connection Status: OK'.center(width))
-                print("=" * width)
-                print('Ready to Launch Strategies'.center(width))
-                print("=" * width)
+    def enable_latency(self, snapshot_path=None, interval=10.0):
+        """
+        Instrument reader thread, FIXEngine.dispatch and send with a LatencyRecorder. With
+        snapshot_path, histograms are appended to that file every interval seconds.
+        """
+        self.latency = LatencyRecorder()
+        self.FIX_engine.latency = self.latency
+        if self.reader is not None:
+            self.reader.latency = self.latency
+        if snapshot_path is not None:
+            self.latency.start_snapshots(snapshot_path, interval)
+        return self.latency
+
+    def _on_frame(self, frame):
+        if self.journal is not None:
+            self.journal.record(INBOUND, frame.buf)
+
+        # Session level (sequence gaps, ResendRequest) is answered here, on the reader
+        # thread, whether or not the consumer dispatches the frame.
+        replies = self.FIX_engine.session_level(frame)
+        if replies and self.connected:
+            try:
+                self._send_session_replies(replies)
             except Exception as ex:
-                pass
-                template = "Socket_1: An exception with read msg, of type {0} occurred. Arguments:\n{1!r}"
-                print(template.format(type(ex).__name__, ex.args))
-            time.sleep(5)
+                self._write_failed(ex)
+
+        heartbeat = self.heartbeat
+        if heartbeat is not None:
+            heartbeat.on_received(frame)
+
+        if self._waiters:
+            self._resolve_waiters(frame)
+
+    def _send_session_replies(self, replies):
+        with self.send_lock:
+            for reply in replies:
+                if isinstance(reply, EncodedMessage):
+                    # Resent frame / gap fill: already sequenced and journaled, written as is.
+                    if self.journal is not None:
+                        self.journal.record(OUTBOUND, reply)
+                    self.outbound.put(reply)
+                else:
+                    self.send(reply)
+            self.outbound.flush()
+
+    def _peer_dead(self):
+        print('Connection lost: no message received for ' + str(self.heartbeat.dead_peer_timeout) + ' seconds.')
+        self.connected = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.reconnector.trigger('dead peer')
+
+    def _read_failed(self, ex):
+        if ex is not None:
+            template = "Socket_3: An exception with read msg, of type {0} occurred. Arguments:\n{1!r}"
+            print(template.format(type(ex).__name__, ex.args))
+        self.connected = False
+        self.reconnector.trigger('read failed')
 
-    def send(self, data):
-        self.msg_send_to_sound += 1
+    def connect(self):
+        """
+        Connect and log on, retrying with backoff (see ReconnectManager).
+        """
+        self.connected = False
+        return self.reconnector.connect('connect')
 
-        while True:
+    def reconnect(self, reason=None):
+        """
+        Re-establish a lost connection and replay subscriptions / order status requests.
+        """
+        return self.reconnector.connect(reason)
+
+    def _open(self):
+        if self.sock is not None:
+            # Previous socket of a dropped connection.
             try:
-                if not self.connected:
-                    print("####################### No esta conectado")
-                    self.connect()
-                    self.reconnection_needed = True
+                self.sock.close()
+            except OSError:
+                pass
 
-                logging.debug(simplefix.pretty_print(data.encode()))
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.settimeout(10)
+        self.sock = ssl.wrap_socket(s)
+        self.sock.connect((self.host, self.port))
 
-                self.sock.send(data.encode())
-                print('####################### Data sent')
+        with self.send_lock:
+            data = self.FIX_engine.stamp(self.FIX_engine.logon(self.heart_bt_int))
+            self.FIX_engine.record_outbound(data)
+            if self.journal is not None:
+                self.journal.record(OUTBOUND, data)
 
-                break
+            self.sock.send(data)
+            self.connected = True
 
-            except (ConnectionRefusedError, ConnectionResetError, OSError):
-                self.connected = False
-                print('Connection lost.')
-                raise ValueError('THE CONEECTION IS LOSTTT!!!!! TE PROGRAM WILL TERMINATE!!!')
-                break
+    def _recover_unsent(self, frames):
+        """
+        Deal with frames left unsent by a dropped connection (after the new Logon). With a
+        session store they are journaled under their MsgSeqNum and the gateway gets them back
+        as PossDup through its ResendRequest; without one, application messages are re-stamped
+        with a new MsgSeqNum and sent again (the gap is then gap filled). Return frames re-sent.
+        """
+        engine = self.FIX_engine
+        if not frames or engine.store is not None:
+            return 0
+
+        resent = 0
+        with self.send_lock:
+            for frame in frames:
+                if frame_seq_type(frame)[1] in ADMIN_MSG_TYPES:
+                    continue
+                frame = restamp_frame(frame, engine.session.next_seq_num(), engine.clock.now_bytes())
+                engine.record_outbound(frame)
+                if self.journal is not None:
+                    self.journal.record(OUTBOUND, frame)
+                self.outbound.put(frame)
+                resent += 1
+        return resent
+
+    def send(self, data, flush=False):
+        """
+        Stamp (MsgSeqNum), journal and queue data; flush=True writes it now. Return True when
+        the frame was queued (and, with flush=True, written), False when it was not sent.
 
-            except Exception as ex:
-                template = "Socket_2: An exception with send msg, of type {0} occurred. Arguments:\n{1!r}"
-                print(template.format(type(ex).__name__, ex.args))
-                self.connected = False
+        Never blocks on a reconnection: a lost connection is re-established on the reconnect
+        thread (ReconnectManager.trigger). While disconnected data is dropped, unstamped. The
+        frame of a failed write stays queued and is never written again with its old MsgSeqNum
+        (the gateway would reject it as too low), see _recover_unsent().
+        """
+        self.msg_send_to_sound += 1
+        latency = self.latency
+        if latency is not None:
+            start_ns = time.perf_counter_ns()
+
+        if not self.connected:
+            print("####################### No esta conectado")
+            self.reconnection_needed = True
+            self.reconnector.trigger('send while disconnected')
+            return False
+
+        try:
+            # MsgSeqNum allocation and enqueue in one critical section: put() order is MsgSeqNum order.
+            # Frames sent within the coalescing deadline share one socket write.
+            with self.send_lock:
+                frame = self.FIX_engine.stamp(data)
+                if latency is not None:
+                    encoded_ns = time.perf_counter_ns()
+                self.FIX_engine.record_outbound(frame)
+                if self.journal is not None:
+                    self.journal.record(OUTBOUND, frame)
+                self.outbound.put(frame, flush)
+        except Exception as ex:
+            # Connection lost: the frame is back in the outbound queue, recovered by the reconnection.
+            self._write_failed(ex)
+            return False
+
+        if latency is not None:
+            latency.order_sent(frame, start_ns, encoded_ns, time.perf_counter_ns())
+        if self.heartbeat is not None:
+            self.heartbeat.on_sent()
 
-            time.sleep(timeout)
+        if self.verbose:
+            print('####################### Data sent')
+        return True
 
     def receive(self, size=1024):
 
@@ -162,7 +393,7 @@ class Connection:
         # errfds -- Error queue wait for an exceptional condition (mostly errors)
         infds, outfds, errfds = select.select([self.sock], [self.sock], [])
 
-        data = self.sock.recv()
+        data = self.sock.recv(size)
 
         return infds, data
 
@@ -0,0 +1,155 @@
+"""
+In-memory index of the SecurityList (35=y) sent by the server.
+
+CLASSES:
+SecurityDefinition ------------------------ Static data of one instrument.
+
+    FIELDS:
+    cfi_code ------------------------------ CFICode (461).
+    market_segment ------------------------ MarketSegmentID (1300).
+    min_size ------------------------------ MinTradeVol (562).
+    symbol -------------------------------- Symbol (55).
+    tick_size ----------------------------- MinPriceIncrement (969).
+
+SecurityListIndex ------------------------- Instruments keyed by symbol.
+
+    METHODS:
+    get() --------------------------------- Return SecurityDefinition for symbol, None if unknown.
+    update() ------------------------------ Merge a SecurityList (y) or SecurityListUpdateReport (BK) message.
+"""
+
+from fixtokenizer import tokenize
+
+
+class SecurityDefinition(object):
+    """
+    Static data of one instrument, as sent in the SecurityList.
+    """
+
+    __slots__ = ('symbol', 'tick_size', 'min_size', 'cfi_code', 'market_segment')
+
+    def __init__(self, symbol, tick_size=None, min_size=None, cfi_code=None, market_segment=None):
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self.min_size = min_size
+        self.cfi_code = cfi_code
+        self.market_segment = market_segment
+
+    def __repr__(self):
+        return 'SecurityDefinition(%r, tick_size=%r, min_size=%r, cfi_code=%r, market_segment=%r)' % (
+            self.symbol, self.tick_size, self.min_size, self.cfi_code, self.market_segment)
+
+
+class SecurityListIndex(object):
+    """
+    Instruments of the SecurityList keyed by Symbol (55) and SecurityDesc (107).
+
+    Built once from the list response and updated in place from later list pages
+    or update reports, so symbol lookups are a single dict access.
+    """
+
+    def __init__(self, msg=None):
+        self.instruments = {}
+
+        if msg is not None:
+            self.update(msg)
+
+    def __contains__(self, symbol):
+        return symbol in self.instruments
+
+    def __getitem__(self, symbol):
+        return self.instruments[symbol]
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def get(self, symbol):
+        """
+        Return SecurityDefinition for symbol, None if not listed.
+        """
+        return self.instruments.get(symbol)
+
+    def update(self, msg):
+        """
+        Merge every instrument of msg into the index.
+        msg may hold several concatenated frames. Entries flagged for deletion,
+        ListUpdateAction (1324) or SecurityUpdateAction (980) = D, are removed.
+        """
+        frame = tokenize(msg)
+        buf = frame.buf
+        starts = frame.starts
+        ends = frame.ends
+        instruments = self.instruments
+
+        msg_action = None
+        entry = None
+        entry_action = None
+        aliases = []
+
+        def commit():
+            if entry is None:
+                return
+
+            if (entry_action or msg_action) == b'D':
+                for key in [entry[0]] + aliases:
+                    instruments.pop(key, None)
+                return
+
+            definition = instruments.get(entry[0])
+            if definition is None:
+                definition = SecurityDefinition(entry[0])
+
+            if entry[1] is not None:
+                definition.tick_size = entry[1]
+            if entry[2] is not None:
+                definition.min_size = entry[2]
+            if entry[3] is not None:
+                definition.cfi_code = entry[3]
+            if entry[4] is not None:
+                definition.market_segment = entry[4]
+
+            instruments[entry[0]] = definition
+            for alias in aliases:
+                instruments[alias] = definition
+
+        for i, tag in enumerate(frame.tags):
+            if tag == 55:
+                commit()
+                entry = [bytes(buf[starts[i]:ends[i]]).decode('cp1252'), None, None, None, None]
+                entry_action = None
+                aliases = []
+
+            elif tag == 35:
+                # New frame inside a concatenated list: message level fields reset.
+                commit()
+                entry = None
+                msg_action = None
+
+            elif tag == 980 or tag == 1324:
+                if entry is None:
+                    msg_action = bytes(buf[starts[i]:ends[i]])
+                else:
+                    entry_action = bytes(buf[starts[i]:ends[i]])
+
+            elif entry is None:
+                continue
+
+            elif tag == 969:
+                entry[1] = float(buf[starts[i]:ends[i]])
+
+            elif tag == 562:
+                entry[2] = float(buf[starts[i]:ends[i]])
+
+            elif tag == 461:
+                entry[3] = bytes(buf[starts[i]:ends[i]]).decode('cp1252')
+
+            elif tag == 1300:
+                entry[4] = bytes(buf[starts[i]:ends[i]]).decode('cp1252')
+
+            elif tag == 107:
+                desc = bytes(buf[starts[i]:ends[i]]).decode('cp1252')
+                if desc != entry[0]:
+                    aliases.append(desc)
+
+        commit()
+        return self
@@ -0,0 +1,192 @@
+"""
+Persistent FIX session store.
+
+CLASSES:
+SessionStore ------------------------------ Memory-mapped ring journal of outbound frames plus sequence checkpoints.
+
+    FIELDS:
+    capacity ------------------------------ Number of frames kept (older sequence numbers are overwritten).
+    cl_ord_id ----------------------------- Checkpointed ClOrdID counter.
+    in_seq -------------------------------- Checkpointed last inbound MsgSeqNum.
+    out_seq ------------------------------- Checkpointed last outbound MsgSeqNum.
+    path ---------------------------------- Journal file.
+    slot_size ----------------------------- Bytes per slot (frames longer than slot_size - 16 are gap filled on resend).
+
+    METHODS:
+    append() ------------------------------ Store outbound frame under its MsgSeqNum.
+    checkpoint() -------------------------- Persist sequence numbers / ClOrdID counter.
+    close() ------------------------------- Flush and unmap the journal.
+    flush() ------------------------------- Flush dirty pages to disk.
+    get() --------------------------------- Return (frame, admin) stored for a MsgSeqNum, None if not available.
+
+FUNCTIONS:
+frame_seq_type() -------------------------- Return (MsgSeqNum, MsgType) of an encoded frame.
+possdup_frame() --------------------------- Return stored frame re-stamped as a PossDup resend.
+restamp_frame() --------------------------- Return frame with a new MsgSeqNum and SendingTime (sent again as new).
+
+ADMIN_MSG_TYPES --------------------------- Session level MsgTypes, replaced by SequenceReset-GapFill on resend.
+"""
+
+import mmap
+import os
+import struct
+
+ADMIN_MSG_TYPES = (b'0', b'1', b'2', b'3', b'4', b'5', b'A')
+
+_MAGIC = b'FIXSTORE'
+_HEADER = struct.Struct('<8sIIQQQ')     # magic, capacity, slot_size, out_seq, in_seq, cl_ord_id
+_HEADER_SIZE = 64
+_SLOT = struct.Struct('<QII')           # seq, length, flags
+_ADMIN = 1
+
+
+def frame_seq_type(frame):
+    """
+    Return (MsgSeqNum, MsgType) of an encoded frame, without a full parse.
+    """
+    start = frame.find(b'\x0135=') + 4
+    msg_type = frame[start:frame.find(b'\x01', start)]
+    start = frame.find(b'\x0134=') + 4
+    return int(frame[start:frame.find(b'\x01', start)]), bytes(msg_type)
+
+
+def possdup_frame(frame, sending_time):
+    """
+    Return frame with PossDupFlag (43=Y), SendingTime (52) = sending_time and
+    OrigSendingTime (122) = original SendingTime. Only BodyLength and CheckSum are recomputed.
+    """
+    body_start = frame.find(b'\x01', frame.find(b'\x019=') + 1) + 1
+    body_end = frame.rfind(b'10=', 0, len(frame) - 1)
+
+    start = frame.find(b'\x0152=', body_start - 1) + 4
+    end = frame.find(b'\x01', start)
+    orig_sending_time = frame[start:end]
+
+    seq_end = frame.find(b'\x01', frame.find(b'\x0134=', body_start - 1) + 1) + 1
+    if seq_end < start:
+        body = (frame[body_start:seq_end] + b'43=Y\x01' + frame[seq_end:start] + sending_time +
+                b'\x01122=' + orig_sending_time + frame[end:body_end])
+    else:
+        body = (frame[body_start:start] + sending_time + b'\x01122=' + orig_sending_time +
+                frame[end:seq_end] + b'43=Y\x01' + frame[seq_end:body_end])
+
+    head = frame[:frame.find(b'\x019=') + 3] + str(len(body)).encode('ASCII') + b'\x01'
+    checksum = (sum(head) + sum(body)) % 256
+    return head + body + b'10=%03d\x01' % checksum
+
+
+def restamp_frame(frame, msg_seq_num, sending_time):
+    """
+    Return frame with MsgSeqNum (34) = msg_seq_num and SendingTime (52) = sending_time, to be
+    sent again as a new message. Only BodyLength and CheckSum are recomputed.
+    """
+    body_start = frame.find(b'\x01', frame.find(b'\x019=') + 1) + 1
+    body = frame[body_start:frame.rfind(b'10=', 0, len(frame) - 1)]
+
+    for tag, value in ((b'\x0134=', str(msg_seq_num).encode('ASCII')), (b'\x0152=', sending_time)):
+        start = body.find(tag) + len(tag)
+        body = body[:start] + value + body[body.find(b'\x01', start):]
+
+    head = frame[:frame.find(b'\x019=') + 3] + str(len(body)).encode('ASCII') + b'\x01'
+    checksum = (sum(head) + sum(body)) % 256
+    return head + body + b'10=%03d\x01' % checksum
+
+
+class SessionStore(object):
+    """
+    Outbound frames in a memory-mapped ring journal indexed by MsgSeqNum, plus
+    checkpoints of the inbound/outbound sequence numbers and the ClOrdID counter.
+
+    Slot seq % capacity holds the frame sent with MsgSeqNum seq, so a resend range
+    is served by reading slots back, without re-encoding. Writes go to the page cache
+    through the mapping, so a process crash loses nothing; flush() forces them to disk.
+    Reopening an existing file resumes from its checkpoints.
+    """
+
+    def __init__(self, path, capacity=65536, slot_size=512):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) >= _HEADER_SIZE
+
+        if exists:
+            with open(path, 'rb') as f:
+                magic, capacity, slot_size, _, _, _ = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError('Not a FIX session store: ' + path)
+
+        self.capacity = capacity
+        self.slot_size = slot_size
+        size = _HEADER_SIZE + capacity * slot_size
+
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if os.path.getsize(path) < size:
+            self._file.truncate(size)
+
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+        if not exists:
+            _HEADER.pack_into(self._map, 0, _MAGIC, capacity, slot_size, 0, 0, 0)
+
+    @property
+    def out_seq(self):
+        return _HEADER.unpack_from(self._map, 0)[3]
+
+    @property
+    def in_seq(self):
+        return _HEADER.unpack_from(self._map, 0)[4]
+
+    @property
+    def cl_ord_id(self):
+        return _HEADER.unpack_from(self._map, 0)[5]
+
+    def checkpoint(self, out_seq=None, in_seq=None, cl_ord_id=None):
+        """
+        Persist the given counters (None keeps the stored value).
+        """
+        magic, capacity, slot_size, stored_out, stored_in, stored_cl = _HEADER.unpack_from(self._map, 0)
+        _HEADER.pack_into(self._map, 0, magic, capacity, slot_size,
+                          stored_out if out_seq is None else out_seq,
+                          stored_in if in_seq is None else in_seq,
+                          stored_cl if cl_ord_id is None else cl_ord_id)
+
+    def append(self, seq, frame, admin=False):
+        """
+        Store frame sent with MsgSeqNum seq. Frames that do not fit a slot are kept as
+        gap fill only (length 0). Advances the outbound checkpoint.
+        """
+        offset = _HEADER_SIZE + (seq % self.capacity) * self.slot_size
+        room = self.slot_size - _SLOT.size
+        length = len(frame) if len(frame) <= room else 0
+
+        _SLOT.pack_into(self._map, offset, seq, length, _ADMIN if admin else 0)
+        if length:
+            self._map[offset + _SLOT.size:offset + _SLOT.size + length] = frame
+
+        if seq > self.out_seq:
+            self.checkpoint(out_seq=seq)
+
+    def get(self, seq):
+        """
+        Return (frame, admin) stored for seq, None if overwritten, never stored or too long.
+        """
+        offset = _HEADER_SIZE + (seq % self.capacity) * self.slot_size
+        stored_seq, length, flags = _SLOT.unpack_from(self._map, offset)
+
+        if stored_seq != seq or not length:
+            return None
+
+        start = offset + _SLOT.size
+        return self._map[start:start + length], bool(flags & _ADMIN)
+
+    def flush(self):
+        """
+        Flush journal pages to disk.
+        """
+        self._map.flush()
+
+    def close(self):
+        """
+        Flush and close the journal.
+        """
+        self._map.flush()
+        self._map.close()
+        self._file.close()
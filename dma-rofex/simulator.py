@@ -0,0 +1,867 @@
+"""
+Local FIX acceptor simulating the ROFEX DMA gateway (FIXT.1.1), for offline and load testing.
+
+Run: python simulator.py [--port 9876] [--certfile cert.pem --keyfile key.pem] [--rate 20000]
+
+CLASSES:
+SimOrder ---------------------------------- Order resting in / matched by the simulator.
+
+SimBook ----------------------------------- Price-time priority order book of one instrument.
+
+    FIELDS:
+    asks / bids --------------------------- Price -> deque of SimOrder, in time priority.
+    rpt_seq ------------------------------- RptSeq (83) of the last market data update published.
+    symbol -------------------------------- Ticker symbol.
+
+    METHODS:
+    add() --------------------------------- Match an incoming order, rest the remainder. Return (trades, changes).
+    cancel() ------------------------------ Remove a resting order. Return changes.
+    levels() ------------------------------ Return aggregated ([(price, size)] bids, asks), best first.
+    resize() ------------------------------ Reduce a resting order in place. Return changes.
+
+MatchingEngine ---------------------------- Books per symbol, order ids and execution/market data callbacks.
+
+    FIELDS:
+    books --------------------------------- Symbol -> SimBook.
+    on_book ------------------------------- Called as on_book(book, changes, trades) after every book change.
+    on_execution -------------------------- Called as on_execution(order, exec_type, last_px, last_qty, text).
+    orders -------------------------------- OrderID -> SimOrder of every live order.
+
+    METHODS:
+    cancel() ------------------------------ Cancel live order.
+    mass_cancel() ------------------------- Cancel every live order of an owner (optionally one symbol).
+    new_order() --------------------------- Accept and match a new limit order.
+    replace() ----------------------------- Change price/quantity of a live order.
+
+MarketDataGenerator ----------------------- Scripted quoting and trading on random walks around a mid price.
+
+SimSession -------------------------------- One connected initiator.
+
+FIXSimulator ------------------------------ asyncio TCP/TLS acceptor.
+
+    FIELDS:
+    engine -------------------------------- MatchingEngine shared by every session.
+    generator ----------------------------- MarketDataGenerator (None if rate is 0).
+    instruments --------------------------- List of (symbol, cfi_code, tick size) served in SecurityList (y).
+    sessions ------------------------------ Connected SimSession objects.
+
+    METHODS:
+    close() ------------------------------- Close every session and stop listening (coroutine).
+    serve_forever() ----------------------- Run the acceptor on the current event loop until cancelled.
+    start() ------------------------------- Start listening on the current event loop.
+    start_in_thread() --------------------- Run the acceptor on a background event loop thread.
+    stop() -------------------------------- Stop the simulator started by start_in_thread().
+
+FUNCTIONS:
+encode_frame() ---------------------------- Return a complete frame from header and body fields.
+load_instruments() ------------------------ Return (symbol, cfi_code, tick size) list from instruments.json.
+"""
+
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import random
+import ssl
+import threading
+import time
+from collections import deque
+
+from fixreader import FrameAssembler
+from fixtemplates import SendingTimeClock, fix_val
+from fixtokenizer import FIXFrame
+
+BEGIN_STRING = b'FIXT.1.1'
+DEFAULT_TICK_SIZE = 0.1  # MinPriceIncrement (969) of instruments without minPriceIncrement
+BUY = b'1'
+SELL = b'2'
+
+MD_NEW = b'0'
+MD_CHANGE = b'1'
+MD_DELETE = b'2'
+
+_FINANCIAL_PREFIXES = ('DO', 'RFX', 'ORO', 'WTI', 'GGAL', 'YPFD', 'PAMP', 'TS.', 'AY24', 'DICA', 'DLR', 'BMA')
+
+
+def encode_frame(msg_type, seq_num, sender, target, sending_time, fields=(), begin_string=BEGIN_STRING):
+    """
+    Return encoded frame. fields is an iterable of (tag, value) encoded with fix_val.
+    """
+    body = b'35=' + msg_type + b'\x0134=' + str(seq_num).encode('ASCII') + b'\x0149=' + sender + \
+           b'\x0152=' + sending_time + b'\x0156=' + target + b'\x01' + \
+           b''.join(b'%d=%s\x01' % (tag, fix_val(value)) for tag, value in fields)
+    head = b'8=' + begin_string + b'\x019=' + str(len(body)).encode('ASCII') + b'\x01'
+    return head + body + b'10=%03d\x01' % ((sum(head) + sum(body)) % 256)
+
+
+def load_instruments(path=None):
+    """
+    Return list of (symbol, cfi_code, tick size) from a pyRofex style instruments.json. The tick
+    size is minPriceIncrement (detailed instruments), DEFAULT_TICK_SIZE when absent.
+    """
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instruments.json')
+
+    with open(path) as f:
+        data = json.load(f)
+
+    return [(instrument['instrumentId']['symbol'], instrument.get('cficode', ''),
+             instrument.get('minPriceIncrement', DEFAULT_TICK_SIZE))
+            for instrument in data['instruments']]
+
+
+class SimOrder(object):
+    __slots__ = ('order_id', 'cl_ord_id', 'orig_cl_ord_id', 'owner', 'account', 'symbol', 'side', 'price',
+                 'qty', 'leaves', 'cum_qty', 'notional', 'ord_status')
+
+    def __init__(self, order_id, cl_ord_id, owner, account, symbol, side, price, qty):
+        self.order_id = order_id
+        self.cl_ord_id = cl_ord_id
+        self.orig_cl_ord_id = None
+        self.owner = owner
+        self.account = account
+        self.symbol = symbol
+        self.side = side
+        self.price = price
+        self.qty = qty
+        self.leaves = qty
+        self.cum_qty = 0
+        self.notional = 0.0
+        self.ord_status = b'0'
+
+    @property
+    def avg_px(self):
+        return self.notional / self.cum_qty if self.cum_qty else 0.0
+
+
+class SimBook(object):
+    """
+    Price-time priority book. Each side keeps a sorted price list and a deque of orders per price.
+    Book changes are returned as (action, side, price, level size) tuples, action being MD_NEW,
+    MD_CHANGE or MD_DELETE for the aggregated level.
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = {}
+        self.asks = {}
+        self._bid_prices = []
+        self._ask_prices = []
+        self.rpt_seq = 0
+
+    def _side(self, side):
+        return (self.bids, self._bid_prices) if side == BUY else (self.asks, self._ask_prices)
+
+    @staticmethod
+    def _size(level):
+        return sum(order.leaves for order in level)
+
+    def add(self, order):
+        """
+        Match order against the opposite side, rest what is left.
+        Return (trades as (resting order, price, qty), changes).
+        """
+        trades = []
+        touched = {}
+
+        if order.side == BUY:
+            levels, prices = self.asks, self._ask_prices
+            crosses = lambda price: price <= order.price
+            best = 0
+        else:
+            levels, prices = self.bids, self._bid_prices
+            crosses = lambda price: price >= order.price
+            best = -1
+
+        while order.leaves and prices and crosses(prices[best]):
+            price = prices[best]
+            level = levels[price]
+            touched.setdefault((SELL if order.side == BUY else BUY, price), True)
+
+            while order.leaves and level:
+                resting = level[0]
+                qty = min(order.leaves, resting.leaves)
+                for filled in (order, resting):
+                    filled.leaves -= qty
+                    filled.cum_qty += qty
+                    filled.notional += qty * price
+                trades.append((resting, price, qty))
+                if not resting.leaves:
+                    level.popleft()
+
+            if not level:
+                del levels[price]
+                prices.pop(best)
+
+        if order.leaves:
+            levels, prices = self._side(order.side)
+            level = levels.get(order.price)
+            if level is None:
+                level = levels[order.price] = deque()
+                bisect.insort(prices, order.price)
+                touched[(order.side, order.price)] = False
+            else:
+                touched.setdefault((order.side, order.price), True)
+            level.append(order)
+
+        return trades, self._changes(touched)
+
+    def cancel(self, order):
+        """
+        Remove resting order. Return changes.
+        """
+        levels, prices = self._side(order.side)
+        level = levels.get(order.price)
+        if level is None or order not in level:
+            return []
+
+        level.remove(order)
+        if not level:
+            del levels[order.price]
+            del prices[bisect.bisect_left(prices, order.price)]
+        return self._changes({(order.side, order.price): True})
+
+    def resize(self, order, leaves):
+        """
+        Reduce leaves of a resting order in place (time priority kept). Return changes.
+        """
+        order.leaves = leaves
+        return self._changes({(order.side, order.price): True})
+
+    def _changes(self, touched):
+        changes = []
+        for (side, price), existed in touched.items():
+            level = self._side(side)[0].get(price)
+            if level is None:
+                if existed:
+                    changes.append((MD_DELETE, side, price, 0))
+            else:
+                changes.append((MD_CHANGE if existed else MD_NEW, side, price, self._size(level)))
+        return changes
+
+    def levels(self, depth=5):
+        """
+        Return ([(price, size)] bids, [(price, size)] asks), best level first, at most depth each.
+        """
+        bids = [(price, self._size(self.bids[price])) for price in self._bid_prices[:-depth - 1:-1]]
+        asks = [(price, self._size(self.asks[price])) for price in self._ask_prices[:depth]]
+        return bids, asks
+
+
+class MatchingEngine(object):
+    """
+    Books per symbol plus the live orders, keyed by OrderID and by (owner, ClOrdID).
+    Market data and execution reports are produced by the on_book / on_execution callbacks.
+    """
+
+    def __init__(self, symbols=()):
+        self.books = {symbol: SimBook(symbol) for symbol in symbols}
+        self.orders = {}
+        self._by_cl_ord_id = {}
+        self._order_ids = itertools.count(1)
+        self.on_book = None
+        self.on_execution = None
+
+    def book(self, symbol):
+        return self.books.get(symbol)
+
+    def _execution(self, order, exec_type, last_px=0.0, last_qty=0, text=None):
+        if self.on_execution is not None and order.owner is not None:
+            self.on_execution(order, exec_type, last_px, last_qty, text)
+
+    def _book_changed(self, book, changes, trades=()):
+        if self.on_book is not None and (changes or trades):
+            self.on_book(book, changes, trades)
+
+    def find(self, owner, cl_ord_id):
+        return self._by_cl_ord_id.get((owner, cl_ord_id))
+
+    def new_order(self, owner, cl_ord_id, account, symbol, side, price, qty):
+        """
+        Accept a limit order and match it. Return the SimOrder (None if rejected).
+        """
+        order = SimOrder(str(next(self._order_ids)).encode('ASCII'), cl_ord_id, owner, account, symbol, side,
+                         price, qty)
+        book = self.books.get(symbol)
+
+        if book is None or qty <= 0 or price <= 0 or side not in (BUY, SELL):
+            order.ord_status = b'8'
+            self._execution(order, b'8', text='Unknown symbol' if book is None else 'Invalid order')
+            return None
+
+        self._execution(order, b'0')
+        self._match(book, order)
+        return order
+
+    def _match(self, book, order):
+        trades, changes = book.add(order)
+
+        for resting, price, qty in trades:
+            for filled in (order, resting):
+                filled.ord_status = b'2' if not filled.leaves else b'1'
+                self._execution(filled, b'F', price, qty)
+                if not filled.leaves:
+                    self._forget(filled)
+
+        if order.leaves:
+            self.orders[order.order_id] = order
+            self._by_cl_ord_id[(order.owner, order.cl_ord_id)] = order
+
+        self._book_changed(book, changes, trades)
+
+    def _forget(self, order):
+        self.orders.pop(order.order_id, None)
+        self._by_cl_ord_id.pop((order.owner, order.cl_ord_id), None)
+
+    def cancel(self, order, cl_ord_id=None):
+        """
+        Cancel live order (cl_ord_id: ClOrdID of the cancel request).
+        """
+        changes = self.books[order.symbol].cancel(order)
+        self._forget(order)
+        if cl_ord_id is not None:
+            order.orig_cl_ord_id, order.cl_ord_id = order.cl_ord_id, cl_ord_id
+        order.leaves = 0
+        order.ord_status = b'4'
+        self._execution(order, b'4')
+        self._book_changed(self.books[order.symbol], changes)
+
+    def replace(self, order, cl_ord_id, price, qty):
+        """
+        Change price/quantity of a live order. A quantity decrease at the same price keeps
+        time priority, anything else re-enters the book (and may match).
+        """
+        book = self.books[order.symbol]
+        leaves = qty - order.cum_qty
+        self._forget(order)
+        order.orig_cl_ord_id, order.cl_ord_id = order.cl_ord_id, cl_ord_id
+
+        if price == order.price and qty <= order.qty and leaves > 0:
+            order.qty = qty
+            changes = book.resize(order, leaves)
+            self.orders[order.order_id] = order
+            self._by_cl_ord_id[(order.owner, order.cl_ord_id)] = order
+            self._execution(order, b'5')
+            self._book_changed(book, changes)
+            return
+
+        changes = book.cancel(order)
+        order.price = price
+        order.qty = qty
+        order.leaves = max(0, leaves)
+
+        if not order.leaves:
+            order.ord_status = b'4'
+            self._execution(order, b'4')
+            self._book_changed(book, changes)
+            return
+
+        order.ord_status = b'1' if order.cum_qty else b'0'
+        self._execution(order, b'5')
+        self._book_changed(book, changes)
+        self._match(book, order)
+
+    def mass_cancel(self, owner, symbol=None):
+        """
+        Cancel every live order of owner (only symbol, if given). Return number cancelled.
+        """
+        orders = [order for order in list(self.orders.values())
+                  if order.owner is owner and (symbol is None or order.symbol == symbol)]
+        for order in orders:
+            self.cancel(order)
+        return len(orders)
+
+
+class MarketDataGenerator(object):
+    """
+    Quote and trade symbols of a MatchingEngine from a random walk around a mid price.
+
+    Every step picks a symbol and either adds a passive order within levels ticks of the
+    mid, cancels one of its resting orders, or (trade_ratio of the steps) sends an order
+    crossing the spread. rate steps per second are run in batches every interval seconds;
+    step() can also be called directly for a scripted sequence.
+    """
+
+    def __init__(self, engine, symbols=None, rate=20000, levels=5, tick=0.5, interval=0.01, trade_ratio=0.05,
+                 seed=None):
+        self.engine = engine
+        self.symbols = list(symbols if symbols is not None else engine.books)
+        self.rate = rate
+        self.levels = levels
+        self.tick = tick
+        self.interval = interval
+        self.trade_ratio = trade_ratio
+        self.random = random.Random(seed)
+        self.mid = {symbol: 100.0 + self.random.randint(0, 1000) * tick for symbol in self.symbols}
+        self.resting = {symbol: [] for symbol in self.symbols}
+        self.steps = 0
+        self._cl_ord_ids = itertools.count(1)
+
+    def seed_books(self):
+        """
+        Fill levels price levels on both sides of every symbol.
+        """
+        for symbol in self.symbols:
+            for level in range(1, self.levels + 1):
+                for side in (BUY, SELL):
+                    self._quote(symbol, side, level)
+
+    def _quote(self, symbol, side, level):
+        mid = self.mid[symbol]
+        price = mid - level * self.tick if side == BUY else mid + level * self.tick
+        order = self.engine.new_order(None, next(self._cl_ord_ids), '', symbol, side, round(price, 6),
+                                      self.random.randint(1, 50))
+        if order is not None and order.leaves:
+            self.resting[symbol].append(order)
+
+    def step(self):
+        rnd = self.random
+        symbol = rnd.choice(self.symbols)
+        resting = self.resting[symbol]
+        draw = rnd.random()
+        self.steps += 1
+
+        if draw < self.trade_ratio:
+            side = rnd.choice((BUY, SELL))
+            self.mid[symbol] += self.tick if side == BUY else -self.tick
+            self._quote(symbol, side, -1)
+        elif draw < 0.55 or not resting:
+            self._quote(symbol, rnd.choice((BUY, SELL)), rnd.randint(1, self.levels))
+        else:
+            order = resting.pop(rnd.randrange(len(resting)))
+            if order.leaves:
+                self.engine.cancel(order)
+
+        if len(resting) > 4 * self.levels:
+            self.resting[symbol] = [order for order in resting if order.leaves]
+
+    async def run(self, flush=None):
+        """
+        Run rate steps per second until cancelled, calling flush() after every batch.
+        """
+        batch = max(1, int(self.rate * self.interval))
+        loop = asyncio.get_running_loop()
+        next_batch = loop.time()
+
+        while True:
+            for _ in range(batch):
+                self.step()
+            if flush is not None:
+                flush()
+
+            next_batch += self.interval
+            await asyncio.sleep(max(0.0, next_batch - loop.time()))
+
+
+class SimSession(object):
+    """
+    Acceptor side of one FIX session: inbound framing, outbound sequencing and write batching.
+    """
+
+    def __init__(self, simulator, writer):
+        self.simulator = simulator
+        self.writer = writer
+        self.assembler = FrameAssembler()
+        self.sender = b'ROFX'
+        self.target = b''
+        self.account = ''
+        self.seq_num = 0
+        self.logged_on = False
+        self.subscriptions = {}  # MDReqID -> (symbols, depth, incremental, entry types)
+        self.trades = []
+        self._pending = []
+
+    def queue(self, msg_type, fields=(), seq_num=None):
+        """
+        Queue a message with the next MsgSeqNum, or with seq_num (resent range) leaving the sequence as is.
+        """
+        if seq_num is None:
+            self.seq_num += 1
+            seq_num = self.seq_num
+        self._pending.append(encode_frame(msg_type, seq_num, self.sender, self.target,
+                                          self.simulator.clock.now_bytes(), fields))
+
+    def flush(self):
+        if self._pending and not self.writer.is_closing():
+            self.writer.write(b''.join(self._pending))
+        self._pending = []
+
+
+class FIXSimulator(object):
+    """
+    FIXT.1.1 acceptor speaking the ROFEX DMA dialect:
+
+    - A, 0, 1, 2, 5 session messages (TestRequest answered, ResendRequest gap filled).
+    - x -> y SecurityList from instruments.json.
+    - V -> W snapshot, then W (MDUpdateType 0) or X (MDUpdateType 1) on every book change.
+    - D, F, G, q, H -> 8 ExecutionReports (q also -> r OrderMassCancelReport).
+    - AD -> AQ acknowledgement plus one AE per trade of the session.
+
+    Orders from every session and the MarketDataGenerator share one MatchingEngine.
+    With certfile/keyfile the acceptor listens over TLS, otherwise plain TCP.
+    """
+
+    def __init__(self, host='127.0.0.1', port=9876, instruments=None, certfile=None, keyfile=None, rate=0,
+                 symbols=20, depth=5, seed=None):
+        self.host = host
+        self.port = port
+        self.instruments = instruments if instruments is not None else load_instruments()
+        self.engine = MatchingEngine(symbol for symbol, _, _ in self.instruments)
+        self.engine.on_book = self._on_book
+        self.engine.on_execution = self._on_execution
+        self.clock = SendingTimeClock()
+        self.sessions = []
+        self.depth = depth
+
+        self.ssl = None
+        if certfile is not None:
+            self.ssl = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.ssl.load_cert_chain(certfile, keyfile)
+
+        self.generator = None
+        if rate:
+            quoted = [symbol for symbol, _, _ in self.instruments[:symbols]]
+            self.generator = MarketDataGenerator(self.engine, quoted, rate, depth, seed=seed)
+
+        self._server = None
+        self._tasks = []
+        self._session_tasks = set()
+        self._loop = None
+        self._thread = None
+        self._trade_ids = itertools.count(1)
+        self._exec_ids = itertools.count(1)
+
+    # Acceptor
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, ssl=self.ssl)
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+
+        if self.generator is not None:
+            self.generator.seed_books()
+            self._tasks.append(asyncio.get_running_loop().create_task(self.generator.run(self._flush_all)))
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_in_thread(self):
+        """
+        Run the simulator on its own event loop thread; return once it is listening.
+        """
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='FIXSimulator', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        """
+        Close every session and stop listening (and the loop started by start_in_thread).
+        """
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+
+    async def close(self):
+        """
+        Close every session and stop listening, on the simulator event loop.
+        """
+        for task in self._tasks:
+            task.cancel()
+        for session in self.sessions:
+            session.writer.close()
+        if self._server is not None:
+            self._server.close()
+
+        # Closed sessions finish their _serve() task on the EOF.
+        await asyncio.gather(*self._tasks, *self._session_tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _serve(self, reader, writer):
+        session = SimSession(self, writer)
+        self.sessions.append(session)
+        self._session_tasks.add(asyncio.current_task())
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+
+                for raw in session.assembler.feed(data):
+                    self._handle(session, FIXFrame(raw))
+                # Fills of resting orders and book updates are queued on the other sessions too.
+                self._flush_all()
+
+                if writer.is_closing():
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.sessions.remove(session)
+            self._session_tasks.discard(asyncio.current_task())
+            self.engine.mass_cancel(session)
+            writer.close()
+
+    def _flush_all(self):
+        for session in self.sessions:
+            session.flush()
+
+    # Inbound messages
+
+    def _handle(self, session, msg):
+        msg_type = bytes(msg.get(35))
+        handler = self._HANDLERS.get(msg_type)
+
+        if not session.logged_on and msg_type != b'A':
+            session.queue(b'5', [(58, 'Logon required')])
+            session.writer.close()
+            return
+
+        if handler is None:
+            session.queue(b'3', [(45, msg.get(34)), (372, msg_type), (373, 11), (58, 'Unsupported MsgType')])
+            return
+
+        handler(self, session, msg)
+
+    def _logon(self, session, msg):
+        session.target = bytes(msg.get(49))
+        session.sender = bytes(msg.get(56) or b'ROFX')
+        session.logged_on = True
+        session.queue(b'A', [(98, 0), (108, msg.get(108) or b'60'), (1137, 9)])
+
+    def _heartbeat(self, session, msg):
+        pass
+
+    def _test_request(self, session, msg):
+        session.queue(b'0', [(112, msg.get(112))])
+
+    def _resend_request(self, session, msg):
+        # Nothing is journaled: the whole range, up to the last message sent, is skipped with one
+        # SequenceReset-GapFill carrying BeginSeqNo (7) as MsgSeqNum; the sequence is not rewound.
+        begin = int(msg.get(7))
+        if begin > session.seq_num:
+            return
+        now = self.clock.now_bytes()
+        session.queue(b'4', [(43, 'Y'), (122, now), (123, 'Y'), (36, session.seq_num + 1)], seq_num=begin)
+
+    def _logout(self, session, msg):
+        session.queue(b'5')
+        session.flush()
+        session.writer.close()
+
+    def _security_list_request(self, session, msg, chunk_size=100):
+        instruments = self.instruments
+        req_id = msg.get(320) or b'0'
+        chunks = [instruments[i:i + chunk_size] for i in range(0, len(instruments), chunk_size)] or [[]]
+
+        for n, chunk in enumerate(chunks):
+            fields = [(320, req_id), (322, n + 1), (560, 0), (393, len(instruments)),
+                      (893, 'Y' if n == len(chunks) - 1 else 'N'), (146, len(chunk))]
+            for symbol, cfi_code, tick_size in chunk:
+                segment = 'DDF' if symbol.startswith(_FINANCIAL_PREFIXES) else 'DDA'
+                fields += [(55, symbol), (461, cfi_code), (969, tick_size), (562, 1), (1300, segment)]
+            session.queue(b'y', fields)
+
+    def _market_data_request(self, session, msg):
+        req_id = bytes(msg.get(262))
+        request_type = msg.get(263)
+
+        if request_type == b'2':
+            session.subscriptions.pop(req_id, None)
+            return
+
+        symbols = []
+        n = 1
+        while msg.get(55, n) is not None:
+            symbols.append(bytes(msg.get(55, n)).decode('cp1252'))
+            n += 1
+        entry_types = set()
+        n = 1
+        while msg.get(269, n) is not None:
+            entry_types.add(bytes(msg.get(269, n)))
+            n += 1
+
+        depth = int(msg.get(264) or self.depth) or self.depth
+        incremental = msg.get(265) == b'1'
+
+        unknown = [symbol for symbol in symbols if symbol not in self.engine.books]
+        if unknown:
+            session.queue(b'Y', [(262, req_id), (281, 0), (58, 'Unknown symbol: ' + ', '.join(unknown))])
+            return
+
+        for symbol in symbols:
+            self._queue_snapshot(session, req_id, self.engine.books[symbol], depth, entry_types)
+
+        if request_type == b'1':
+            session.subscriptions[req_id] = (set(symbols), depth, incremental, entry_types)
+
+    def _queue_snapshot(self, session, req_id, book, depth, entry_types):
+        bids, asks = book.levels(depth)
+        entries = []
+        if b'0' in entry_types:
+            for price, size in bids:
+                entries += [(269, 0), (270, price), (271, size)]
+        if b'1' in entry_types:
+            for price, size in asks:
+                entries += [(269, 1), (270, price), (271, size)]
+
+        session.queue(b'W', [(262, req_id), (55, book.symbol), (83, book.rpt_seq), (268, len(entries) // 3)]
+                      + entries)
+
+    def _new_order(self, session, msg):
+        session.account = msg.get(1) or session.account
+        try:
+            price, qty = float(msg.get(44)), int(float(msg.get(38)))
+        except (TypeError, ValueError):
+            price, qty = 0.0, 0
+        self.engine.new_order(session, bytes(msg.get(11)), session.account, bytes(msg.get(55)).decode('cp1252'),
+                              bytes(msg.get(54)), price, qty)
+
+    def _live_order(self, session, msg, cl_ord_id):
+        order = self.engine.find(session, bytes(msg.get(41)))
+        if order is None:
+            session.queue(b'9', [(11, cl_ord_id), (41, msg.get(41)), (37, 'NONE'), (39, 8), (102, 1),
+                                 (434, 1 if msg.get(35) == b'F' else 2), (58, 'Unknown order')])
+        return order
+
+    def _cancel_order(self, session, msg):
+        cl_ord_id = bytes(msg.get(11))
+        order = self._live_order(session, msg, cl_ord_id)
+        if order is not None:
+            self.engine.cancel(order, cl_ord_id)
+
+    def _replace_order(self, session, msg):
+        cl_ord_id = bytes(msg.get(11))
+        order = self._live_order(session, msg, cl_ord_id)
+        if order is not None:
+            self.engine.replace(order, cl_ord_id, float(msg.get(44)), int(float(msg.get(38))))
+
+    def _mass_cancel(self, session, msg):
+        symbol = msg.get(55)
+        cancelled = self.engine.mass_cancel(session, None if symbol is None else bytes(symbol).decode('cp1252'))
+        session.queue(b'r', [(11, msg.get(11)), (530, msg.get(530) or b'7'), (531, msg.get(530) or b'7'),
+                             (533, cancelled)])
+
+    def _order_status(self, session, msg):
+        order = self.engine.orders.get(bytes(msg.get(37)))
+        if order is None or order.owner is not session:
+            session.queue(b'8', [(37, msg.get(37)), (17, next(self._exec_ids)), (150, 'I'), (39, 8),
+                                 (55, msg.get(55)), (54, msg.get(54)), (151, 0), (14, 0), (6, 0),
+                                 (58, 'Unknown order')])
+        else:
+            self._queue_execution(session, order, b'I', 0.0, 0)
+
+    def _trade_capture_request(self, session, msg):
+        req_id = msg.get(568)
+        session.queue(b'AQ', [(568, req_id), (569, msg.get(569) or b'1'), (748, len(session.trades)), (749, 0),
+                              (750, 0)])
+        for trade in session.trades:
+            session.queue(b'AE', [(568, req_id), (748, len(session.trades))] + trade)
+
+    _HANDLERS = {
+        b'A': _logon,
+        b'0': _heartbeat,
+        b'1': _test_request,
+        b'2': _resend_request,
+        b'5': _logout,
+        b'x': _security_list_request,
+        b'V': _market_data_request,
+        b'D': _new_order,
+        b'F': _cancel_order,
+        b'G': _replace_order,
+        b'q': _mass_cancel,
+        b'H': _order_status,
+        b'AD': _trade_capture_request,
+    }
+
+    # Outbound messages
+
+    def _queue_execution(self, session, order, exec_type, last_px, last_qty, text=None):
+        exec_id = next(self._exec_ids)
+        fields = [(37, order.order_id), (11, order.cl_ord_id)]
+        if order.orig_cl_ord_id is not None and exec_type in (b'4', b'5'):
+            fields.append((41, order.orig_cl_ord_id))
+        fields += [(17, exec_id), (150, exec_type), (39, order.ord_status), (1, order.account), (55, order.symbol),
+                   (54, order.side), (38, order.qty), (44, order.price), (32, last_qty), (31, last_px),
+                   (14, order.cum_qty), (151, order.leaves), (6, order.avg_px), (60, self.clock.now_bytes())]
+        if text is not None:
+            fields.append((58, text))
+        session.queue(b'8', fields)
+        return exec_id
+
+    def _on_execution(self, order, exec_type, last_px, last_qty, text):
+        session = order.owner
+        exec_id = self._queue_execution(session, order, exec_type, last_px, last_qty, text)
+
+        if exec_type == b'F':
+            # Side, OrderID, ClOrdID and Account in the NoSides (552) group, as the gateway sends them.
+            session.trades.append([(571, next(self._trade_ids)), (17, exec_id), (55, order.symbol),
+                                   (32, last_qty), (31, last_px), (75, time.strftime('%Y%m%d')),
+                                   (60, self.clock.now_bytes()), (552, 1), (54, order.side),
+                                   (37, order.order_id), (11, order.cl_ord_id), (1, order.account)])
+
+    def _on_book(self, book, changes, trades):
+        subscribers = [(session, req_id, subscription) for session in self.sessions
+                       for req_id, subscription in session.subscriptions.items() if book.symbol in subscription[0]]
+        if not subscribers:
+            return
+
+        book.rpt_seq += 1
+        incremental = None
+
+        for session, req_id, (_, depth, is_incremental, entry_types) in subscribers:
+            if not is_incremental:
+                self._queue_snapshot(session, req_id, book, depth, entry_types)
+                continue
+
+            if incremental is None:
+                incremental = []
+                for action, side, price, size in changes:
+                    entry_type = b'0' if side == BUY else b'1'
+                    incremental.append((entry_type, [(279, action), (269, entry_type), (270, price), (271, size)]))
+                for _, price, qty in trades:
+                    incremental.append((b'2', [(279, 0), (269, 2), (270, price), (271, qty)]))
+
+            entries = [fields for entry_type, fields in incremental if entry_type in entry_types]
+            session.queue(b'X', [(262, req_id), (55, book.symbol), (83, book.rpt_seq), (268, len(entries))]
+                          + [field for fields in entries for field in fields])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local ROFEX DMA FIX acceptor simulator.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9876)
+    parser.add_argument('--certfile', help='PEM certificate, enables TLS')
+    parser.add_argument('--keyfile', help='PEM private key of certfile')
+    parser.add_argument('--rate', type=int, default=0, help='Generated market data steps per second')
+    parser.add_argument('--symbols', type=int, default=20, help='Instruments quoted by the generator')
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    simulator = FIXSimulator(args.host, args.port, certfile=args.certfile, keyfile=args.keyfile, rate=args.rate,
+                             symbols=args.symbols, depth=args.depth, seed=args.seed)
+    print('FIX simulator listening on %s:%d (%s)' % (args.host, args.port, 'TLS' if simulator.ssl else 'TCP'))
+    try:
+        asyncio.run(simulator.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
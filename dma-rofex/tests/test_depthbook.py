@@ -0,0 +1,81 @@
+"""
+DepthBook: side replacement, stale payloads, top of book and consistent copies.
+"""
+
+import numpy as np
+
+from depthbook import DepthBook
+
+
+def _levels(*pairs):
+    return [{'price': price, 'size': size} for price, size in pairs]
+
+
+def test_update_fills_both_sides_and_last_trade():
+    book = DepthBook('DLR/DIC20', depth=3)
+
+    assert book.update({'BI': _levels((70.0, 5), (69.5, 2)), 'OF': _levels((70.5, 1)),
+                        'LA': {'price': 70.25, 'size': 4, 'date': 0}})
+
+    assert (book.bid_levels, book.ask_levels, book.updates) == (2, 1, 1)
+    assert book.levels.tolist() == [[5, 70.0, 70.5, 1], [2, 69.5, 0, 0], [0, 0, 0, 0]]
+    assert (book.last_price, book.last_size) == (70.25, 4)
+    assert book.top() == (5.0, 70.0, 70.5, 1.0)
+
+
+def test_shorter_side_zeroes_stale_rows_and_absent_side_is_kept():
+    book = DepthBook('DLR/DIC20', depth=3)
+    book.update({'BI': _levels((70.0, 5), (69.5, 2), (69.0, 1)), 'OF': _levels((70.5, 1), (71.0, 3))})
+
+    book.update({'BI': _levels((69.5, 7))})
+
+    assert book.bid_levels == 1
+    assert book.levels[:, 0].tolist() == [7, 0, 0] and book.levels[:, 1].tolist() == [69.5, 0, 0]
+    assert book.ask_levels == 2 and book.best_offer() == (70.5, 1.0)
+
+    book.update({'OF': []})
+    assert book.ask_levels == 0 and not book.levels[:, 2:].any()
+
+
+def test_sides_are_truncated_to_depth():
+    book = DepthBook('DLR/DIC20', depth=2)
+
+    book.update({'OF': _levels((70.5, 1), (71.0, 2), (71.5, 3))})
+
+    assert book.ask_levels == 2
+    assert book.levels[:, 2].tolist() == [70.5, 71.0]
+
+
+def test_older_timestamp_is_rejected():
+    book = DepthBook('DLR/DIC20')
+    book.update({'BI': _levels((70.0, 5))}, timestamp=2)
+
+    assert not book.update({'BI': _levels((60.0, 1))}, timestamp=1)
+    assert book.best_bid() == (70.0, 5.0) and book.updates == 1
+    assert book.update({'BI': _levels((71.0, 1))}, timestamp=2)
+    assert book.timestamp == 2
+
+
+def test_top_of_book_queries():
+    book = DepthBook('DLR/DIC20')
+    assert book.best_bid() == (0.0, 0.0) and book.best_offer() == (0.0, 0.0)
+    assert book.spread() is None and not book.crossed()
+
+    book.update({'BI': _levels((70.0, 5)), 'OF': _levels((70.5, 1))})
+    assert book.spread() == 0.5 and not book.crossed()
+
+    book.update({'OF': _levels((69.5, 1))})
+    assert book.crossed()
+
+
+def test_copy_is_detached_and_clear_resets_levels():
+    book = DepthBook('DLR/DIC20', depth=3)
+    book.update({'BI': _levels((70.0, 5), (69.5, 2)), 'LA': {'price': 70.0, 'size': 1}}, timestamp=1)
+
+    levels, bids, asks, last_price, last_size = book.copy(depth=2)
+    book.clear()
+
+    assert levels.shape == (2, 4) and levels[0].tolist() == [5, 70.0, 0, 0]
+    assert (bids, asks, last_price, last_size) == (2, 0, 70.0, 1)
+    assert not np.any(book.levels) and (book.bid_levels, book.ask_levels, book.timestamp) == (0, 0, None)
+    assert book.update({'BI': _levels((70.0, 1))}, timestamp=0)
@@ -0,0 +1,97 @@
+"""
+Inbound MsgSeqNum tracking: FIXEngine.record_inbound / session_level.
+"""
+
+import simplefix
+import pytest
+
+from fixengine import FIXEngine
+from fixsession import FIXSession
+
+
+def _session():
+    return FIXSession(user='me', party_id='me', account='ACC', xchange_name='ROFX', sender_comp_id='me',
+                      username='me', password='secret')
+
+
+def _inbound(seq, msg_type=b'0', fields=()):
+    msg = simplefix.FixMessage()
+    msg.append_pair(8, 'FIXT.1.1')
+    msg.append_pair(35, msg_type)
+    msg.append_pair(34, seq)
+    for tag, value in fields:
+        msg.append_pair(tag, value)
+    return msg
+
+
+@pytest.fixture
+def engine():
+    return FIXEngine(session=_session())
+
+
+def test_first_inbound_message_is_the_starting_point(engine):
+    assert engine.record_inbound(_inbound(7)) == []
+    assert engine.session.seq_num_server == 7
+
+
+def test_gap_is_requested_once(engine):
+    engine.record_inbound(_inbound(1))
+
+    replies = engine.record_inbound(_inbound(5))
+    assert len(replies) == 1
+    request = replies[0]
+    assert request.get(35) == b'2'
+    assert request.get(7) == b'2'
+    assert request.get(16) == b'0'
+    assert engine.session.seq_num_server == 5
+
+    # Messages after the gap while it is being resent do not ask again.
+    assert engine.record_inbound(_inbound(6)) == []
+
+
+def test_possdup_resend_never_moves_the_sequence(engine):
+    engine.record_inbound(_inbound(1))
+    engine.record_inbound(_inbound(5))
+
+    assert engine.record_inbound(_inbound(2, fields=[(43, 'Y')])) == []
+    assert engine.session.seq_num_server == 5
+
+
+def test_lower_sequence_number_does_not_rewind(engine):
+    engine.record_inbound(_inbound(10))
+    engine.record_inbound(_inbound(3))
+    assert engine.session.seq_num_server == 10
+
+
+def test_sequence_reset_moves_to_new_seq_no(engine):
+    engine.record_inbound(_inbound(1))
+    engine.record_inbound(_inbound(5))
+
+    assert engine.record_inbound(_inbound(2, b'4', [(123, 'Y'), (36, 20)])) == []
+    assert engine.session.seq_num_server == 19
+
+
+def test_gap_fill_ends_the_resend_so_a_new_gap_is_requested(engine):
+    engine.record_inbound(_inbound(1))
+    engine.record_inbound(_inbound(5))
+    engine.record_inbound(_inbound(2, b'4', [(123, 'Y'), (43, 'Y'), (36, 5)]))
+
+    replies = engine.record_inbound(_inbound(9))
+    assert [reply.get(7) for reply in replies] == [b'6']
+
+
+def test_dispatch_does_not_sequence(engine):
+    engine.record_inbound(_inbound(1))
+    engine.dispatch(_inbound(5))
+    assert engine.session.seq_num_server == 1
+
+
+def test_session_level_requests_gap_and_answers_resend_request(engine):
+    engine.session.seq_num = 3
+    engine.record_inbound(_inbound(1))
+
+    replies = engine.session_level(_inbound(4, b'2', [(7, 1), (16, 0)]))
+    # The ResendRequest for 2-3 first, then the answer to the peer's (no store: one gap fill).
+    assert [(reply.get(35), reply.get(7)) for reply in replies[:1]] == [(b'2', b'2')]
+    assert len(replies) == 2
+    assert bytes(replies[1]).count(b'\x0135=4\x01') == 1
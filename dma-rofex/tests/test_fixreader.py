@@ -0,0 +1,142 @@
+"""
+FrameAssembler stream framing, SPSCQueue and ReaderThread.
+"""
+
+import socket
+import time
+
+from fixreader import FrameAssembler, ReaderThread, SPSCQueue
+
+
+def _frame(seq, msg_type=b'0'):
+    body = b'35=' + msg_type + b'\x0134=%d\x0149=ROFX\x0156=me\x01' % seq
+    head = b'8=FIXT.1.1\x019=%d\x01' % len(body)
+    return head + body + b'10=%03d\x01' % ((sum(head) + sum(body)) % 256)
+
+
+def test_whole_frames_in_one_chunk():
+    frames = [_frame(1), _frame(2), _frame(3)]
+    assembler = FrameAssembler()
+
+    assert assembler.feed(b''.join(frames)) == frames
+    assert assembler.buffer == bytearray()
+
+
+def test_frame_split_across_every_byte():
+    frame = _frame(7, b'8')
+    assembler = FrameAssembler()
+
+    received = []
+    for i in range(len(frame)):
+        received += assembler.feed(frame[i:i + 1])
+
+    assert received == [frame]
+    assert assembler.buffer == bytearray()
+
+
+def test_split_inside_body_length_and_checksum():
+    first, second = _frame(1), _frame(2)
+    stream = first + second
+    cuts = (12, len(first) - 3, len(first) + 11)
+
+    assembler = FrameAssembler()
+    received = []
+    start = 0
+    for cut in cuts + (len(stream),):
+        received += assembler.feed(stream[start:cut])
+        start = cut
+
+    assert received == [first, second]
+
+
+def test_bad_checksum_is_dropped_and_stream_resynchronised():
+    good = _frame(2)
+    bad = bytearray(_frame(1))
+    bad[-4:-1] = b'%03d' % ((int(bad[-4:-1]) + 1) % 256)
+
+    assembler = FrameAssembler()
+    assert assembler.feed(bytes(bad) + good) == [good]
+    assert assembler.bad_frames == 1
+
+
+def test_garbage_before_a_frame_is_skipped():
+    frame = _frame(3)
+    assembler = FrameAssembler()
+
+    assert assembler.feed(b'xx\x01junk' + frame) == [frame]
+
+
+def test_malformed_body_length_is_counted():
+    frame = _frame(4)
+    assembler = FrameAssembler()
+
+    assert assembler.feed(b'8=FIXT.1.1\x019=abc\x01' + frame) == [frame]
+    assert assembler.bad_frames == 1
+
+
+def test_spsc_queue_order_and_timeout():
+    queue = SPSCQueue(4)
+    for item in range(3):
+        queue.put(item)
+
+    assert [queue.get_nowait() for _ in range(3)] == [0, 1, 2]
+    assert queue.get_nowait() is None
+    assert queue.get(timeout=0.01) is None
+    assert queue.stats()['high_water_mark'] == 3
+
+
+def test_reader_thread_queues_frames_and_reports_disconnect():
+    ours, peer = socket.socketpair()
+    queue = SPSCQueue(16)
+    seen = []
+    disconnects = []
+    reader = ReaderThread(ours, queue, on_frame=lambda frame: seen.append(int(frame.get(34))),
+                          on_disconnect=disconnects.append)
+    reader.start()
+
+    stream = _frame(1) + _frame(2)
+    peer.sendall(stream[:20])
+    peer.sendall(stream[20:])
+    assert [int(queue.get(timeout=2).get(34)) for _ in range(2)] == [1, 2]
+    assert seen == [1, 2]
+
+    peer.close()
+    reader.join(2)
+    assert not reader.is_alive()
+    assert disconnects == [None]
+    ours.close()
+
+
+def test_reader_stopped_from_on_frame_queues_nothing_more():
+    ours, peer = socket.socketpair()
+    queue = SPSCQueue(16)
+    seen = []
+
+    def on_frame(frame):
+        seen.append(int(frame.get(34)))
+        if len(seen) == 2:
+            assert reader.stop() is False   # its own thread: not joined
+
+    reader = ReaderThread(ours, queue, on_frame=on_frame)
+    reader.start()
+    peer.sendall(b''.join(_frame(seq) for seq in range(1, 6)))
+
+    reader.join(2)
+    assert not reader.is_alive()
+    assert seen == [1, 2]
+    # The frame being handled is still queued, the rest of the chunk is not.
+    assert len(queue) == 2
+    time.sleep(0.05)
+    assert len(queue) == 2
+    ours.close()
+    peer.close()
+
+
+def test_stop_joins_a_blocked_reader():
+    ours, peer = socket.socketpair()
+    reader = ReaderThread(ours, SPSCQueue(4))
+    reader.start()
+
+    assert reader.stop(timeout=2) is True
+    ours.close()
+    peer.close()
@@ -0,0 +1,107 @@
+"""
+OrderManager: order state transitions from websocket order reports.
+"""
+
+import threading
+
+from ordermanager import (CANCELLED, FILLED, NEW, PARTIALLY_FILLED, PENDING_CANCEL, PENDING_NEW, REJECTED,
+                          OrderManager)
+
+
+def _report(cl_ord_id, status, orig_cl_ord_id=None, order_id='O1', cum_qty=0, leaves_qty=10, text=None):
+    report = {'clOrdId': cl_ord_id, 'orderId': order_id, 'status': status, 'cumQty': cum_qty,
+              'leavesQty': leaves_qty, 'avgPx': 70.0 if cum_qty else 0.0, 'text': text,
+              'instrumentId': {'symbol': 'DLR/DIC20'}, 'side': 'BUY', 'price': 70.0, 'orderQty': 10}
+    if orig_cl_ord_id is not None:
+        report['origClOrdId'] = orig_cl_ord_id
+    return {'type': 'or', 'orderReport': report}
+
+
+def test_fill_lifecycle():
+    changes = []
+    manager = OrderManager(on_change=changes.append)
+    order = manager.sent('C1', 'DLR/DIC20', 'BUY', 70.0, 10, proprietary='PBCP')
+    assert order.state == PENDING_NEW and order.active
+
+    manager.on_order_report(_report('C1', NEW))
+    assert order.state == NEW and manager.by_order_id('O1') is order
+
+    manager.on_order_report(_report('C1', PARTIALLY_FILLED, cum_qty=4, leaves_qty=6))
+    assert (order.state, order.cum_qty, order.leaves_qty, order.avg_px) == (PARTIALLY_FILLED, 4, 6, 70.0)
+
+    manager.on_order_report(_report('C1', FILLED, cum_qty=10, leaves_qty=0))
+    assert order.state == FILLED and not order.active
+    assert changes == [order] * 3 and manager.reports == 3
+
+
+def test_report_after_terminal_state_is_counted_and_ignored():
+    manager = OrderManager()
+    order = manager.sent('C1', 'DLR/DIC20', 'BUY', 70.0, 10)
+    manager.on_order_report(_report('C1', FILLED, cum_qty=10, leaves_qty=0))
+
+    manager.on_order_report(_report('C1', NEW))
+    manager.on_order_report(_report('C1', FILLED, cum_qty=10, leaves_qty=0))
+
+    assert order.state == FILLED and order.cum_qty == 10
+    assert manager.invalid_transitions == 1
+
+
+def test_cancel_and_cancel_reject():
+    manager = OrderManager()
+    order = manager.sent('C1', 'DLR/DIC20', 'BUY', 70.0, 10)
+    manager.on_order_report(_report('C1', NEW))
+
+    assert manager.cancel_sent('C1', 'C2') is order
+    assert order.state == PENDING_CANCEL and manager.get('C2') is order and order.cl_ord_ids == ['C1', 'C2']
+
+    manager.on_order_report(_report('C2', REJECTED, orig_cl_ord_id='C1', text='Too late to cancel'))
+    assert (order.state, order.cancel_rejected, order.text) == (NEW, True, 'Too late to cancel')
+
+    manager.cancel_sent('C1', 'C3')
+    assert order.state == PENDING_CANCEL and not order.cancel_rejected
+    manager.on_order_report(_report('C3', 'CANCELED', orig_cl_ord_id='C1', leaves_qty=0))
+    assert order.state == CANCELLED and not order.active
+    assert manager.cancel_sent('unknown') is None
+
+
+def test_report_for_unknown_order_creates_it():
+    manager = OrderManager()
+
+    order = manager.on_order_report(_report('X1', NEW, order_id='O9'))
+
+    assert (order.cl_ord_id, order.symbol, order.side, order.price, order.size) == ('X1', 'DLR/DIC20', 'BUY',
+                                                                                   70.0, 10)
+    assert manager.get('X1') is order and manager.by_order_id('O9') is order
+
+    # The send_order response arriving after the first report keeps the same order.
+    assert manager.sent('X1', 'DLR/DIC20', 'BUY', 70.0, 10, proprietary='PBCP') is order
+    assert order.proprietary == 'PBCP' and order.state == NEW
+
+
+def test_active_filters_by_symbol_and_session():
+    manager = OrderManager()
+    ours = manager.sent('C1', 'DLR/DIC20', 'BUY', 70.0, 10)
+    manager.cancel_sent('C1', 'C2')
+    other_symbol = manager.sent('C3', 'DLR/ENE21', 'BUY', 70.0, 10)
+    earlier = manager.on_order_report(_report('X1', NEW, order_id='O9'))
+    done = manager.sent('C4', 'DLR/DIC20', 'BUY', 70.0, 10)
+    manager.on_order_report(_report('C4', REJECTED, order_id='O4'))
+
+    assert done.state == REJECTED
+    assert sorted(manager.active(), key=id) == sorted([ours, other_symbol, earlier], key=id)
+    assert set(map(id, manager.active('DLR/DIC20'))) == {id(ours), id(earlier)}
+    assert set(map(id, manager.active(session_only=True))) == {id(ours), id(other_symbol)}
+
+
+def test_wait_returns_once_a_report_satisfies_the_predicate():
+    manager = OrderManager()
+    order = manager.sent('C1', 'DLR/DIC20', 'BUY', 70.0, 10)
+
+    assert not manager.wait(order, lambda o: o.state == FILLED, timeout=0.01)
+
+    timer = threading.Timer(0.05, manager.on_order_report, (_report('C1', FILLED, cum_qty=10, leaves_qty=0),))
+    timer.start()
+    try:
+        assert manager.wait(order, lambda o: o.state == FILLED, timeout=5)
+    finally:
+        timer.join()
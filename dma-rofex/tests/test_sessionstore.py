@@ -0,0 +1,109 @@
+"""
+SessionStore journal and the ResendRequest answers built from it (FIXEngine.on_resend_request).
+"""
+
+import simplefix
+
+from fixengine import FIXEngine
+from fixsession import FIXSession
+from sessionstore import SessionStore, frame_seq_type
+
+
+def _session():
+    return FIXSession(user='me', party_id='me', account='ACC', xchange_name='ROFX', sender_comp_id='me',
+                      username='me', password='secret')
+
+
+def _inbound(seq, msg_type, fields=()):
+    msg = simplefix.FixMessage()
+    msg.append_pair(8, 'FIXT.1.1')
+    msg.append_pair(35, msg_type)
+    msg.append_pair(34, seq)
+    for tag, value in fields:
+        msg.append_pair(tag, value)
+    return msg
+
+
+def _fields(frame):
+    parser = simplefix.FixParser()
+    parser.append_buffer(frame)
+    return parser.get_message()
+
+
+def _store_engine(tmp_path):
+    engine = FIXEngine(session=_session())
+    engine.stamp_on_send = True
+    engine.attach_store(SessionStore(str(tmp_path / 'session.store'), capacity=16))
+    return engine
+
+
+def _send(engine, msg):
+    frame = engine.stamp(msg)
+    engine.record_outbound(frame)
+    return frame
+
+
+def test_store_keeps_frames_and_checkpoints(tmp_path):
+    engine = _store_engine(tmp_path)
+    frames = [_send(engine, engine.logon()),
+              _send(engine, engine.place_order_msg('DLR/DIC20', 70.5, 1, '1', 10, 'ACC'))]
+
+    store = engine.store
+    assert [frame_seq_type(frame) for frame in frames] == [(1, b'A'), (2, b'D')]
+    assert store.get(1) == (frames[0], True)
+    assert store.get(2) == (frames[1], False)
+    assert store.get(3) is None
+    assert store.out_seq == 2
+    store.close()
+
+    # Restart: counters come back from the checkpoint.
+    restarted = FIXEngine(session=_session())
+    restarted.attach_store(SessionStore(str(tmp_path / 'session.store'), capacity=16))
+    assert restarted.session.seq_num == 2
+    restarted.store.close()
+
+
+def test_resend_request_gets_possdup_frames_and_gap_fills(tmp_path):
+    engine = _store_engine(tmp_path)
+    _send(engine, engine.logon())                                                           # 1 admin
+    order = _send(engine, engine.place_order_msg('DLR/DIC20', 70.5, 1, '1', 10, 'ACC'))   # 2
+    _send(engine, engine.msg_Heartbeat())                                                   # 3 admin
+    _send(engine, engine.msg_Heartbeat())                                                   # 4 admin
+    cancel = _send(engine, engine.cancel_order_msg('DLR/DIC20', 1, '1', 10, 11, 'ACC'))      # 5
+
+    replies = engine.on_resend_request(_inbound(9, b'2', [(7, 1), (16, 0)]))
+    messages = [_fields(bytes(reply)) for reply in replies]
+
+    assert [(m.get(35), m.get(34)) for m in messages] == [(b'4', b'1'), (b'D', b'2'), (b'4', b'3'), (b'F', b'5')]
+
+    gap_fills = [m for m in messages if m.get(35) == b'4']
+    assert [(m.get(123), m.get(36)) for m in gap_fills] == [(b'Y', b'2'), (b'Y', b'5')]
+
+    resent = messages[1]
+    assert resent.get(43) == b'Y'
+    assert resent.get(122) == _fields(order).get(52)
+    assert resent.get(11) == b'10'
+    assert messages[3].get(11) == _fields(cancel).get(11)
+    engine.store.close()
+
+
+def test_resend_request_beyond_the_store_is_gap_filled(tmp_path):
+    engine = _store_engine(tmp_path)
+    engine.session.seq_num = 40
+
+    replies = engine.on_resend_request(_inbound(9, b'2', [(7, 38), (16, 40)]))
+    messages = [_fields(bytes(reply)) for reply in replies]
+
+    assert [(m.get(35), m.get(34), m.get(36)) for m in messages] == [(b'4', b'38', b'41')]
+    engine.store.close()
+
+
+def test_ring_overwrites_the_oldest_frames(tmp_path):
+    store = SessionStore(str(tmp_path / 'ring.store'), capacity=4)
+    for seq in range(1, 7):
+        store.append(seq, b'8=FIXT.1.1\x019=5\x0134=%d\x01' % seq)
+
+    assert store.get(1) is None
+    assert store.get(2) is None
+    assert store.get(6) == (b'8=FIXT.1.1\x019=5\x0134=6\x01', False)
+    store.close()
@@ -0,0 +1,182 @@
+"""
+Simulator matching engine (SimBook / MatchingEngine) and a loopback FIX session against FIXSimulator.
+"""
+
+import asyncio
+
+from asyncfix import AsyncConnection
+from fixengine import FIXEngine
+from fixsession import FIXSession
+from simulator import BUY, MD_CHANGE, MD_DELETE, MD_NEW, SELL, FIXSimulator, MatchingEngine, SimBook, SimOrder
+
+SYMBOL = 'DLR/DIC20'
+
+
+def _order(order_id, side, price, qty, owner=None):
+    return SimOrder(str(order_id).encode(), order_id, owner, 'ACC', SYMBOL, side, price, qty)
+
+
+def test_resting_orders_aggregate_into_levels():
+    book = SimBook(SYMBOL)
+
+    assert book.add(_order(1, BUY, 70.0, 5)) == ([], [(MD_NEW, BUY, 70.0, 5)])
+    assert book.add(_order(2, BUY, 70.0, 3)) == ([], [(MD_CHANGE, BUY, 70.0, 8)])
+    book.add(_order(3, BUY, 69.5, 1))
+    book.add(_order(4, SELL, 71.0, 2))
+
+    assert book.levels() == ([(70.0, 8), (69.5, 1)], [(71.0, 2)])
+
+
+def test_match_in_price_time_priority():
+    book = SimBook(SYMBOL)
+    first, second, worse = _order(1, SELL, 71.0, 2), _order(2, SELL, 71.0, 2), _order(3, SELL, 71.5, 5)
+    for order in (first, second, worse):
+        book.add(order)
+
+    taker = _order(4, BUY, 71.5, 5)
+    trades, changes = book.add(taker)
+
+    assert [(resting.order_id, price, qty) for resting, price, qty in trades] == \
+        [(b'1', 71.0, 2), (b'2', 71.0, 2), (b'3', 71.5, 1)]
+    assert (MD_DELETE, SELL, 71.0, 0) in changes
+    assert (MD_CHANGE, SELL, 71.5, 4) in changes
+    assert taker.leaves == 0 and taker.cum_qty == 5
+    assert taker.avg_px == (71.0 * 4 + 71.5) / 5
+    assert book.levels() == ([], [(71.5, 4)])
+
+
+def test_unmatched_remainder_rests():
+    book = SimBook(SYMBOL)
+    book.add(_order(1, SELL, 71.0, 2))
+
+    trades, changes = book.add(_order(2, BUY, 71.0, 5))
+
+    assert [qty for _, _, qty in trades] == [2]
+    assert book.levels() == ([(71.0, 3)], [])
+    assert (MD_NEW, BUY, 71.0, 3) in changes
+
+
+def test_cancel_removes_order_and_level():
+    book = SimBook(SYMBOL)
+    order = _order(1, BUY, 70.0, 5)
+    book.add(order)
+
+    assert book.cancel(order) == [(MD_DELETE, BUY, 70.0, 0)]
+    assert book.cancel(order) == []
+    assert book.levels() == ([], [])
+
+
+def _engine():
+    engine = MatchingEngine([SYMBOL])
+    executions = []
+    engine.on_execution = lambda order, exec_type, last_px, last_qty, text: executions.append(
+        (order.cl_ord_id, exec_type, order.ord_status, last_qty))
+    return engine, executions
+
+
+def test_engine_fills_both_sides_and_forgets_filled_orders():
+    engine, executions = _engine()
+    owner = object()
+
+    resting = engine.new_order(owner, b'1', 'ACC', SYMBOL, SELL, 71.0, 2)
+    engine.new_order(owner, b'2', 'ACC', SYMBOL, BUY, 71.0, 2)
+
+    assert executions == [(b'1', b'0', b'0', 0), (b'2', b'0', b'0', 0),
+                          (b'2', b'F', b'2', 2), (b'1', b'F', b'2', 2)]
+    assert resting.order_id not in engine.orders
+    assert engine.find(owner, b'1') is None
+
+
+def test_engine_rejects_unknown_symbol():
+    engine, executions = _engine()
+
+    assert engine.new_order(object(), b'1', 'ACC', 'NOPE', BUY, 1.0, 1) is None
+    assert executions == [(b'1', b'8', b'8', 0)]
+
+
+def test_replace_down_in_size_keeps_time_priority():
+    engine, _ = _engine()
+    owner = object()
+    first = engine.new_order(owner, b'1', 'ACC', SYMBOL, SELL, 71.0, 5)
+    engine.new_order(owner, b'2', 'ACC', SYMBOL, SELL, 71.0, 5)
+
+    engine.replace(first, b'3', 71.0, 2)
+    level = engine.books[SYMBOL].asks[71.0]
+
+    assert level[0] is first and first.leaves == 2
+    assert (first.cl_ord_id, first.orig_cl_ord_id) == (b'3', b'1')
+    assert engine.find(owner, b'3') is first
+
+
+def test_replace_to_crossing_price_matches():
+    engine, executions = _engine()
+    owner = object()
+    engine.new_order(owner, b'1', 'ACC', SYMBOL, SELL, 71.0, 2)
+    bid = engine.new_order(owner, b'2', 'ACC', SYMBOL, BUY, 70.0, 2)
+
+    engine.replace(bid, b'3', 71.0, 2)
+
+    assert (b'3', b'5', b'0', 0) in executions
+    assert (b'3', b'F', b'2', 2) in executions
+    assert engine.books[SYMBOL].levels() == ([], [])
+
+
+def test_replace_below_filled_quantity_cancels():
+    engine, executions = _engine()
+    owner = object()
+    engine.new_order(owner, b'1', 'ACC', SYMBOL, SELL, 71.0, 2)
+    bid = engine.new_order(owner, b'2', 'ACC', SYMBOL, BUY, 71.0, 5)
+
+    engine.replace(bid, b'3', 71.0, 2)
+
+    assert executions[-1] == (b'3', b'4', b'4', 0)
+    assert bid.order_id not in engine.orders
+
+
+def test_mass_cancel_only_cancels_the_owner_orders():
+    engine, _ = _engine()
+    ours, theirs = object(), object()
+    engine.new_order(ours, b'1', 'ACC', SYMBOL, BUY, 70.0, 1)
+    engine.new_order(ours, b'2', 'ACC', SYMBOL, SELL, 72.0, 1)
+    engine.new_order(theirs, b'1', 'ACC', SYMBOL, BUY, 69.0, 1)
+
+    assert engine.mass_cancel(ours) == 2
+    assert engine.books[SYMBOL].levels() == ([(69.0, 1)], [])
+
+
+def _session(name):
+    return FIXSession(user=name, party_id=name, account='ACC', xchange_name='ROFX', sender_comp_id=name,
+                      username=name, password='secret')
+
+
+def test_loopback_logon_and_order_round_trip():
+    async def run():
+        simulator = FIXSimulator(port=0, instruments=[(SYMBOL, 'FXXXSX', 0.5)])
+        await simulator.start()
+        buyer = AsyncConnection('127.0.0.1', simulator.port, engine=FIXEngine(session=_session('buyer')), ssl=False)
+        seller = AsyncConnection('127.0.0.1', simulator.port, engine=FIXEngine(session=_session('seller')),
+                                 ssl=False)
+        try:
+            for connection in (buyer, seller):
+                await connection.connect()
+                logon = await connection.logon(timeout=5)
+                assert logon.get(35) == b'A' and logon.get(56) == connection.FIX_engine.session.sender_comp_id.encode()
+
+            bid = await buyer.place_order(SYMBOL, 70.5, 3, '1', 'ACC', timeout=5)
+            assert (bid.exec_type, bid.ord_status, bid.leaves_qty) == ('0', '0', 3)
+
+            fill = buyer.expect(b'8', lambda msg: msg.get(150) == b'F')
+            ask = await seller.place_order(SYMBOL, 70.5, 2, '2', 'ACC', timeout=5)
+            assert ask.exec_type == '0'
+
+            fill = buyer.FIX_engine.decode_execution_report(await asyncio.wait_for(fill, 5))
+            assert (fill.ord_status, fill.last_qty, fill.last_px, fill.leaves_qty) == ('1', 2, 70.5, 1)
+
+            rejected = await buyer.place_order('NOPE', 1.0, 1, '1', 'ACC', timeout=5)
+            assert rejected.ord_status == '8'
+        finally:
+            await buyer.close(timeout=1)
+            await seller.close(timeout=1)
+            await simulator.close()
+
+    asyncio.run(run())
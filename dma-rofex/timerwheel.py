@@ -0,0 +1,111 @@
+"""
+Hashed timer wheel: many timers, one driver thread.
+
+CLASSES:
+Timer ------------------------------------- Handle of a scheduled callback.
+
+    METHODS:
+    cancel() ------------------------------ Prevent the callback from running.
+
+TimerWheel -------------------------------- Wheel of slots advanced every tick by a single thread.
+
+    FIELDS:
+    error --------------------------------- Last exception raised by a callback, None if none.
+    slots --------------------------------- Number of slots of the wheel.
+    tick ---------------------------------- Seconds per slot (timer resolution).
+
+    METHODS:
+    schedule() ---------------------------- Run callback(*args) after delay seconds, return Timer.
+    stop() -------------------------------- Stop the driver thread (pending timers are dropped).
+"""
+
+import math
+import threading
+import time
+
+
+class Timer(object):
+    __slots__ = ('expiry', 'callback', 'args', 'cancelled')
+
+    def __init__(self, expiry, callback, args):
+        self.expiry = expiry
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Prevent the callback from running (the timer is dropped when its slot comes up).
+        """
+        self.cancelled = True
+
+
+class TimerWheel(object):
+    """
+    Timer wheel of slots entries, advanced every tick seconds by one daemon thread.
+
+    A timer due at tick n lives in slot n % slots; timers further away than one
+    revolution stay in their slot until their tick comes up. Scheduling and
+    cancelling are O(1), and any number of timers (e.g. the heartbeat timers of
+    every session in the process) share the same thread. Callbacks run on that
+    thread, so they must be short (e.g. queue a message).
+    """
+
+    def __init__(self, tick=0.05, slots=512):
+        self.tick = tick
+        self.slots = slots
+        self.error = None
+
+        self._wheel = [[] for _ in range(slots)]
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._current = 0
+        self._running = True
+
+        self._thread = threading.Thread(target=self._run, name='TimerWheel', daemon=True)
+        self._thread.start()
+
+    def schedule(self, delay, callback, *args):
+        """
+        Run callback(*args) on the wheel thread after delay seconds (rounded up to a tick).
+        """
+        with self._lock:
+            expiry = self._current + max(1, int(math.ceil(delay / self.tick)))
+            timer = Timer(expiry, callback, args)
+            self._wheel[expiry % self.slots].append(timer)
+        return timer
+
+    def stop(self):
+        """
+        Stop the driver thread. Pending timers never run. Called from a callback (the wheel
+        thread itself) it only asks the thread to finish once the callback returns.
+        """
+        self._running = False
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while self._running:
+            due = self._start + (self._current + 1) * self.tick
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            # Catch up on every tick elapsed (e.g. after a long callback).
+            now_tick = int((time.monotonic() - self._start) / self.tick)
+            while self._current < now_tick and self._running:
+                with self._lock:
+                    self._current += 1
+                    current = self._current
+                    slot = self._wheel[current % self.slots]
+                    expired = [timer for timer in slot if timer.expiry <= current]
+                    if expired:
+                        slot[:] = [timer for timer in slot if timer.expiry > current]
+
+                for timer in expired:
+                    if timer.cancelled:
+                        continue
+                    try:
+                        timer.callback(*timer.args)
+                    except Exception as ex:
+                        self.error = ex
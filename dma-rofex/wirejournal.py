@@ -0,0 +1,213 @@
+"""
+Binary append-only journal of the raw FIX frames sent and received.
+
+File layout: 16 byte header (magic FIXWIRE1, 8 reserved bytes) followed by records
+<length uint32><timestamp int64 ns since epoch><direction 'I'/'O'><frame>. A zero length
+marks the end of the used part of a file.
+
+Run: python wirejournal.py FILE... [--direction I|O] [--msg-type 8 ...] [--symbol DODic20]
+                                   [--since 15:00:00] [--until 15:05:00] [--raw]
+
+CLASSES:
+WireJournal ------------------------------- Rotating memory-mapped journal written by a background thread.
+
+    FIELDS:
+    directory ----------------------------- Directory of the journal files.
+    file_size ----------------------------- Bytes per file before rotating.
+    path ---------------------------------- Current file.
+    records ------------------------------- Frames written.
+
+    METHODS:
+    close() ------------------------------- Write pending frames, truncate and close the current file.
+    record() ------------------------------ Queue a frame (hot path: one deque append).
+
+FUNCTIONS:
+read_journal() ---------------------------- Yield (timestamp ns, direction, frame) of a journal file.
+
+INBOUND / OUTBOUND ------------------------ Direction values.
+"""
+
+import argparse
+import datetime
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+INBOUND = b'I'
+OUTBOUND = b'O'
+
+_MAGIC = b'FIXWIRE1'
+_FILE_HEADER = struct.Struct('<8s8x')
+_RECORD = struct.Struct('<Iqc')
+
+
+def read_journal(path):
+    """
+    Yield (timestamp_ns, direction, frame) for every record of a journal file.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if data[:len(_MAGIC)] != _MAGIC:
+        raise ValueError('Not a FIX wire journal: ' + path)
+
+    pos = _FILE_HEADER.size
+    while pos + _RECORD.size <= len(data):
+        length, timestamp, direction = _RECORD.unpack_from(data, pos)
+        if not length:
+            break
+        start = pos + _RECORD.size
+        yield timestamp, direction, data[start:start + length]
+        pos = start + length
+
+
+class WireJournal(object):
+    """
+    Journal of raw frames with their wall clock time.
+
+    record() only appends (timestamp, direction, frame) to a deque; a background
+    thread copies queued records into a memory-mapped file every interval seconds.
+    Files are preallocated to file_size and rotated when full (the full file is
+    truncated to its used size), so nothing on the sending or reading thread formats,
+    allocates files or blocks on disk I/O.
+    """
+
+    def __init__(self, directory, prefix='wire', file_size=64 * 1024 * 1024, interval=0.005):
+        self.directory = directory
+        self.prefix = prefix
+        self.file_size = file_size
+        self.interval = interval
+        self.records = 0
+        self.path = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._pending = deque()
+        self._files = 0
+        self._file = None
+        self._map = None
+        self._pos = 0
+        self._open()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='WireJournal', daemon=True)
+        self._thread.start()
+
+    def record(self, direction, frame):
+        """
+        Queue frame (bytes) with the current time. direction is INBOUND or OUTBOUND.
+        """
+        self._pending.append((time.time_ns(), direction, frame))
+
+    def close(self):
+        """
+        Write every pending frame, truncate the current file to its used size and close it.
+        """
+        self._stop.set()
+        self._thread.join()
+        self._write_pending()
+        self._close_file()
+
+    def _open(self):
+        self._files += 1
+        name = '%s-%s-%04d.wj' % (self.prefix, time.strftime('%Y%m%d-%H%M%S'), self._files)
+        self.path = os.path.join(self.directory, name)
+
+        self._file = open(self.path, 'w+b')
+        self._file.truncate(self.file_size)
+        self._map = mmap.mmap(self._file.fileno(), self.file_size)
+        _FILE_HEADER.pack_into(self._map, 0, _MAGIC)
+        self._pos = _FILE_HEADER.size
+
+    def _close_file(self):
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(self._pos)
+        self._file.close()
+
+    def _write(self, timestamp, direction, frame):
+        size = _RECORD.size + len(frame)
+        if self._pos + size + _RECORD.size > self.file_size:
+            self._close_file()
+            if size + _RECORD.size + _FILE_HEADER.size > self.file_size:
+                self.file_size = size + _RECORD.size + _FILE_HEADER.size
+            self._open()
+
+        _RECORD.pack_into(self._map, self._pos, len(frame), timestamp, direction)
+        start = self._pos + _RECORD.size
+        self._map[start:start + len(frame)] = frame
+        self._pos = start + len(frame)
+        self.records += 1
+
+    def _write_pending(self):
+        pending = self._pending
+        while pending:
+            timestamp, direction, frame = pending.popleft()
+            self._write(timestamp, direction, bytes(frame))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._write_pending()
+
+
+def _pretty(frame):
+    return frame.replace(b'\x01', b'|').decode('cp1252')
+
+
+def _field(frame, tag):
+    key = b'\x01' + tag + b'='
+    start = frame.find(key)
+    if start < 0:
+        return None
+    start += len(key)
+    return frame[start:frame.find(b'\x01', start)]
+
+
+def _clock(value):
+    return datetime.datetime.strptime(value, '%H:%M:%S').time()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print / filter FIX wire journal files.')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--direction', choices=('I', 'O'), help='Only inbound (I) or outbound (O) frames')
+    parser.add_argument('--msg-type', nargs='*', help='Only these MsgTypes (35), e.g. 8 W X')
+    parser.add_argument('--symbol', help='Only frames with this Symbol (55)')
+    parser.add_argument('--since', type=_clock, help='Local time HH:MM:SS')
+    parser.add_argument('--until', type=_clock, help='Local time HH:MM:SS')
+    parser.add_argument('--raw', action='store_true', help='Write matching frames unchanged to stdout')
+    args = parser.parse_args()
+
+    direction = args.direction.encode('ASCII') if args.direction else None
+    msg_types = set(msg_type.encode('ASCII') for msg_type in args.msg_type) if args.msg_type else None
+    symbol = args.symbol.encode('cp1252') if args.symbol else None
+    out = os.fdopen(os.dup(1), 'wb') if args.raw else None
+
+    for path in args.files:
+        for timestamp, frame_direction, frame in read_journal(path):
+            moment = datetime.datetime.fromtimestamp(timestamp / 1e9)
+            if direction is not None and frame_direction != direction:
+                continue
+            if msg_types is not None and _field(frame, b'35') not in msg_types:
+                continue
+            if symbol is not None and _field(frame, b'55') != symbol:
+                continue
+            if args.since is not None and moment.time() < args.since:
+                continue
+            if args.until is not None and moment.time() > args.until:
+                continue
+
+            if out is not None:
+                out.write(frame)
+            else:
+                print('%s.%09d %s %s' % (moment.strftime('%Y-%m-%d %H:%M:%S'), timestamp % 1000000000,
+                                         '<-' if frame_direction == INBOUND else '->', _pretty(frame)))
+
+    if out is not None:
+        out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Websocket MarketData with book depth, and local books maintained from the pushes.
+
+pyRofex (0.3.0) market_data_subscription() always sends level 1 without depth, so the
+pushes only carry the best level. market_data_subscription() here sends the same
+"smd" message with a depth, through the websocket pyRofex already opened.
+
+CLASSES:
+BookKeeper -------------------------------- DepthBook per ticker, updated from websocket pushes, REST only to (re)sync.
+
+    FIELDS:
+    books --------------------------------- Ticker -> DepthBook.
+    depth --------------------------------- Levels kept / subscribed per side.
+    resyncs ------------------------------- REST snapshots taken because a book was crossed.
+    snapshots ----------------------------- REST snapshots taken (initial + resyncs).
+    stale --------------------------------- Pushes ignored because older than the book.
+
+    METHODS:
+    apply() ------------------------------- Apply a websocket MarketData message, return its DepthBook.
+    book() -------------------------------- Return DepthBook of a ticker (created empty).
+    snapshot() ---------------------------- Load a ticker book from a REST get_market_data call.
+
+FUNCTIONS:
+market_data_subscription() ---------------- Subscribe tickers to websocket MarketData with a book depth.
+
+MARKET_DATA_SUBSCRIPTION ------------------ "smd" message template with depth.
+"""
+
+import pyRofex
+from pyRofex.components import globals as rofex_globals
+from pyRofex.components import messages
+from pyRofex.components.exceptions import ApiException
+
+from depthbook import DepthBook
+
+MARKET_DATA_SUBSCRIPTION = '{{"type":"smd","level":1,"depth":{depth},"entries":[{entries}],"products":[{symbols}]}}'
+
+BOOK_ENTRIES = [pyRofex.MarketDataEntry.BIDS, pyRofex.MarketDataEntry.OFFERS]
+
+
+def market_data_subscription(tickers, entries, depth=10, market=pyRofex.Market.ROFEX, environment=None):
+    """
+    Send a MarketData subscription for tickers with depth levels per side through the
+    websocket opened by pyRofex.init_websocket_connection().
+    """
+    environment = environment or rofex_globals.default_environment
+    client = rofex_globals.environment_config[environment]['ws_client']
+    if client is None:
+        raise ApiException('Websocket connection not initialized.')
+
+    instruments = ','.join(messages.INSTRUMENT.format(ticker=ticker, market=market.value) for ticker in tickers)
+    entries = ','.join(messages.DOUBLE_QUOTES.format(item=entry.value) for entry in entries)
+    client.ws_connection.send(MARKET_DATA_SUBSCRIPTION.format(depth=depth, entries=entries, symbols=instruments))
+
+
+class BookKeeper(object):
+    """
+    Local books of the subscribed tickers.
+
+    Every push carries the full top depth levels of the sides it includes, so
+    apply() overwrites them in place: no HTTP call per update. Pushes older than the
+    last one applied are dropped. A REST snapshot is only taken for the initial book
+    (snapshot()) and to resync when the local book is inconsistent (crossed).
+    """
+
+    def __init__(self, depth=10, environment=None):
+        self.depth = depth
+        self.environment = environment
+        self.books = {}
+        self.snapshots = 0
+        self.resyncs = 0
+        self.stale = 0
+
+    def book(self, ticker):
+        book = self.books.get(ticker)
+        if book is None:
+            book = self.books[ticker] = DepthBook(ticker, self.depth)
+        return book
+
+    def snapshot(self, ticker):
+        """
+        Replace the book of ticker with a REST get_market_data snapshot. Return the DepthBook.
+        """
+        response = pyRofex.get_market_data(ticker, BOOK_ENTRIES, depth=self.depth, environment=self.environment)
+        book = self.book(ticker)
+        with book.lock:
+            book.clear()
+            book.update(response.get('marketData') or {})
+        self.snapshots += 1
+        return book
+
+    def apply(self, message):
+        """
+        Apply a websocket MarketData message to its ticker book. Return the DepthBook
+        (None if the message has no symbol).
+        """
+        ticker = message.get('instrumentId', {}).get('symbol')
+        if not ticker:
+            return None
+
+        book = self.book(ticker)
+        if not book.update(message.get('marketData') or {}, message.get('timestamp')):
+            self.stale += 1
+        elif book.crossed():
+            self.resyncs += 1
+            return self.snapshot(ticker)
+        return book